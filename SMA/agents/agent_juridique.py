@@ -1,16 +1,18 @@
 # agents/agent_juridique.py
 import os
-from langchain_openai import ChatOpenAI # CHANGEMENT ICI
-from langchain_core.messages import SystemMessage
 from outils.outils_droit import query_droit_immobilier
 from state import AgentState
+from services.history_compaction import with_history
+from services.llm_registry import model_with_tools
 
 def create_droit_agent(api_key: str):
     """Crée la logique de noeud et les outils de l'Agent Conseiller Juridique."""
     
-    llm = ChatOpenAI(model="gpt-4o", api_key=api_key, temperature=0.2) # CHANGEMENT ICI
     tools = [query_droit_immobilier] 
-    llm_with_tools = llm.bind_tools(tools)
+
+    def llm_with_tools():
+        # Relu dans le registre à chaque tour : jamais le client HTTP d'un processus parent
+        return model_with_tools("droit_agent", tools, model="gpt-4o", temperature=0.2, api_key=api_key)
 
     prompt = """Tu es "Maître Immo" ⚖️, le conseiller juridique de DomusIA - expert en droit immobilier marocain.
 
@@ -33,7 +35,7 @@ def create_droit_agent(api_key: str):
 """
 
     def droit_node(state: AgentState):
-        response = llm_with_tools.invoke([SystemMessage(content=prompt)] + state["messages"])
+        response = llm_with_tools().invoke(with_history(prompt, state))
         return {"messages": [response]}
     
     return droit_node, tools
\ No newline at end of file
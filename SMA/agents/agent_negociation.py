@@ -1,10 +1,11 @@
 # agents/agent_negociation.py
 import os
-from langchain_openai import ChatOpenAI # CHANGEMENT ICI
-from langchain_core.messages import SystemMessage, AIMessage
+from langchain_core.messages import AIMessage
 from outils.outils_negociation import get_property_negotiation_details
 from outils.outils_notification import notify_owner_of_deal
 from state import AgentState
+from services.history_compaction import with_history
+from services.llm_registry import model_with_tools
 
 def create_negotiation_agent(api_key: str):
     """
@@ -12,14 +13,11 @@ def create_negotiation_agent(api_key: str):
     Utilise GPT-4o.
     """
     
-    llm = ChatOpenAI(
-        model="gpt-4o", # CHANGEMENT ICI
-        api_key=api_key,
-        temperature=0.4
-    ) 
-    
     tools = [get_property_negotiation_details, notify_owner_of_deal]
-    llm_with_tools = llm.bind_tools(tools)
+
+    def llm_with_tools():
+        # Relu dans le registre à chaque tour : jamais le client HTTP d'un processus parent
+        return model_with_tools("negotiation_agent", tools, model="gpt-4o", temperature=0.4, api_key=api_key)
 
     prompt_template = """Tu es un négociateur immobilier expert représentant le PROPRIÉTAIRE (l'annonceur).
     
@@ -35,7 +33,6 @@ def create_negotiation_agent(api_key: str):
     """
     
     def negotiation_node(state: AgentState):
-        messages = state["messages"]
         active_id = state.get("active_property_id")
         
         context_instruction = ""
@@ -51,7 +48,7 @@ def create_negotiation_agent(api_key: str):
 
         full_prompt = prompt_template.format(context_instruction=context_instruction)
         
-        response = llm_with_tools.invoke([SystemMessage(content=full_prompt)] + messages)
+        response = llm_with_tools().invoke(with_history(full_prompt, state))
         
         return {"messages": [response]}
     
@@ -1,12 +1,12 @@
 # agents/agent_recherche.py
 import os
 import json
-from langchain_openai import ChatOpenAI # CHANGEMENT ICI
-from langchain_core.messages import SystemMessage
 # On importe les outils depuis le dossier outils/
 from outils.outils_immobilier import search_properties, get_property_statistics, get_property_details
 from outils.outils_alertes import create_property_alert, list_my_alerts, delete_my_alert
 from state import AgentState 
+from services.history_compaction import with_history
+from services.llm_registry import model_with_tools
 
 def create_search_agent(api_key: str):
     """
@@ -14,15 +14,12 @@ def create_search_agent(api_key: str):
     Utilise GPT-4o.
     """
     
-    llm = ChatOpenAI(
-        model="gpt-4o", # CHANGEMENT ICI
-        api_key=api_key,
-        temperature=0.3
-    )
-    
     tools = [search_properties, get_property_statistics, get_property_details, 
              create_property_alert, list_my_alerts, delete_my_alert]
-    llm_with_tools = llm.bind_tools(tools)
+
+    def llm_with_tools():
+        # Relu dans le registre à chaque tour : jamais le client HTTP d'un processus parent
+        return model_with_tools("search_agent", tools, model="gpt-4o", temperature=0.3, api_key=api_key)
     
     prompt = """Tu es "ImmoFinder" 🏠, l'expert recherche immobilière de DomusIA !
 
@@ -57,8 +54,7 @@ Voici ce que j'ai trouvé 🎉
 """
 
     def search_node(state: AgentState):
-        messages = state["messages"]
-        response = llm_with_tools.invoke([SystemMessage(content=prompt)] + messages)
+        response = llm_with_tools().invoke(with_history(prompt, state))
         
         last_results = state.get("last_search_results")
         
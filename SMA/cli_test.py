@@ -5,7 +5,7 @@ from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, AIMessage
 
 # Import du constructeur de graphe
-from superviseur_fluent import build_fluent_graph
+from superviseur_fluent import get_compiled_graph
 from state import AgentState
 
 # Chargement des variables d'environnement
@@ -15,7 +15,7 @@ def main():
     print("⏳ Chargement du graphe et des outils (RAG, MongoDB)...")
     
     try:
-        app = build_fluent_graph()
+        app = get_compiled_graph()
         print("✅ Système DomusIA initialisé avec succès !")
     except Exception as e:
         print(f"❌ Erreur critique lors du chargement : {e}")
@@ -27,7 +27,8 @@ def main():
         "next_agent": None,
         "active_property_id": None,
         "delegation_query": None,
-        "last_search_results": None
+        "last_search_results": None,
+        "history_summary": None
     }
 
     print("\n" + "="*50)
@@ -1,12 +1,12 @@
 # outils/outils_droit.py
 import chromadb
 from chromadb.utils import embedding_functions
-from langchain_openai import ChatOpenAI # CHANGEMENT ICI
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.tools import tool
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from services.llm_registry import chat_model
 
 load_dotenv()
 try:
@@ -39,9 +39,12 @@ class DroitImmoRAG:
             print(f"✅ Collection ChromaDB '{collection_name}' créée.")
             self.load_documents_from_folder(docs_folder)
         
-        # CHANGEMENT ICI : Modèle OpenAI pour la réponse
-        self.llm = ChatOpenAI(model="gpt-4o", api_key=OPENAI_API_KEY, temperature=0.1)
         self.docs_folder = docs_folder
+
+    @property
+    def llm(self):
+        """Modèle OpenAI pour la réponse, relu dans le registre (recréé après un fork)."""
+        return chat_model("gpt-4o", temperature=0.1, api_key=OPENAI_API_KEY)
         
     def _read_pdf(self, pdf_path):
         try:
@@ -1,77 +1,38 @@
 from langchain_core.tools import tool
-from pymongo import MongoClient
 import json
-from dotenv import load_dotenv
-import os
-import re
 
-load_dotenv()
+from services.listing_query import build_listing_query, ensure_listing_indexes, normalize_transaction, split_location
+from services.mongo_pool import get_collection, get_listings_collection
+from db.listing_stats import CUBE_COLLECTION, get_stats_cube, market_stats
+from db.normalize import detect_property_kind, slugify
 
-# Configuration Robuste
-MONGO_USER = os.getenv("MONGO_USER")
-MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
-MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
-MONGO_PORT = os.getenv("MONGO_PORT", "27017")
-MONGO_DB = os.getenv("MONGO_DB", "listings")
-MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "listings")
+# Champs renvoyés par search_properties (pas de description ni de champs volumineux)
+SEARCH_PROJECTION = {
+    "title": 1, "price_mad": 1, "surface_m2": 1, "rooms_n": 1, "adresse": 1, "location": 1,
+    "url": 1, "images": 1, "image": 1, "photos": 1, "transaction_type": 1,
+}
 
-if MONGO_USER and MONGO_PASSWORD:
-    MONGODB_URI = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
-else:
-    MONGODB_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
 
-def clean_price(price_value):
-    """Extrait un nombre flottant propre depuis '8000 DH'."""
-    if isinstance(price_value, (int, float)):
-        return float(price_value)
-    if not price_value:
-        return 0.0
-    str_val = str(price_value)
-    match = re.search(r"([0-9\s\.,]+)", str_val)
-    if match:
-        clean_str = match.group(1).replace(" ", "").replace("\u00a0", "").replace(",", ".")
-        try:
-            return float(clean_str)
-        except:
-            return 0.0
-    return 0.0
-
-def clean_int(value):
-    """Extrait un entier propre (ex: '3 ch' -> 3)."""
-    if isinstance(value, int):
-        return value
-    if isinstance(value, float):
-        return int(value)
-    if not value:
-        return 0
-    
-    str_val = str(value)
-    match = re.search(r"(\d+)", str_val)
-    if match:
-        try:
-            return int(match.group(1))
-        except:
-            return 0
-    return 0
+def _stats_cube():
+    """Cube de statistiques en mémoire (rechargé après chaque import)."""
+    return get_stats_cube(get_collection(CUBE_COLLECTION))
 
 
-def detect_transaction_type(text: str) -> str:
-    """Détecte si c'est une location ou un achat depuis le texte."""
-    text_lower = text.lower() if text else ""
-    
-    # Mots clés pour location
-    rent_keywords = ["louer", "location", "à louer", "loue", "mensuel", "/mois", "dh/mois", "mad/mois"]
-    # Mots clés pour achat
-    buy_keywords = ["acheter", "achat", "vente", "à vendre", "vends"]
-    
-    for kw in rent_keywords:
-        if kw in text_lower:
-            return "location"
-    for kw in buy_keywords:
-        if kw in text_lower:
-            return "vente"
-    
-    return None  # Non déterminé
+def _budget_suggestion(property_type, transaction_type, location, max_price) -> str:
+    """Hausse de budget chiffrée d'après le prix médian du marché pour ces critères."""
+    city, rest = split_location(location) if location else (None, "")
+    market = _stats_cube().lookup(
+        city=city,
+        district=slugify(rest) or None,
+        kind=detect_property_kind(property_type),
+        transaction=normalize_transaction(transaction_type),
+    )
+    median = market.get("median") if market else None
+    if median and median > max_price:
+        increase = round((median / max_price - 1) * 100)
+        return (f"Le prix médian pour ces critères est de {_format_mad(median)} "
+                f"({market['count']} annonces) : augmente ton budget d'environ {increase}%")
+    return "Augmente ton budget de 20-30%"
 
 
 @tool
@@ -103,89 +64,30 @@ def search_properties(
     Returns:
         JSON avec les biens trouvés incluant titre, prix, surface, chambres, images
     """
-    client = None
     try:
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        db = client[MONGO_DB]
-        collection = db[MONGO_COLLECTION]
-        
-        # 1. Construction de la requête MongoDB
-        query = {}
-        
-        # Type de bien
-        if property_type:
-            query["$or"] = [
-                {"property_type": {"$regex": property_type, "$options": "i"}},
-                {"title": {"$regex": property_type, "$options": "i"}}
-            ]
-        
-        # Transaction (location/vente)
-        if transaction_type:
-            if transaction_type.lower() in ["location", "louer", "rent"]:
-                query["$or"] = query.get("$or", []) + [
-                    {"title": {"$regex": "louer|location", "$options": "i"}},
-                    {"url": {"$regex": "louer|location", "$options": "i"}}
-                ]
-            elif transaction_type.lower() in ["vente", "acheter", "achat", "buy"]:
-                query["$or"] = query.get("$or", []) + [
-                    {"title": {"$regex": "vendre|vente|acheter", "$options": "i"}},
-                    {"url": {"$regex": "vendre|vente", "$options": "i"}}
-                ]
-        
-        # Localisation
-        if location:
-            loc_query = {"$regex": location, "$options": "i"}
-            if "$or" in query:
-                query["$and"] = [
-                    {"$or": query.pop("$or")},
-                    {"$or": [
-                        {"location": loc_query},
-                        {"adresse": loc_query},
-                        {"title": loc_query}
-                    ]}
-                ]
-            else:
-                query["$or"] = [
-                    {"location": loc_query},
-                    {"adresse": loc_query},
-                    {"title": loc_query}
-                ]
-        
-        # Standing/Luxe
-        if standing:
-            standing_patterns = {
-                "luxe": "luxe|prestige|haut.standing|premium",
-                "haut": "haut.standing|standing|moderne",
-                "moyen": "standard|classique",
-                "economique": "économique|pas.cher|bon.prix"
-            }
-            pattern = standing_patterns.get(standing.lower(), standing)
-            # Ajouter au $or ou $and existant
-            
-        # Récupération (plus de résultats pour filtrer en Python)
-        cursor = collection.find(query).limit(limit * 10)
+        collection = get_listings_collection()  # Client partagé : pas de connexion à ouvrir
         
+        ensure_listing_indexes(collection)
+
+        # 1. Requête sur les champs normalisés (index composé ville/transaction/type/prix)
+        query = build_listing_query(
+            property_type=property_type,
+            transaction_type=transaction_type,
+            min_price=min_price,
+            max_price=max_price,
+            location=location,
+            min_surface=min_surface,
+            bedrooms=bedrooms,
+            standing=standing,
+        )
+
+        # 2. Tous les filtres sont évalués par MongoDB : `limit` documents suffisent
+        cursor = collection.find(query, SEARCH_PROJECTION).limit(limit)
+
         results = []
         for doc in cursor:
-            # --- Filtrage Python Robuste ---
-            
-            # 1. PRIX
-            raw_price = doc.get("price", doc.get("prix", 0))
-            real_price = clean_price(raw_price)
-            if min_price is not None and real_price < min_price: continue
-            if max_price is not None and real_price > max_price: continue
-                
-            # 2. SURFACE
-            raw_surface = doc.get("surface", 0)
-            real_surface = clean_price(raw_surface)
-            if min_surface is not None and real_surface < min_surface: continue
-
-            # 3. CHAMBRES
-            if bedrooms is not None:
-                raw_rooms = doc.get("rooms", doc.get("chambres", 0))
-                real_rooms = clean_int(raw_rooms)
-                if real_rooms < bedrooms: 
-                    continue
+            real_price = doc.get("price_mad") or 0
+            real_surface = doc.get("surface_m2") or 0
 
             # Préparation du résultat
             property_result = {
@@ -194,8 +96,8 @@ def search_properties(
                 "prix": f"{int(real_price):,} MAD".replace(",", " ") if real_price > 0 else "Prix sur demande",
                 "prix_numeric": real_price,
                 "surface": f"{int(real_surface)} m²" if real_surface > 0 else None,
-                "chambres": clean_int(doc.get("rooms", doc.get("chambres", 0))),
-                "adresse": doc.get("adresse", doc.get("location", "")),
+                "chambres": doc.get("rooms_n") or 0,
+                "adresse": doc.get("adresse") or doc.get("location", ""),
                 "url": doc.get("url", ""),
             }
             
@@ -207,22 +109,18 @@ def search_properties(
                 # Prendre les 3 premières images
                 property_result["images"] = images[:3]
             
-            # Type de transaction détecté
-            detected_type = detect_transaction_type(doc.get("title", "") + " " + doc.get("url", ""))
-            if detected_type:
-                property_result["type_transaction"] = detected_type
+            # Type de transaction (calculé à l'import)
+            if doc.get("transaction_type"):
+                property_result["type_transaction"] = doc["transaction_type"]
             
             results.append(property_result)
-            
-            if len(results) >= limit:
-                break
         
         if not results:
             suggestions = []
             if location:
                 suggestions.append(f"Essaie d'élargir à d'autres quartiers de {location}")
             if max_price:
-                suggestions.append(f"Augmente ton budget de 20-30%")
+                suggestions.append(_budget_suggestion(property_type, transaction_type, location, max_price))
             suggestions.append("Enlève certains critères pour voir plus de biens")
             
             # Préparer les critères pour une alerte (sera utilisé par l'agent)
@@ -252,8 +150,6 @@ def search_properties(
         
     except Exception as e:
         return json.dumps({"error": str(e), "message": "Erreur lors de la recherche"})
-    finally:
-        if client: client.close()
 
 
 @tool
@@ -269,10 +165,8 @@ def get_property_details(property_id: str) -> str:
         Toutes les informations détaillées du bien
     """
     from bson import ObjectId
-    client = None
     try:
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        collection = client[MONGO_DB][MONGO_COLLECTION]
+        collection = get_listings_collection()
         
         doc = collection.find_one({"_id": ObjectId(property_id)})
         
@@ -303,8 +197,10 @@ def get_property_details(property_id: str) -> str:
         
     except Exception as e:
         return json.dumps({"error": str(e)})
-    finally:
-        if client: client.close()
+
+
+def _format_mad(value) -> str:
+    return f"{int(value):,} MAD".replace(",", " ") if value else "N/A"
 
 
 @tool
@@ -316,39 +212,49 @@ def get_property_statistics(location: str = None) -> str:
         location: Ville ou quartier (optionnel)
     
     Returns:
-        Nombre de biens, fourchettes de prix, types disponibles
+        Nombre de biens, fourchettes de prix (min, max, moyenne, médiane, percentiles),
+        répartition par transaction (location / vente) et par type de bien
     """
-    client = None
     try:
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        collection = client[MONGO_DB][MONGO_COLLECTION]
-        
-        query = {}
-        if location:
-            query["$or"] = [
-                {"location": {"$regex": location, "$options": "i"}},
-                {"adresse": {"$regex": location, "$options": "i"}},
-                {"title": {"$regex": location, "$options": "i"}}
-            ]
-        
-        total = collection.count_documents(query)
-        
-        # Échantillon pour statistiques
-        sample = list(collection.find(query).limit(100))
-        
-        prices = [clean_price(d.get("price", 0)) for d in sample if clean_price(d.get("price", 0)) > 0]
-        
-        stats = {
+        stats = None
+
+        # Ville, ville + quartier ou tout le Maroc : lecture du cube en mémoire
+        city, rest = split_location(location) if location else (None, "")
+        if city or not rest:
+            stats = _stats_cube().summary(city=city, district=slugify(rest) or None)
+        # Texte libre ou cube pas encore calculé : agrégation à la volée
+        if stats is None:
+            stats = market_stats(get_listings_collection(), build_listing_query(location=location)) or {"count": 0}
+
+        result = {
             "location": location or "Tout le Maroc",
-            "total_biens": total,
-            "prix_min": f"{int(min(prices)):,} MAD".replace(",", " ") if prices else "N/A",
-            "prix_max": f"{int(max(prices)):,} MAD".replace(",", " ") if prices else "N/A",
-            "prix_moyen": f"{int(sum(prices)/len(prices)):,} MAD".replace(",", " ") if prices else "N/A"
+            "total_biens": stats.get("count", 0),
+            "biens_avec_prix": stats.get("priced", 0),
+            "prix_min": _format_mad(stats.get("min")),
+            "prix_max": _format_mad(stats.get("max")),
+            "prix_moyen": _format_mad(stats.get("mean")),
+            "prix_median": _format_mad(stats.get("median")),
+            "prix_m2_moyen": _format_mad(stats.get("price_per_m2")),
         }
-        
-        return json.dumps(stats, ensure_ascii=False, indent=2)
+        if stats.get("price_per_m2_median"):
+            result["prix_m2_median"] = _format_mad(stats["price_per_m2_median"])
+        if stats.get("percentiles"):
+            result["percentiles"] = {name: _format_mad(value) for name, value in stats["percentiles"].items()}
+        # Loyers et prix de vente n'ont pas la même échelle : détail par transaction et par type
+        for key, label in (("by_transaction", "par_transaction"), ("by_property_kind", "par_type")):
+            if stats.get(key):
+                result[label] = {
+                    name: {
+                        "biens": group["count"],
+                        "prix_median": _format_mad(group.get("median")),
+                        "prix_moyen": _format_mad(group.get("mean")),
+                        "prix_min": _format_mad(group.get("min")),
+                        "prix_max": _format_mad(group.get("max")),
+                    }
+                    for name, group in stats[key].items()
+                }
+
+        return json.dumps(result, ensure_ascii=False, indent=2)
         
     except Exception as e:
         return json.dumps({"error": str(e)})
-    finally:
-        if client: client.close()
@@ -1,30 +1,12 @@
 # outils/outils_negociation.py
 from langchain_core.tools import tool
-from pymongo import MongoClient
 from bson import ObjectId
 import json
-import os
 import re
-from dotenv import load_dotenv
 
-load_dotenv()
+from services.mongo_pool import get_collection, get_listings_collection
+from db.listing_stats import CUBE_COLLECTION, get_stats_cube, rooms_bucket
 
-# --- Configuration MongoDB ---
-MONGO_USER = os.getenv("MONGO_USER")
-MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
-MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
-MONGO_PORT = os.getenv("MONGO_PORT", "27017") 
-MONGO_DB = os.getenv("MONGO_DB", "listings")
-MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "listings")
-
-# Construction de l'URI
-if MONGO_USER and MONGO_PASSWORD:
-    MONGODB_URI = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
-else:
-    MONGODB_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
-
-DB_NAME = MONGO_DB
-COLLECTION_NAME = MONGO_COLLECTION
 
 def clean_price(price_value):
     """
@@ -53,11 +35,8 @@ def get_property_negotiation_details(property_id: str) -> str:
     Récupère les détails d'un bien spécifique par son ID pour la négociation.
     Retourne le prix affiché et calcule le prix minimum (marge) accepté.
     """
-    client = None
     try:
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
+        collection = get_listings_collection()  # Client partagé : pas de connexion à ouvrir
         
         clean_id = str(property_id).strip()
         prop = None
@@ -80,7 +59,7 @@ def get_property_negotiation_details(property_id: str) -> str:
 
         # --- LOGIQUE DE MARGE & PRIX ---
         raw_price = prop.get('price', 0)
-        listing_price = clean_price(raw_price)
+        listing_price = prop.get('price_mad') or clean_price(raw_price)
         
         location = str(prop.get('location', '')).lower()
         prop_type = str(prop.get('property_type', '')).lower()
@@ -91,7 +70,35 @@ def get_property_negotiation_details(property_id: str) -> str:
             margin_percent = 0.05 
         elif "villa" in prop_type:
             margin_percent = 0.10 
-            
+
+        # Comparaison au marché local (cube de statistiques en mémoire, recalculé après chaque import)
+        market = get_stats_cube(get_collection(CUBE_COLLECTION)).lookup(
+            city=prop.get('city_slug'),
+            district=prop.get('district_slug'),
+            kind=prop.get('property_kind'),
+            transaction=prop.get('transaction_type'),
+            rooms=rooms_bucket(prop.get('rooms_n')),
+        )
+        market_context = None
+        percentiles = (market or {}).get('percentiles') or {}
+        if listing_price and percentiles.get('p25') and percentiles.get('p75'):
+            if listing_price > percentiles['p75']:
+                position = "au-dessus du marché"
+                margin_percent += 0.03  # Bien surévalué : plus de marge pour négocier
+            elif listing_price < percentiles['p25']:
+                position = "en dessous du marché"
+                margin_percent = max(0.02, margin_percent - 0.03)  # Déjà une bonne affaire
+            else:
+                position = "dans la moyenne du marché"
+            market_context = {
+                "comparables": market['count'],
+                "criteres": market['dimensions'],
+                "prix_median": market.get('median'),
+                "fourchette_p25_p75": [percentiles['p25'], percentiles['p75']],
+                "prix_m2_median": market.get('price_per_m2_median'),
+                "position": position,
+            }
+
         min_price = listing_price * (1 - margin_percent)
         
         # Gestion des extras
@@ -108,6 +115,7 @@ def get_property_negotiation_details(property_id: str) -> str:
             "listing_price": listing_price,
             "currency": "DH",
             "floor_price": int(min_price), 
+            "market": market_context,
             "features": {
                 "surface": prop.get('surface', 'N/A'),
                 "rooms": prop.get('rooms', 'N/A'),
@@ -119,12 +127,13 @@ def get_property_negotiation_details(property_id: str) -> str:
                 f"Si le client propose moins, refuse en mettant en avant les atouts : {', '.join(extras)}."
             )
         }
+        if market_context:
+            context["negotiation_strategy"] += (
+                f" Le bien est {market_context['position']} "
+                f"(médiane de {market_context['prix_median']} DH sur {market_context['comparables']} biens comparables)."
+            )
         
         return json.dumps(context, ensure_ascii=False, indent=2)
         
     except Exception as e:
-        return json.dumps({"error": f"Erreur système : {str(e)}"})
-        
-    finally:
-        if client:
-            client.close()
\ No newline at end of file
+        return json.dumps({"error": f"Erreur système : {str(e)}"})
\ No newline at end of file
@@ -1 +1,6 @@
 # services/__init__.py
+import os
+import sys
+
+# Racine du projet : modules db/ et scraping/ partagés avec l'import des annonces
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
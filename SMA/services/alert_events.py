@@ -0,0 +1,119 @@
+# services/alert_events.py - Déclenchement des alertes par les événements d'import
+"""
+Consommateur des événements « annonces modifiées » (db/listing_events.py) :
+
+- un thread lit la collection d'événements avec un curseur tailable qui attend les nouveaux
+  documents côté serveur : aucune requête sur les annonces ni les alertes tant que rien n'est importé ;
+- chaque événement déclenche la comparaison de ses seules annonces aux alertes actives,
+  puis les notifications sont transmises à `on_notifications` (envoi WhatsApp) ;
+- la position (dernier _id d'événement traité) est enregistrée : après un redémarrage, la lecture
+  reprend là où elle s'était arrêtée. Si la position est perdue (premier démarrage, événements
+  écrasés dans la collection plafonnée), une vérification complète rattrape le retard ;
+- un seul consommateur actif pour tous les workers : chaque processus en démarre un, mais seul
+  le détenteur du bail (document de position, renouvelé à chaque événement et à chaque attente)
+  lit les événements ; si son processus s'arrête, un autre reprend le bail à son expiration.
+"""
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List
+
+from pymongo import CursorType
+from pymongo.errors import PyMongoError
+
+from db.listing_events import LISTINGS_CHANGED, get_events_collection
+from services.alert_service import notify_changed_listings, poll_new_properties
+from services.leases import MongoLease
+from services.mongo_pool import get_listings_collection
+
+logger = logging.getLogger(__name__)
+
+CURSORS_COLLECTION = "alert_event_cursors"
+AWAIT_MS = int(os.getenv("ALERT_EVENTS_AWAIT_MS", 10000))  # Attente côté serveur d'un nouvel événement
+RETRY_SECONDS = float(os.getenv("ALERT_EVENTS_RETRY_SECONDS", 5))
+LEASE_SECONDS = float(os.getenv("ALERT_EVENTS_LEASE_SECONDS", 60))  # > AWAIT_MS + durée d'un événement
+
+NotificationHandler = Callable[[List[Dict[str, Any]]], None]
+
+
+class AlertEventConsumer(threading.Thread):
+    """Thread qui transforme les événements d'import en notifications d'alertes."""
+
+    def __init__(self, on_notifications: NotificationHandler, name: str = "alerts"):
+        super().__init__(name=f"alert-events-{name}", daemon=True)
+        self.on_notifications = on_notifications
+        self.consumer_name = name
+        # Bail porté par le document de position : position et bail écrits ensemble
+        self.lease = MongoLease(name, LEASE_SECONDS, collection_name=CURSORS_COLLECTION)
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    # --- Position de lecture (document du bail) ---
+
+    def _load_position(self):
+        doc = self.lease.collection.find_one({"_id": self.consumer_name})
+        return doc.get("last_event_id") if doc else None
+
+    def _save_position(self, event_id) -> bool:
+        """Enregistre la position et renouvelle le bail ; False si un autre processus l'a repris."""
+        renewed = self.lease.renew({"last_event_id": event_id} if event_id is not None else None)
+        if not renewed:
+            logger.warning("⚠️ Bail du consommateur d'alertes perdu : lecture arrêtée dans ce processus.")
+        return renewed
+
+    # --- Traitement ---
+
+    def _deliver(self, notifications: List[Dict[str, Any]]):
+        if not notifications:
+            return
+        try:
+            self.on_notifications(notifications)
+        except Exception as e:
+            logger.error(f"❌ Envoi des notifications d'alertes échoué : {e}")
+
+    def _catch_up(self, events):
+        """Position inconnue ou écrasée : vérification complète, puis lecture depuis le dernier événement."""
+        last_event = events.find_one(sort=[("$natural", -1)])
+        logger.info("🔁 Position des alertes inconnue : vérification complète des nouvelles annonces.")
+        self._deliver(poll_new_properties())
+        return last_event["_id"] if last_event else None
+
+    def _consume(self):
+        events = get_events_collection(get_listings_collection().database)
+        last_id = self._load_position()
+        oldest = events.find_one(sort=[("$natural", 1)])
+        if last_id is None or (oldest and last_id < oldest["_id"]):
+            last_id = self._catch_up(events)
+            if not self._save_position(last_id):
+                return
+
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        cursor = events.find(query, cursor_type=CursorType.TAILABLE_AWAIT).max_await_time_ms(AWAIT_MS)
+        try:
+            while cursor.alive and not self._stopped.is_set():
+                for event in cursor:
+                    if event.get("type") == LISTINGS_CHANGED:
+                        self._deliver(notify_changed_listings(urls=event.get("urls", ()), ids=event.get("ids", ())))
+                    if not self._save_position(event["_id"]) or self._stopped.is_set():
+                        return
+                # Pas de nouvel événement pendant AWAIT_MS : on garde le bail
+                if not self._save_position(None):
+                    return
+        finally:
+            cursor.close()
+
+    def run(self):
+        logger.info(f"🔔 Consommateur d'événements d'alertes démarré ({self.consumer_name}, {self.lease.owner}).")
+        while not self._stopped.is_set():
+            try:
+                if self.lease.acquire():
+                    logger.info(f"🔔 Bail des alertes obtenu par {self.lease.owner}.")
+                    self._consume()
+            except PyMongoError as e:
+                logger.warning(f"⚠️ Lecture des événements interrompue, reprise dans {RETRY_SECONDS} s : {e}")
+            except Exception as e:
+                logger.error(f"❌ Erreur du consommateur d'alertes : {e}")
+            self._stopped.wait(RETRY_SECONDS)
+        self.lease.release()
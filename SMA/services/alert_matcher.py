@@ -0,0 +1,155 @@
+# services/alert_matcher.py - Appariement des nouvelles annonces avec les alertes actives
+"""
+Index inversé des alertes, construit en mémoire à chaque vérification :
+
+- chaque alerte est rangée sous sa clé (ville, type de bien, transaction), None valant « tous » ;
+- dans chaque clé, les alertes sont triées par prix minimum.
+
+Une nouvelle annonce n'est comparée qu'aux alertes des 8 clés compatibles, et parmi elles
+seulement à celles dont le prix minimum est atteint (bisect). Le coût devient
+O(nouvelles annonces + correspondances) au lieu d'une requête regex par alerte.
+
+Les critères ont le même sens que dans search_properties (services/listing_query.py).
+"""
+import bisect
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Tuple
+
+from db.normalize import KIND_PATTERNS, SUB_KINDS, detect_property_kind, slugify
+from services.listing_query import STANDING_PATTERNS, normalize_transaction, split_location
+
+# Champs des annonces lus par le moteur (et renvoyés dans les notifications)
+ALERT_PROJECTION = {
+    "title": 1, "description": 1, "property_type": 1, "location": 1, "adresse": 1, "url": 1,
+    "price_mad": 1, "surface_m2": 1, "rooms_n": 1, "city_slug": 1, "property_kind": 1,
+    "transaction_type": 1, "scraped_at": 1,
+}
+
+MAX_PROPERTIES_PER_NOTIFICATION = 3
+
+
+def _words_regex(text: str) -> Pattern:
+    return re.compile(r"\s+".join(re.escape(word) for word in text.split()), re.IGNORECASE)
+
+
+@dataclass
+class CompiledAlert:
+    """Critères d'une alerte, traduits une fois pour toutes en tests sur les champs normalisés."""
+    alert: Dict[str, Any]
+    since: datetime
+    city: Optional[str] = None
+    kind: Optional[str] = None
+    transaction: Optional[str] = None
+    min_price: float = 0
+    max_price: Optional[float] = None
+    min_surface: Optional[float] = None
+    bedrooms: Optional[int] = None
+    text_filters: List[Tuple[Tuple[str, ...], Pattern]] = field(default_factory=list)
+    notified: set = field(default_factory=set)  # Annonces déjà envoyées pour cette alerte
+
+    @classmethod
+    def from_alert(cls, alert: Dict[str, Any], default_since: datetime) -> "CompiledAlert":
+        criteria = alert.get("criteria") or {}
+        compiled = cls(
+            alert=alert,
+            since=alert.get("last_property_check") or default_since,
+            notified=set(alert.get("notified_property_ids") or ()),
+        )
+
+        location = criteria.get("location")
+        if location:
+            compiled.city, rest = split_location(location)
+            if rest:
+                compiled.text_filters.append((("location", "adresse", "title"), _words_regex(rest)))
+
+        property_type = criteria.get("property_type")
+        if property_type:
+            compiled.kind = detect_property_kind(property_type)
+            if compiled.kind in SUB_KINDS:
+                # Studio rangé sous "studio" ou sous le type parent selon l'import : filtre sur le texte
+                compiled.text_filters.append((("property_type", "title"), KIND_PATTERNS[compiled.kind]))
+                compiled.kind = None
+            elif not compiled.kind:
+                compiled.text_filters.append((("property_type", "title"), _words_regex(property_type)))
+
+        compiled.transaction = normalize_transaction(criteria.get("transaction_type"))
+        compiled.min_price = criteria.get("min_price") or 0
+        compiled.max_price = criteria.get("max_price")
+        compiled.min_surface = criteria.get("min_surface")
+        compiled.bedrooms = criteria.get("bedrooms")
+
+        standing = criteria.get("standing")
+        if standing:
+            pattern = STANDING_PATTERNS.get(slugify(standing).split("_")[0], re.escape(standing))
+            compiled.text_filters.append((("title", "description"), re.compile(pattern, re.IGNORECASE)))
+        return compiled
+
+    @property
+    def key(self) -> tuple:
+        return self.city, self.kind, self.transaction
+
+    def accepts(self, listing: Dict[str, Any]) -> bool:
+        """Critères restants (la clé et le prix minimum sont déjà garantis par l'index)."""
+        scraped_at = listing.get("scraped_at")
+        if scraped_at is not None and scraped_at.replace(tzinfo=None) <= self.since.replace(tzinfo=None):
+            return False  # Déjà vue lors d'une vérification précédente de cette alerte
+        if str(listing.get("_id")) in self.notified:
+            return False
+        price = listing.get("price_mad")
+        if (self.min_price or self.max_price is not None) and not price:
+            return False  # Prix sur demande : ne correspond à aucun budget
+        if self.max_price is not None and price > self.max_price:
+            return False
+        if self.min_surface and (listing.get("surface_m2") or 0) < self.min_surface:
+            return False
+        if self.bedrooms and (listing.get("rooms_n") or 0) < self.bedrooms:
+            return False
+        for fields, regex in self.text_filters:
+            if not any(regex.search(str(listing.get(name) or "")) for name in fields):
+                return False
+        return True
+
+
+class AlertIndex:
+    """Alertes actives indexées par (ville, type, transaction) puis par prix minimum."""
+
+    def __init__(self, alerts: Iterable[Dict[str, Any]], default_since: datetime):
+        buckets = defaultdict(list)
+        self.alerts: List[CompiledAlert] = []
+        for alert in alerts:
+            compiled = CompiledAlert.from_alert(alert, default_since)
+            self.alerts.append(compiled)
+            buckets[compiled.key].append(compiled)
+        self._buckets = {}
+        for key, compiled_alerts in buckets.items():
+            compiled_alerts.sort(key=lambda compiled: compiled.min_price)
+            self._buckets[key] = ([compiled.min_price for compiled in compiled_alerts], compiled_alerts)
+
+    @property
+    def since(self) -> Optional[datetime]:
+        """Date de la plus ancienne vérification : les annonces plus récentes sont à examiner."""
+        return min((compiled.since for compiled in self.alerts), default=None)
+
+    def candidates(self, listing: Dict[str, Any]) -> Iterable[CompiledAlert]:
+        price = listing.get("price_mad") or 0
+        for city in {listing.get("city_slug"), None}:
+            for kind in {listing.get("property_kind"), None}:
+                for transaction in {listing.get("transaction_type"), None}:
+                    bucket = self._buckets.get((city, kind, transaction))
+                    if bucket:
+                        min_prices, compiled_alerts = bucket
+                        yield from compiled_alerts[:bisect.bisect_right(min_prices, price)]
+
+    def match(self, listings: Iterable[Dict[str, Any]],
+              limit: int = MAX_PROPERTIES_PER_NOTIFICATION) -> List[Tuple[CompiledAlert, List[dict]]]:
+        """Annonces correspondant à chaque alerte (au plus `limit` par alerte), dans l'ordre reçu."""
+        matches: Dict[int, List[dict]] = defaultdict(list)
+        for listing in listings:
+            for compiled in self.candidates(listing):
+                found = matches[id(compiled)]
+                if len(found) < limit and compiled.accepts(listing):
+                    found.append(listing)
+        return [(compiled, matches[id(compiled)]) for compiled in self.alerts if matches.get(id(compiled))]
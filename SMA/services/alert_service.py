@@ -7,51 +7,22 @@ Un job périodique vérifie les nouveaux biens et notifie les utilisateurs.
 
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
-from pymongo import MongoClient
 from bson import ObjectId
 import logging
-import os
 import json
-import re
-from dotenv import load_dotenv
 
-load_dotenv()
-logger = logging.getLogger(__name__)
+from pymongo import DESCENDING
 
-# Configuration MongoDB
-MONGO_USER = os.getenv("MONGO_USER")
-MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
-MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
-MONGO_PORT = os.getenv("MONGO_PORT", "27017")
-MONGO_DB = os.getenv("MONGO_DB", "listings")
+from services.alert_matcher import ALERT_PROJECTION, AlertIndex
+from services.listing_query import ensure_listing_indexes
+from services.mongo_pool import get_collection, get_listings_collection
 
-if MONGO_USER and MONGO_PASSWORD:
-    MONGODB_URI = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
-else:
-    MONGODB_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
+logger = logging.getLogger(__name__)
 
 
 def get_alerts_collection():
-    """Récupérer la collection des alertes"""
-    client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-    return client[MONGO_DB]["property_alerts"]
-
-
-def clean_price(price_value):
-    """Extrait un nombre flottant depuis une valeur de prix"""
-    if isinstance(price_value, (int, float)):
-        return float(price_value)
-    if not price_value:
-        return 0.0
-    str_val = str(price_value)
-    match = re.search(r"([0-9\s\.,]+)", str_val)
-    if match:
-        clean_str = match.group(1).replace(" ", "").replace("\u00a0", "").replace(",", ".")
-        try:
-            return float(clean_str)
-        except:
-            return 0.0
-    return 0.0
+    """Récupérer la collection des alertes (client MongoDB partagé)"""
+    return get_collection("property_alerts")
 
 
 async def create_alert(
@@ -143,98 +114,127 @@ async def delete_alert(alert_id: str, phone_number: str) -> bool:
         return False
 
 
-async def check_new_properties_for_alerts() -> List[Dict[str, Any]]:
+MAX_NOTIFICATIONS_PER_ALERT = 10
+NOTIFIED_IDS_KEPT = 50  # Annonces déjà envoyées mémorisées par alerte (pas de doublon)
+
+
+def _load_alert_index(checked_at: datetime) -> Optional[AlertIndex]:
+    """Index des alertes actives (None s'il n'y en a aucune)."""
+    active_alerts = list(get_alerts_collection().find({
+        "status": "active",
+        "notifications_sent": {"$lt": MAX_NOTIFICATIONS_PER_ALERT}  # Limite atteinte ?
+    }))
+    if not active_alerts:
+        return None
+    return AlertIndex(active_alerts, default_since=checked_at - timedelta(days=1))
+
+
+def _claim_properties(alerts_collection, alert_id, properties) -> List[dict]:
     """
-    Vérifier s'il y a de nouvelles propriétés qui matchent les alertes.
-    Retourne une liste de notifications à envoyer.
-    
-    À appeler périodiquement (toutes les heures par exemple).
+    Marque les annonces comme notifiées pour l'alerte, avant la mise en file du message.
+    Ajout conditionnel (équivalent d'un $addToSet borné) : une annonce déjà prise par un
+    autre processus n'est pas renvoyée.
     """
+    claimed = []
+    for prop in properties:
+        property_id = str(prop["_id"])
+        result = alerts_collection.update_one(
+            {"_id": alert_id, "notified_property_ids": {"$ne": property_id}},
+            {"$push": {"notified_property_ids": {"$each": [property_id], "$slice": -NOTIFIED_IDS_KEPT}}},
+        )
+        if result.modified_count:
+            claimed.append(prop)
+    return claimed
+
+
+def _notify_matches(index: AlertIndex, listings) -> List[Dict[str, Any]]:
+    """Compare les annonces aux alertes et enregistre les notifications envoyées."""
     notifications = []
+    alerts_collection = get_alerts_collection()
     
-    try:
-        alerts_collection = get_alerts_collection()
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        properties_collection = client[MONGO_DB]["listings"]
-        
-        # Récupérer toutes les alertes actives
-        active_alerts = list(alerts_collection.find({
-            "status": "active",
-            "notifications_sent": {"$lt": 10}  # Limite atteinte ?
-        }))
-        
-        for alert in active_alerts:
-            criteria = alert.get("criteria", {})
-            last_check = alert.get("last_property_check", datetime.utcnow() - timedelta(days=1))
-            
-            # Construire la requête MongoDB
-            query = {"scraped_at": {"$gt": last_check}}  # Seulement les nouveaux
-            
-            # Appliquer les critères
-            if criteria.get("property_type"):
-                query["$or"] = [
-                    {"property_type": {"$regex": criteria["property_type"], "$options": "i"}},
-                    {"title": {"$regex": criteria["property_type"], "$options": "i"}}
-                ]
-            
-            if criteria.get("location"):
-                loc_query = {"$regex": criteria["location"], "$options": "i"}
-                if "$or" in query:
-                    query["$and"] = [
-                        {"$or": query.pop("$or")},
-                        {"$or": [
-                            {"location": loc_query},
-                            {"adresse": loc_query},
-                            {"title": loc_query}
-                        ]}
-                    ]
-                else:
-                    query["$or"] = [
-                        {"location": loc_query},
-                        {"adresse": loc_query}
-                    ]
-            
-            # Chercher les nouvelles propriétés
-            new_properties = list(properties_collection.find(query).limit(5))
-            
-            # Filtrer par prix
-            matching_properties = []
-            for prop in new_properties:
-                price = clean_price(prop.get("price", 0))
-                
-                if criteria.get("min_price") and price < criteria["min_price"]:
-                    continue
-                if criteria.get("max_price") and price > criteria["max_price"]:
-                    continue
-                
-                matching_properties.append({
+    for compiled, properties in index.match(listings):
+        alert = compiled.alert
+        properties = _claim_properties(alerts_collection, alert["_id"], properties)
+        if not properties:
+            continue
+        alerts_collection.update_one({"_id": alert["_id"]}, {"$inc": {"notifications_sent": 1}})
+        notifications.append({
+            "phone_number": alert["phone_number"],
+            "user_name": alert.get("user_name", ""),
+            "alert_id": str(alert["_id"]),
+            "criteria": alert.get("criteria", {}),
+            "properties": [
+                {
                     "id": str(prop["_id"]),
                     "title": prop.get("title", "Bien immobilier"),
-                    "price": price,
+                    "price": prop.get("price_mad") or 0,
                     "location": prop.get("adresse", prop.get("location", "")),
                     "url": prop.get("url", "")
-                })
-            
-            if matching_properties:
-                notifications.append({
-                    "phone_number": alert["phone_number"],
-                    "user_name": alert.get("user_name", ""),
-                    "alert_id": str(alert["_id"]),
-                    "criteria": criteria,
-                    "properties": matching_properties[:3]  # Max 3 biens par notification
-                })
-                
-                # Mettre à jour l'alerte
-                alerts_collection.update_one(
-                    {"_id": alert["_id"]},
-                    {
-                        "$set": {"last_property_check": datetime.utcnow()},
-                        "$inc": {"notifications_sent": 1}
-                    }
-                )
-        
-        return notifications
-        
+                }
+                for prop in properties  # Max 3 biens par notification
+            ]
+        })
+    
+    return notifications
+
+
+def notify_changed_listings(urls: List[str] = (), ids: List[Any] = ()) -> List[Dict[str, Any]]:
+    """
+    Notifications pour des annonces qui viennent d'être importées ou soumises
+    (événements « annonces modifiées », voir services/alert_events.py).
+    """
+    index = _load_alert_index(datetime.utcnow())
+    if index is None or not (urls or ids):
+        return []
+    
+    query = {"$or": []}
+    if urls:
+        query["$or"].append({"url": {"$in": list(urls)}})
+    if ids:
+        query["$or"].append({"_id": {"$in": list(ids)}})
+    listings = get_listings_collection().find(query, ALERT_PROJECTION)
+    return _notify_matches(index, listings)
+
+
+def poll_new_properties() -> List[Dict[str, Any]]:
+    """
+    Vérification complète : annonces nouvelles ou modifiées depuis la plus ancienne
+    vérification des alertes. Sert au rattrapage quand les événements ont été perdus.
+    """
+    properties_collection = get_listings_collection()
+    ensure_listing_indexes(properties_collection)
+    
+    checked_at = datetime.utcnow()
+    index = _load_alert_index(checked_at)
+    if index is None:
+        return []
+    
+    # Un seul parcours des nouvelles annonces (index sur scraped_at), les plus récentes d'abord
+    new_properties = properties_collection.find(
+        {"scraped_at": {"$gt": index.since}}, ALERT_PROJECTION
+    ).sort("scraped_at", DESCENDING)
+    notifications = _notify_matches(index, new_properties)
+    
+    # Toutes les nouvelles annonces ont été examinées : la fenêtre repart de checked_at
+    get_alerts_collection().update_many(
+        {"_id": {"$in": [compiled.alert["_id"] for compiled in index.alerts]}},
+        {"$set": {"last_property_check": checked_at, "last_checked_at": checked_at}}
+    )
+    
+    logger.info(f"🔔 {len(notifications)} notification(s) pour {len(index.alerts)} alerte(s) actives.")
+    return notifications
+
+
+async def check_new_properties_for_alerts() -> List[Dict[str, Any]]:
+    """
+    Vérifier s'il y a de nouvelles propriétés qui matchent les alertes.
+    Retourne une liste de notifications à envoyer.
+    
+    Les alertes sont normalement déclenchées par les événements d'import
+    (services/alert_events.py) ; cette vérification complète reste disponible à la demande.
+    """
+    try:
+        return poll_new_properties()
     except Exception as e:
         logger.error(f"Erreur vérification alertes: {e}")
         return []
@@ -275,14 +275,38 @@ def format_notification_message(notification: Dict[str, Any]) -> str:
 """
     
     for prop in properties[:3]:
-        price_str = f"{int(prop['price']):,} MAD".replace(",", " ") if prop['price'] > 0 else "Prix sur demande"
-        message += f"""🏡 *{prop['title'][:50]}*
+        message += _format_property(prop)
+    
+    message += "\n💬 Réponds avec l'ID pour plus de détails !"
+    
+    return message
+
+
+def _format_property(prop: Dict[str, Any]) -> str:
+    price_str = f"{int(prop['price']):,} MAD".replace(",", " ") if prop['price'] > 0 else "Prix sur demande"
+    return f"""🏡 *{prop['title'][:50]}*
 📍 {prop['location'][:30]}
 💰 {price_str}
 🆔 `{prop['id']}`
 ---
 """
+
+
+def format_grouped_notifications(notifications: List[Dict[str, Any]]) -> str:
+    """Un seul message WhatsApp pour plusieurs alertes du même utilisateur"""
+    if len(notifications) == 1:
+        return format_notification_message(notifications[0])
     
-    message += "\n💬 Réponds avec l'ID pour plus de détails !"
+    user_name = notifications[0].get("user_name", "")
+    greeting = f"Hey {user_name} ! 👋\n\n" if user_name else "Hey ! 👋\n\n"
+    message = f"{greeting}🎉 *Bonne nouvelle !* De nouveaux biens correspondent à {len(notifications)} de tes recherches :\n\n"
+    
+    for notification in notifications:
+        message += f"🔍 *{format_alert_message(notification.get('criteria', {}))}*\n\n"
+        for prop in notification.get("properties", [])[:3]:
+            message += _format_property(prop)
+        message += "\n"
+    
+    message += "💬 Réponds avec l'ID pour plus de détails !"
     
     return message
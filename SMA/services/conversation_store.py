@@ -0,0 +1,296 @@
+# services/conversation_store.py - État des conversations WhatsApp (borné, persistant, partageable)
+"""
+Remplace le dictionnaire CHAT_HISTORY_STORE (illimité, perdu au redémarrage, propre à un worker) :
+
+- MemoryBackend : LRU + TTL en mémoire, pour un seul processus (défaut, développement) ;
+- MongoBackend : une conversation par document (expiration par index TTL), partagé par tous
+  les workers uvicorn derrière un répartiteur de charge ;
+- état sérialisé en msgpack (ormsgpack) ou JSON (orjson), messages LangChain compris ;
+- écriture différée (write-behind) vers MongoDB : la réponse part sans attendre l'écriture ;
+- verrou par utilisateur : local (threads) et bail MongoDB (workers), libéré seulement
+  après l'écriture de l'état, pour que le tour suivant lise toujours le dernier état ;
+  chaque prise du verrou a son propre jeton : une libération différée ne peut pas
+  supprimer le bail d'un tour suivant.
+
+Choix du backend : CONVERSATION_STORE=memory|mongo.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+import orjson
+import ormsgpack
+from bson import Binary
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from services.mongo_pool import get_collection
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_STORE", "memory")
+CONVERSATION_FORMAT = os.getenv("CONVERSATION_FORMAT", "msgpack")  # msgpack | json
+CONVERSATION_TTL_SECONDS = int(os.getenv("CONVERSATION_TTL_SECONDS", 7 * 24 * 3600))
+CONVERSATION_MAX_ENTRIES = int(os.getenv("CONVERSATION_MAX_ENTRIES", 5000))  # Backend mémoire
+CONVERSATIONS_COLLECTION = "conversations"
+CONVERSATION_LOCKS_COLLECTION = "conversation_locks"
+
+LOCK_LEASE_SECONDS = 300  # Durée maximale d'un tour (appels LLM compris)
+LOCK_WAIT_SECONDS = 120
+LOCK_STRIPES = 256
+
+
+# ==================== SÉRIALISATION ====================
+
+def serialize_state(state: Dict[str, Any], fmt: str = CONVERSATION_FORMAT) -> bytes:
+    """État -> octets ; le premier octet indique le format ('m' msgpack, 'j' JSON)."""
+    from langchain_core.messages import messages_to_dict
+
+    payload = {**state, "messages": messages_to_dict(list(state.get("messages") or []))}
+    if fmt == "json":
+        return b"j" + orjson.dumps(payload, default=str)
+    return b"m" + ormsgpack.packb(payload, default=str)
+
+
+def deserialize_state(data: bytes) -> Dict[str, Any]:
+    from langchain_core.messages import messages_from_dict
+
+    payload = orjson.loads(data[1:]) if data[:1] == b"j" else ormsgpack.unpackb(data[1:])
+    payload["messages"] = messages_from_dict(payload.get("messages") or [])
+    return payload
+
+
+# ==================== BACKENDS ====================
+
+class MemoryBackend:
+    """LRU + TTL en mémoire : au plus `max_entries` conversations, oubliées après `ttl_seconds`."""
+
+    def __init__(self, max_entries: int = CONVERSATION_MAX_ENTRIES, ttl_seconds: int = CONVERSATION_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # clé -> (expiration, octets)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, data: bytes):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)  # La conversation la moins récemment utilisée
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def acquire(self, key: str, owner: str, lease_seconds: float) -> bool:
+        return True  # Un seul processus : le verrou local suffit
+
+    def release(self, key: str, owner: str):
+        pass
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MongoBackend:
+    """Conversations dans MongoDB (expiration par index TTL), bail de verrou par utilisateur."""
+
+    def __init__(self, collection, locks_collection, ttl_seconds: int = CONVERSATION_TTL_SECONDS):
+        self.collection = collection
+        self.locks = locks_collection
+        self.ttl_seconds = ttl_seconds
+        self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        self.locks.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+    def get(self, key: str) -> Optional[bytes]:
+        doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}},
+                                       {"data": 1, "compressed": 1})
+        if not doc:
+            return None
+        return zlib.decompress(doc["data"]) if doc.get("compressed") else bytes(doc["data"])
+
+    def set(self, key: str, data: bytes):
+        now = datetime.utcnow()
+        compressed = zlib.compress(data) if len(data) > 4096 else data
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {
+                "data": Binary(compressed),
+                "compressed": compressed is not data,
+                "updated_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            }},
+            upsert=True,
+        )
+
+    def delete(self, key: str):
+        self.collection.delete_one({"_id": key})
+
+    def acquire(self, key: str, owner: str, lease_seconds: float) -> bool:
+        """Prend le bail s'il est libre, expiré ou déjà à nous (upsert refusé sinon)."""
+        now = datetime.utcnow()
+        try:
+            self.locks.update_one(
+                {"_id": key, "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}]},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=lease_seconds)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def release(self, key: str, owner: str):
+        self.locks.delete_one({"_id": key, "owner": owner})
+
+
+# ==================== STORE ====================
+
+class ConversationStore:
+    """Lecture / écriture de l'état des conversations, avec verrou par utilisateur."""
+
+    def __init__(self, backend, write_behind: bool = False):
+        self.backend = backend
+        self.write_behind = write_behind
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._cond = threading.Condition()
+        self._pending: Dict[str, bytes] = {}  # Écritures en attente (les plus récentes)
+        self._writing: Dict[str, bytes] = {}  # Lot en cours d'écriture
+        self._releases: Dict[str, str] = {}  # Baux à libérer après l'écriture (clé -> jeton)
+        self._stopped = False
+        self._writer = None
+        if write_behind:
+            self._writer = threading.Thread(target=self._write_loop, name="conversation-writer", daemon=True)
+            self._writer.start()
+
+    @contextmanager
+    def lock(self, key: str, timeout: float = LOCK_WAIT_SECONDS):
+        """Un seul tour à la fois par utilisateur, dans ce processus et entre les workers."""
+        stripe = self._stripes[hash(key) % LOCK_STRIPES]
+        if not stripe.acquire(timeout=timeout):
+            raise TimeoutError(f"Conversation {key} verrouillée")
+        try:
+            with self._cond:
+                # Bail du tour précédent pas encore pris en charge par l'écrivain : on le reprend.
+                # S'il l'a déjà pris, il le libérera avec son ancien jeton et on attend ci-dessous.
+                token = self._releases.pop(key, None) or f"{self.owner}:{uuid.uuid4().hex}"
+            deadline = time.monotonic() + timeout
+            while not self.backend.acquire(key, token, LOCK_LEASE_SECONDS):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Conversation {key} verrouillée par un autre worker")
+                time.sleep(0.05)
+            try:
+                yield
+            finally:
+                self._release(key, token)
+        finally:
+            stripe.release()
+
+    def _release(self, key: str, token: str):
+        with self._cond:
+            if key in self._pending or key in self._writing:
+                self._releases[key] = token  # Libéré par l'écrivain, après l'écriture
+                self._cond.notify_all()
+                return
+        self.backend.release(key, token)
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Dernier état de la conversation (écritures en attente comprises), None si inconnue."""
+        with self._cond:
+            data = self._pending.get(key) or self._writing.get(key)
+        if data is None:
+            data = self.backend.get(key)
+        return deserialize_state(data) if data is not None else None
+
+    def save(self, key: str, state: Dict[str, Any]):
+        data = serialize_state(state)
+        if not self.write_behind:
+            self.backend.set(key, data)
+            return
+        with self._cond:
+            self._pending[key] = data
+            self._cond.notify_all()
+
+    def delete(self, key: str):
+        with self._cond:
+            self._pending.pop(key, None)
+        self.backend.delete(key)
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not (self._pending or self._releases or self._stopped):
+                    self._cond.wait()
+                if self._stopped and not (self._pending or self._releases):
+                    return
+                self._writing, self._pending = self._pending, {}
+                releases, self._releases = self._releases, {}
+            for key, data in self._writing.items():
+                try:
+                    self.backend.set(key, data)
+                except Exception as e:
+                    logger.error(f"❌ État de la conversation {key} non enregistré : {e}")
+            for key, token in releases.items():
+                try:
+                    self.backend.release(key, token)
+                except Exception as e:
+                    logger.warning(f"⚠️ Bail de la conversation {key} non libéré (expirera seul) : {e}")
+            with self._cond:
+                self._writing = {}
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = 10):
+        """Attend la fin des écritures différées."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._writing or self._releases:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"⚠️ {len(self._pending)} conversation(s) non enregistrée(s) à l'arrêt.")
+                    return
+                self._cond.wait(remaining)
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "pending_writes": len(self._pending) + len(self._writing),
+            **({"entries": len(self.backend)} if isinstance(self.backend, MemoryBackend) else {}),
+        }
+
+
+def create_conversation_store(backend: str = CONVERSATION_BACKEND) -> ConversationStore:
+    """Store configuré par CONVERSATION_STORE (memory par défaut)."""
+    if backend == "mongo":
+        store = ConversationStore(
+            MongoBackend(get_collection(CONVERSATIONS_COLLECTION), get_collection(CONVERSATION_LOCKS_COLLECTION)),
+            write_behind=True,
+        )
+    else:
+        store = ConversationStore(MemoryBackend())
+    logger.info(f"💬 Conversations stockées avec {type(store.backend).__name__}.")
+    return store
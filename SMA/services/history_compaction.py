@@ -0,0 +1,157 @@
+# services/history_compaction.py - Fenêtre d'historique et résumé glissant des conversations
+"""
+Premier nœud du graphe : borne la taille des prompts envoyés au superviseur et aux agents.
+
+- les HISTORY_KEEP_TURNS derniers tours (un tour = un message du client et tout ce qui suit)
+  restent mot pour mot ;
+- les résultats d'outils des tours plus anciens (JSON de recherche, textes juridiques...)
+  sont remplacés par une référence compacte (IDs, titres, prix) ;
+- au-delà de HISTORY_MAX_TURNS tours, les plus anciens sont retirés de l'état et résumés
+  dans `history_summary` (modèle léger), qui est ajouté au prompt système des agents.
+
+Le résumé est refait par paquets (HISTORY_MAX_TURNS - HISTORY_KEEP_TURNS tours), pas à chaque
+tour : le coût et la latence d'un tour restent constants, même pour une très longue conversation.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import (
+    AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+)
+
+from services.llm_registry import chat_model
+
+logger = logging.getLogger(__name__)
+
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", 4))
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", 10))
+TOOL_PAYLOAD_MAX_CHARS = int(os.getenv("HISTORY_TOOL_PAYLOAD_MAX_CHARS", 400))
+SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_CHARS = 2000
+
+COMPACTED_PREFIX = "[Résultat compacté]"
+
+SUMMARY_PROMPT = """Tu résumes une conversation WhatsApp entre un client et DomusIA (assistant immobilier au Maroc).
+
+Mets à jour le résumé existant avec les nouveaux échanges. Garde UNIQUEMENT ce qui sert pour la suite :
+- critères du client (ville, quartier, type de bien, location/achat, budget, chambres, surface) ;
+- biens évoqués avec leur ID interne, titre et prix ; bien en cours de négociation et offres faites ;
+- alertes créées, questions juridiques posées et réponses clés ;
+- prénom et préférences du client.
+
+Style télégraphique, en français, 15 lignes maximum."""
+
+
+def _turn_starts(messages: Sequence[BaseMessage]) -> List[int]:
+    """Index des messages du client : chaque tour commence par un HumanMessage."""
+    return [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content or "")
+
+
+def compact_tool_payload(content) -> str:
+    """Référence compacte d'un ancien résultat d'outil : IDs, titres et prix des biens, sinon un extrait."""
+    text = _text(content)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and isinstance(data.get("results"), list):
+        lines = [f"{COMPACTED_PREFIX} {len(data['results'])} bien(s) :"]
+        for i, item in enumerate(data["results"], 1):
+            lines.append(f"{i}. id={item.get('id')} | {str(item.get('titre', ''))[:60]} | {item.get('prix', '')}")
+        return "\n".join(lines)
+    if isinstance(data, dict) and data.get("property_title"):
+        return (f"{COMPACTED_PREFIX} {data['property_title']} | prix {data.get('listing_price')} | "
+                f"plancher {data.get('floor_price')}")
+    return f"{COMPACTED_PREFIX} {text[:TOOL_PAYLOAD_MAX_CHARS]}…"
+
+
+def _shrink_old_tool_messages(messages: Sequence[BaseMessage], keep_from: int) -> List[BaseMessage]:
+    """ToolMessage volumineux avant `keep_from` -> même id, contenu compact (remplacé par add_messages)."""
+    updates = []
+    for message in messages[:keep_from]:
+        if not isinstance(message, ToolMessage):
+            continue
+        text = _text(message.content)
+        if len(text) <= TOOL_PAYLOAD_MAX_CHARS or text.startswith(COMPACTED_PREFIX):
+            continue
+        updates.append(ToolMessage(
+            content=compact_tool_payload(text),
+            tool_call_id=message.tool_call_id,
+            name=message.name,
+            id=message.id,
+        ))
+    return updates
+
+
+def _transcript(messages: Sequence[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"Client : {_text(message.content)}")
+        elif isinstance(message, AIMessage) and message.content:
+            lines.append(f"DomusIA : {_text(message.content)}")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Outil {message.name or ''} : {compact_tool_payload(message.content)}")
+    return "\n".join(lines)
+
+
+def _fallback_summary(previous: Optional[str], messages: Sequence[BaseMessage]) -> str:
+    """Résumé sans LLM : demandes du client, les plus récentes gardées en priorité."""
+    requests = [_text(message.content)[:200] for message in messages if isinstance(message, HumanMessage)]
+    summary = "\n".join(filter(None, [previous, *("- Client : " + request for request in requests)]))
+    return summary[-SUMMARY_MAX_CHARS:]
+
+
+def with_history(system_prompt: str, state: Dict[str, Any]) -> List[BaseMessage]:
+    """Prompt système (+ résumé des échanges anciens) suivi de la fenêtre de messages."""
+    summary = state.get("history_summary")
+    if summary:
+        system_prompt = f"{system_prompt}\n\n📝 RÉSUMÉ DES ÉCHANGES PRÉCÉDENTS :\n{summary}"
+    return [SystemMessage(content=system_prompt)] + list(state["messages"])
+
+
+def create_history_compactor(api_key: str):
+    """Crée le nœud de compaction de l'historique (modèle léger pour les résumés)."""
+
+    def summarize(previous: Optional[str], messages: Sequence[BaseMessage]) -> str:
+        content = f"Résumé existant :\n{previous or '(aucun)'}\n\nNouveaux échanges :\n{_transcript(messages)}"
+        try:
+            llm = chat_model(SUMMARY_MODEL, temperature=0, api_key=api_key)
+            response = llm.invoke([SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=content)])
+            return _text(response.content)[:SUMMARY_MAX_CHARS]
+        except Exception as e:
+            logger.warning(f"⚠️ Résumé de l'historique par LLM impossible, résumé simplifié : {e}")
+            return _fallback_summary(previous, messages)
+
+    def compact_history_node(state: Dict[str, Any]):
+        messages = list(state["messages"])
+        starts = _turn_starts(messages)
+        if len(starts) <= HISTORY_KEEP_TURNS:
+            return {}
+
+        keep_from = starts[-HISTORY_KEEP_TURNS]
+        if len(starts) > HISTORY_MAX_TURNS:
+            # Tours anciens : résumés puis retirés de l'état
+            old = messages[:keep_from]
+            summary = summarize(state.get("history_summary"), old)
+            logger.info(f"🗜️ Historique compacté : {len(old)} messages résumés, {len(messages) - keep_from} gardés.")
+            return {
+                "messages": [RemoveMessage(id=message.id) for message in old],
+                "history_summary": summary,
+            }
+
+        # Entre deux résumés : seuls les gros résultats d'outils anciens sont réduits
+        updates = _shrink_old_tool_messages(messages, keep_from)
+        return {"messages": updates} if updates else {}
+
+    return compact_history_node
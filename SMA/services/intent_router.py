@@ -0,0 +1,471 @@
+# services/intent_router.py - Routage local des messages (règles + classifieur), LLM en dernier recours
+"""
+Choisit l'agent d'un message sans appel LLM quand c'est sûr, en trois niveaux :
+
+1. règles déterministes : salutations / remerciements seuls, choix d'un bien par numéro
+   après une recherche, montant proposé pendant une négociation ;
+2. classifieur TF-IDF à centroïdes (mots + n-grammes de caractères, sans dépendance) entraîné
+   sur des exemples de base et sur les décisions du LLM enregistrées. L'agent du tour précédent
+   sert d'a priori pour les relances courtes ("et en location ?"), et une relance courte qui
+   changerait d'agent est laissée au LLM (il voit l'historique). Le classifieur ne décide que si
+   le score et l'écart avec le deuxième agent dépassent les seuils ;
+3. sinon, le routeur LLM du superviseur ; sa décision devient un exemple d'entraînement.
+
+Modes (ROUTER_MODE) :
+- shadow (défaut) : le LLM route tout ce que les règles ne tranchent pas ; la prédiction du
+  classifieur est seulement journalisée, pour mesurer sa précision avant de l'activer ;
+- active : le classifieur route les cas sûrs ; ROUTER_AUDIT_RATE de ces cas passent aussi
+  par le LLM pour contrôle.
+
+Chaque décision est enregistrée (collection routing_decisions, en arrière-plan) avec sa source,
+son score, son écart et la prédiction du classifieur quand le LLM a tranché. Au réentraînement,
+les décisions du LLM sont re-notées par validation croisée (chacune par un classifieur qui ne l'a
+pas apprise) et les seuils recalculés sur ces notes : les plus bas qui gardent une précision d'au
+moins ROUTER_TARGET_PRECISION (seuils configurés conservés sous ROUTER_MIN_TUNING_SAMPLES décisions).
+"""
+import logging
+import math
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+
+from db.normalize import slugify
+from services.mongo_pool import get_collection
+
+logger = logging.getLogger(__name__)
+
+SEARCH, NEGOTIATION, LEGAL, CHAT = "SEARCH_AGENT", "NEGOTIATION_AGENT", "JURIDIQUE_ADVISOR", "GENERAL_CHAT"
+ROUTES = (SEARCH, NEGOTIATION, LEGAL, CHAT)
+
+ROUTER_MODE = os.getenv("ROUTER_MODE", "shadow")  # shadow | active
+# Seuils prudents tant qu'ils n'ont pas été recalculés sur les décisions journalisées
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", 0.4))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", 0.25))
+ROUTER_AUDIT_RATE = float(os.getenv("ROUTER_AUDIT_RATE", 0.05))
+ROUTER_TARGET_PRECISION = float(os.getenv("ROUTER_TARGET_PRECISION", 0.95))
+ROUTER_MIN_TUNING_SAMPLES = int(os.getenv("ROUTER_MIN_TUNING_SAMPLES", 300))
+ROUTER_FOLLOWUP_WORDS = int(os.getenv("ROUTER_FOLLOWUP_WORDS", 6))  # Relance courte
+ROUTER_FOLLOWUP_PRIOR = float(os.getenv("ROUTER_FOLLOWUP_PRIOR", 0.1))  # Bonus de l'agent courant
+ROUTER_LOG_DECISIONS = os.getenv("ROUTER_LOG_DECISIONS", "true").lower() == "true"
+ROUTER_RETRAIN_SECONDS = int(os.getenv("ROUTER_RETRAIN_SECONDS", 3600))
+ROUTER_TRAINING_LIMIT = int(os.getenv("ROUTER_TRAINING_LIMIT", 5000))
+ROUTER_TUNING_FOLDS = int(os.getenv("ROUTER_TUNING_FOLDS", 5))
+DECISIONS_COLLECTION = "routing_decisions"
+DECISIONS_TTL_SECONDS = 90 * 24 * 3600
+LOG_QUEUE_SIZE = 10000
+
+# Exemples de base (français, darija, anglais) : le classifieur fonctionne dès le premier démarrage
+SEED_EXAMPLES = {
+    SEARCH: [
+        "je cherche un appartement à casablanca",
+        "je cherche une villa à louer à marrakech",
+        "appartement 3 chambres maarif budget 1 million",
+        "tu as des studios à rabat agdal ?",
+        "montre moi des maisons à vendre à tanger",
+        "un terrain à agadir moins de 500000 dh",
+        "location appartement meublé gauthier",
+        "quel est le prix moyen du m2 à casablanca",
+        "combien coûte un appartement à rabat",
+        "bghit chi appartement f casa",
+        "kayn chi dar l kra f marrakech",
+        "looking for an apartment in casablanca",
+        "d'autres biens moins chers ?",
+        "préviens moi quand un bien correspondant sort",
+        "crée une alerte pour un appartement à fes",
+        "mes alertes",
+        "supprime mon alerte",
+        "montre moi les détails du bien",
+        "plus de photos et de détails",
+        "avec piscine et jardin",
+    ],
+    NEGOTIATION: [
+        "je veux négocier le prix",
+        "c'est négociable ?",
+        "je propose 900000 dh",
+        "mon offre est de 1 200 000",
+        "tu peux baisser le prix ?",
+        "c'est trop cher, quel est votre dernier prix",
+        "je suis intéressé par ce bien",
+        "celui-ci m'intéresse",
+        "je prends le deuxième, on peut discuter du prix ?",
+        "est ce que le propriétaire accepte une remise",
+        "je peux payer cash si vous faites un geste",
+        "ok j'accepte votre contre offre",
+        "dernière offre 850000",
+        "nkhles 1 million wach mumkin",
+        "can you lower the price",
+        "faites moi un prix",
+    ],
+    LEGAL: [
+        "quels sont les frais de notaire au maroc",
+        "quelles taxes pour acheter un appartement",
+        "comment fonctionne un contrat de bail",
+        "la loi sur la location au maroc",
+        "le propriétaire peut il m'expulser",
+        "qu'est ce qu'un titre foncier",
+        "procédure d'achat pour un étranger",
+        "quels documents pour signer le compromis de vente",
+        "droits d'enregistrement et conservation foncière",
+        "taxe d'habitation qui paie",
+        "dépôt de garantie légal combien de mois",
+        "résilier mon bail avant la fin",
+        "vente en état futur d'achèvement loi",
+        "héritage d'un bien immobilier partage",
+        "is it legal for foreigners to buy property in morocco",
+        "génère un contrat de location",
+    ],
+    CHAT: [
+        "salut",
+        "bonjour ça va ?",
+        "merci beaucoup",
+        "qui es tu ?",
+        "tu fais quoi exactement ?",
+        "comment tu peux m'aider",
+        "ok super",
+        "au revoir",
+        "salam labas",
+        "hello",
+        "t'es un robot ?",
+        "parfait merci bonne journée",
+        "c'est quoi domusia",
+        "tu parles anglais ?",
+    ],
+}
+
+GREETING_WORDS = {
+    "salut", "bonjour", "bonsoir", "hello", "hi", "hey", "coucou", "salam", "slm", "salamo", "alaykoum",
+    "labas", "cv", "ca", "va", "merci", "mrc", "thanks", "thank", "you", "ok", "okay", "oki", "dac",
+    "d", "accord", "super", "cool", "parfait", "top", "genial", "bye", "au", "revoir", "bonne", "journee",
+    "soiree", "a", "bientot", "chokran", "choukran", "shukran", "beaucoup", "bien", "tres", "et", "toi", "vous",
+}
+ORDINALS = {"premier", "premiere", "1er", "1ere", "deuxieme", "second", "seconde", "troisieme",
+            "quatrieme", "cinquieme", "dernier", "derniere"}
+SELECTION_WORDS = {"le", "la", "numero", "num", "n", "no", "bien", "annonce", "je", "veux", "prends",
+                   "choisis", "voir", "celui", "du", "stp", "svp", "plz", "details", "detail"} | ORDINALS
+_NUMBER = re.compile(r"\d")
+_AMOUNT = re.compile(r"\d[\d\s.,]{2,}|\d+\s*(?:k|m|million|millions|mdh|dh|mad)\b", re.IGNORECASE)
+
+Decision = Tuple[str, str, float, float]  # (agent, 'classifier' | 'unsure' | 'rule', score, écart)
+LLM_SOURCES = ["llm", "audit", "shadow"]  # Décisions prises par le LLM : exemples d'entraînement
+SEARCH_TOOL = "search_properties"
+
+
+# ==================== CLASSIFIEUR ====================
+
+def _features(text: str) -> Counter:
+    """Mots + n-grammes de caractères (3 et 4) : robustes aux fautes et aux conjugaisons."""
+    words = [word for word in slugify(text).split("_") if word]
+    features = Counter(f"w:{word}" for word in words)
+    for word in words:
+        padded = f" {word} "
+        for n in (3, 4):
+            features.update(f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+    return features
+
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {key: value / norm for key, value in vector.items()} if norm else {}
+
+
+class CentroidClassifier:
+    """TF-IDF (sac de mots + n-grammes) et plus proche centroïde, en Python pur."""
+
+    def __init__(self, examples: Iterable[Tuple[str, str]]):
+        examples = [(text, label) for text, label in examples if label in ROUTES and text]
+        documents = [_features(text) for text, _ in examples]
+        document_frequency = Counter(feature for document in documents for feature in document)
+        total = len(documents) + 1
+        self.idf = {feature: math.log(total / (count + 1)) + 1 for feature, count in document_frequency.items()}
+
+        sums: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for document, (_, label) in zip(documents, examples):
+            for feature, value in self._vectorize(document).items():
+                sums[label][feature] += value
+        self.centroids = {label: _normalize(vector) for label, vector in sums.items()}
+        self.size = len(examples)
+
+    def _vectorize(self, features: Counter) -> Dict[str, float]:
+        return _normalize({
+            feature: (1 + math.log(count)) * self.idf[feature]
+            for feature, count in features.items() if feature in self.idf
+        })
+
+    def scores(self, text: str) -> List[Tuple[str, float]]:
+        """Similarité cosinus avec chaque centroïde, de la plus forte à la plus faible."""
+        vector = self._vectorize(_features(text))
+        scores = [
+            (label, sum(value * centroid.get(feature, 0.0) for feature, value in vector.items()))
+            for label, centroid in self.centroids.items()
+        ]
+        return sorted(scores, key=lambda item: item[1], reverse=True)
+
+
+def _predict(classifier: CentroidClassifier, text: str,
+             current_agent: Optional[str] = None) -> Tuple[str, float, float, bool]:
+    """
+    (agent, score, écart, relance qui change d'agent). Pour une relance courte, l'agent courant
+    reçoit un bonus ; s'il n'est pas choisi malgré tout, la décision revient au LLM.
+    """
+    scores = dict(classifier.scores(text))
+    followup = current_agent in scores and len(slugify(text).split("_")) <= ROUTER_FOLLOWUP_WORDS
+    if followup:
+        scores[current_agent] += ROUTER_FOLLOWUP_PRIOR
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best, score = ranked[0]
+    margin = score - (ranked[1][1] if len(ranked) > 1 else 0.0)
+    return best, score, margin, followup and best != current_agent
+
+
+# ==================== RÈGLES ====================
+
+def _after_search(state: Dict[str, Any]) -> bool:
+    """Le dernier résultat d'outil de la conversation est une recherche de biens."""
+    for message in reversed(state.get("messages") or []):
+        if getattr(message, "type", None) == "tool":
+            return getattr(message, "name", None) == SEARCH_TOOL
+    return False
+
+
+def rule_route(text: str, state: Dict[str, Any]) -> Optional[str]:
+    """Cas certains, décidés sans classifieur."""
+    words = [word for word in slugify(text).split("_") if word]
+    if not words:
+        return CHAT  # Emojis, ponctuation seule
+    if len(words) <= 6 and all(word in GREETING_WORDS for word in words):
+        return CHAT
+    # "le 2", "numéro 3", "le premier" juste après une recherche
+    if len(words) <= 5 and _after_search(state) and \
+            all(word in SELECTION_WORDS or word.isdigit() for word in words) and \
+            any(word in ORDINALS or word.isdigit() for word in words):
+        return SEARCH
+    # Montant proposé pendant une négociation en cours
+    if state.get("next_agent") == NEGOTIATION and state.get("active_property_id") and \
+            len(words) <= 12 and _AMOUNT.search(text):
+        return NEGOTIATION
+    return None
+
+
+# ==================== SEUILS ====================
+
+def tune_thresholds(samples: Iterable[dict], target_precision: float = ROUTER_TARGET_PRECISION,
+                    min_samples: int = ROUTER_MIN_TUNING_SAMPLES) -> Optional[Tuple[float, float]]:
+    """
+    Seuils (score, écart) les plus bas dont la précision, mesurée sur les décisions du LLM
+    (prédiction du classifieur vs agent choisi), atteint `target_precision`.
+    Les prédictions doivent venir d'un classifieur qui n'a pas appris ces décisions
+    (voir out_of_fold_samples). None si elles sont trop peu nombreuses ou si aucun couple
+    n'atteint la cible.
+    """
+    samples = [sample for sample in samples if sample.get("classifier_route") and "margin" in sample]
+    if len(samples) < min_samples:
+        return None
+    best = None
+    for score_step in range(10, 81, 5):
+        for margin_step in range(2, 51, 2):
+            min_score, min_margin = score_step / 100, margin_step / 100
+            kept = [sample for sample in samples if sample["score"] >= min_score and sample["margin"] >= min_margin]
+            if len(kept) < max(30, min_samples // 10):
+                continue
+            precision = sum(sample["classifier_route"] == sample["route"] for sample in kept) / len(kept)
+            if precision >= target_precision and (best is None or len(kept) > best[0]):
+                best = (len(kept), min_score, min_margin)
+    return best[1:] if best else None
+
+
+def out_of_fold_samples(seeds: List[Tuple[str, str]], logged: List[dict],
+                        folds: int = ROUTER_TUNING_FOLDS) -> List[dict]:
+    """
+    Décisions du LLM re-notées par validation croisée : chaque part est prédite par un
+    classifieur entraîné sur les exemples de base et les autres parts. Les relances qui
+    changeraient d'agent sont écartées (toujours laissées au LLM).
+    """
+    samples = []
+    for fold in range(folds):
+        training = [(doc["text"], doc["route"]) for i, doc in enumerate(logged) if i % folds != fold]
+        classifier = CentroidClassifier(seeds + training)
+        for doc in logged[fold::folds]:
+            best, score, margin, switch = _predict(classifier, doc["text"], doc.get("current_agent"))
+            if not switch:
+                samples.append({"route": doc["route"], "classifier_route": best, "score": score, "margin": margin})
+    return samples
+
+
+# ==================== ROUTEUR ====================
+
+class IntentRouter:
+    """Règles, puis classifieur confiant (mode active), puis LLM ; décisions journalisées et réutilisées."""
+
+    def __init__(self, min_score: float = ROUTER_MIN_SCORE, min_margin: float = ROUTER_MIN_MARGIN,
+                 audit_rate: float = ROUTER_AUDIT_RATE, mode: str = ROUTER_MODE,
+                 log_decisions: bool = ROUTER_LOG_DECISIONS, collection=None):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.audit_rate = audit_rate
+        self.mode = mode
+        self.log_decisions = log_decisions
+        self._collection = collection
+        self.classifier = CentroidClassifier(self._seed_examples())
+        self._trained_at = 0.0
+        self._training = threading.Lock()
+        self._log_queue: "queue.Queue[dict]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._logger_thread = None
+        self.stats = Counter()
+
+    @staticmethod
+    def _seed_examples() -> List[Tuple[str, str]]:
+        return [(text, label) for label, texts in SEED_EXAMPLES.items() for text in texts]
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_collection(DECISIONS_COLLECTION)
+            self._collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=DECISIONS_TTL_SECONDS)
+            self._collection.create_index([("source", ASCENDING), ("created_at", DESCENDING)])
+        return self._collection
+
+    # --- Entraînement ---
+
+    def retrain(self):
+        """
+        Exemples de base + dernières décisions du LLM (les prédictions du classifieur sont exclues),
+        puis seuils recalculés sur ces décisions re-notées hors échantillon.
+        """
+        seeds = self._seed_examples()
+        logged = []
+        try:
+            logged = list(self.collection.find(
+                {"source": {"$in": LLM_SOURCES}},
+                {"text": 1, "route": 1, "current_agent": 1},
+            ).sort("created_at", DESCENDING).limit(ROUTER_TRAINING_LIMIT))
+        except Exception as e:
+            logger.warning(f"⚠️ Décisions de routage indisponibles, exemples de base seuls : {e}")
+        self.classifier = CentroidClassifier(seeds + [(doc["text"], doc["route"]) for doc in logged])
+        thresholds = None
+        if len(logged) >= ROUTER_MIN_TUNING_SAMPLES:
+            thresholds = tune_thresholds(out_of_fold_samples(seeds, logged))
+        if thresholds:
+            self.min_score, self.min_margin = thresholds
+        self._trained_at = time.monotonic()
+        logger.info(f"🧭 Routeur local entraîné sur {self.classifier.size} exemples "
+                    f"(seuils {self.min_score:.2f} / {self.min_margin:.2f}"
+                    f"{', recalculés' if thresholds else ''}, mode {self.mode}).")
+
+    def _maybe_retrain(self):
+        if time.monotonic() - self._trained_at < ROUTER_RETRAIN_SECONDS:
+            return
+        if self._training.acquire(blocking=False):
+            self._trained_at = time.monotonic()  # Un seul réentraînement à la fois
+
+            def run():
+                try:
+                    self.retrain()
+                finally:
+                    self._training.release()
+            threading.Thread(target=run, name="router-retrain", daemon=True).start()
+
+    # --- Routage ---
+
+    def classify(self, text: str, current_agent: Optional[str] = None) -> Decision:
+        """(agent, 'classifier' | 'unsure', score, écart) ; une relance qui change d'agent reste au LLM."""
+        best, score, margin, switch = _predict(self.classifier, text, current_agent)
+        confident = score >= self.min_score and margin >= self.min_margin and not switch
+        return best, "classifier" if confident else "unsure", score, margin
+
+    def route(self, text: str, state: Dict[str, Any], fallback: Callable[[], str]) -> str:
+        """Agent pour `text` ; `fallback` (routeur LLM) n'est appelé que si le classifieur ne décide pas."""
+        self._maybe_retrain()
+        started = time.perf_counter()
+        current_agent = state.get("next_agent")
+        rule = rule_route(text, state)
+        if rule:
+            self._log(text, rule, "rule", (rule, "rule", 1.0, 1.0), (time.perf_counter() - started) * 1000,
+                      current_agent)
+            return rule
+
+        predicted = self.classify(text, current_agent)
+        local_ms = (time.perf_counter() - started) * 1000
+        confident = predicted[1] == "classifier"
+        if self.mode != "active":
+            source = "shadow"
+        elif not confident:
+            source = "llm"
+        elif self.audit_rate and random.random() < self.audit_rate:
+            source = "audit"
+        else:
+            self._log(text, predicted[0], "classifier", predicted, local_ms, current_agent)
+            return predicted[0]
+        route = fallback()
+        self._log(text, route, source, predicted, local_ms, current_agent)
+        return route
+
+    # --- Journal des décisions ---
+
+    def _log(self, text: str, route: str, source: str, predicted: Decision, local_ms: float,
+             current_agent: Optional[str] = None):
+        _, status, score, margin = predicted
+        self.stats[source] += 1
+        if source in LLM_SOURCES:
+            self.stats["classifier_checked"] += 1
+            self.stats["classifier_agreed"] += predicted[0] == route
+        logger.info(f"🧭 Routage {source} -> {route} (classifieur {predicted[0]} {status}, "
+                    f"score {score:.2f}, écart {margin:.2f}, {local_ms:.2f} ms)")
+        if not self.log_decisions:
+            return
+        entry = {
+            "text": text[:500],
+            "route": route,
+            "source": source,
+            "current_agent": current_agent,  # A priori des relances, rejoué au recalcul des seuils
+            "score": round(score, 4),
+            "margin": round(margin, 4),
+            "local_ms": round(local_ms, 3),
+            "created_at": datetime.utcnow(),
+        }
+        if source in LLM_SOURCES:
+            entry["classifier_route"] = predicted[0]
+            entry["classifier_confident"] = status == "classifier"
+            entry["classifier_agrees"] = predicted[0] == route
+        try:
+            self._log_queue.put_nowait(entry)
+        except queue.Full:
+            self.stats["log_dropped"] += 1
+            return
+        if self._logger_thread is None:
+            self._logger_thread = threading.Thread(target=self._log_loop, name="router-log", daemon=True)
+            self._logger_thread.start()
+
+    def _log_loop(self):
+        """Écrit les décisions par lots, hors du chemin de la réponse."""
+        while True:
+            batch = [self._log_queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self._log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.collection.insert_many(batch, ordered=False)
+            except Exception as e:
+                logger.warning(f"⚠️ {len(batch)} décision(s) de routage non enregistrée(s) : {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        decided = sum(self.stats[source] for source in ("rule", "classifier", *LLM_SOURCES))
+        checked = self.stats["classifier_checked"]
+        return {
+            **self.stats,
+            "mode": self.mode,
+            "min_score": self.min_score,
+            "min_margin": self.min_margin,
+            "local_rate": round((self.stats["rule"] + self.stats["classifier"]) / decided, 3) if decided else None,
+            "classifier_agreement": round(self.stats["classifier_agreed"] / checked, 3) if checked else None,
+            "training_examples": self.classifier.size,
+        }
@@ -0,0 +1,78 @@
+# services/leases.py - Baux MongoDB : une tâche de fond active pour tous les workers
+"""
+Plusieurs workers uvicorn démarrent les mêmes tâches de fond ; un bail nommé garantit
+qu'une seule instance travaille à la fois. Le détenteur le renouvelle régulièrement ;
+s'il s'arrête, un autre processus le reprend quand il expire.
+
+Le bail peut vivre dans un document qui porte aussi l'état de la tâche (ex: position de
+lecture des alertes) : renew() écrit cet état et prolonge le bail en une seule opération,
+et release() ne supprime jamais le document.
+"""
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from services.mongo_pool import get_collection
+
+logger = logging.getLogger(__name__)
+
+LEASES_COLLECTION = "service_leases"
+
+
+class MongoLease:
+    """Bail `name` (_id du document) d'une durée de `lease_seconds`, pris ou renouvelé par acquire()."""
+
+    def __init__(self, name: str, lease_seconds: float, collection=None,
+                 collection_name: str = LEASES_COLLECTION):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._collection = collection
+        self._collection_name = collection_name
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_collection(self._collection_name)
+        return self._collection
+
+    def _expiry(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+
+    def acquire(self) -> bool:
+        """Prend le bail s'il est libre, expiré ou déjà à nous (upsert refusé sinon)."""
+        now = datetime.utcnow()
+        try:
+            self.collection.update_one(
+                {"_id": self.name, "$or": [
+                    {"expires_at": {"$exists": False}},  # Document créé sans bail
+                    {"expires_at": {"$lt": now}},
+                    {"owner": self.owner},
+                ]},
+                {"$set": {"owner": self.owner, "expires_at": self._expiry()}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def renew(self, fields: Optional[Dict[str, Any]] = None) -> bool:
+        """Prolonge le bail (et écrit `fields`) s'il est toujours à nous ; False s'il a été repris."""
+        result = self.collection.update_one(
+            {"_id": self.name, "owner": self.owner},
+            {"$set": {**(fields or {}), "expires_at": self._expiry()}},
+        )
+        return bool(result.matched_count)
+
+    def release(self):
+        """Fait expirer le bail tout de suite (le document et son état sont conservés)."""
+        try:
+            self.collection.update_one({"_id": self.name, "owner": self.owner},
+                                       {"$set": {"expires_at": datetime.utcnow()}})
+        except PyMongoError as e:
+            logger.warning(f"⚠️ Bail {self.name} non libéré (expirera seul) : {e}")
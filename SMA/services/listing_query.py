@@ -0,0 +1,163 @@
+# services/listing_query.py - Construction des requêtes MongoDB sur les annonces
+"""
+Traduit les critères de recherche (ville, transaction, type, budget...) en une requête
+MongoDB sur les champs normalisés à l'import (voir db/normalize.py) :
+
+- égalités sur city_slug / transaction_type / property_kind puis intervalle sur price_mad,
+  dans l'ordre de l'index composé (égalités d'abord, intervalle ensuite) ;
+- surface et chambres en $gte, évaluées par MongoDB et non plus en Python ;
+- $regex uniquement pour le texte libre (quartier, standing, type de bien inconnu).
+
+Les index sont créés une fois par processus, au premier appel.
+"""
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING
+
+from db.normalize import KIND_PATTERNS, SUB_KINDS, detect_property_kind, slugify
+from scraping.config import CITIES
+
+logger = logging.getLogger(__name__)
+
+# Égalités d'abord, intervalle (prix) en dernier
+LISTING_INDEXES = (
+    ("city_transaction_kind_price", [("city_slug", ASCENDING), ("transaction_type", ASCENDING),
+                                     ("property_kind", ASCENDING), ("price_mad", ASCENDING)]),
+    ("transaction_kind_price", [("transaction_type", ASCENDING), ("property_kind", ASCENDING),
+                                ("price_mad", ASCENDING)]),
+    ("scraped_at", [("scraped_at", ASCENDING)]),  # Nouvelles annonces (alertes)
+)
+
+RENT_WORDS = ("location", "louer", "rent")
+SALE_WORDS = ("vente", "acheter", "achat", "buy")
+
+CITY_ALIASES = {"casa": "casablanca", "marrakesh": "marrakech", "fez": "fes", "tangier": "tanger"}
+
+STANDING_PATTERNS = {
+    "luxe": "luxe|prestige|haut.standing|premium",
+    "haut": "haut.standing|standing|moderne",
+    "moyen": "standard|classique",
+    "economique": "économique|pas.cher|bon.prix",
+}
+
+# Villes les plus longues d'abord : "sidi_bel_abbes" avant "sidi"...
+_CITY_PATTERNS = [
+    (city, re.compile(rf"(?:^|_){re.escape(city)}(?:_|$)"))
+    for city in sorted(set(CITIES) | set(CITY_ALIASES), key=len, reverse=True)
+]
+
+_indexed_collections = set()
+_indexes_lock = threading.Lock()
+
+
+def ensure_listing_indexes(collection):
+    """Crée les index composés de recherche (une seule fois par collection et par processus)."""
+    key = collection.full_name
+    if key in _indexed_collections:
+        return
+    with _indexes_lock:
+        if key in _indexed_collections:
+            return
+        for name, keys in LISTING_INDEXES:
+            try:
+                collection.create_index(keys, name=name)
+            except Exception as e:
+                logger.error(f"❌ Index {name} non créé : {e}")
+        _indexed_collections.add(key)
+
+
+def split_location(location: str) -> tuple:
+    """
+    Sépare une localisation libre en (ville connue, reste du texte) :
+    'Maarif Casablanca' -> ('casablanca', 'Maarif'), 'Gauthier' -> (None, 'Gauthier').
+    """
+    slug = slugify(location)
+    for city, pattern in _CITY_PATTERNS:
+        if pattern.search(slug):
+            # Le reste garde ses accents ("Aïn Diab") pour la regex
+            city_words = set(city.split("_"))
+            rest = [word for word in re.split(r"[\s,]+", location) if word and slugify(word) not in city_words]
+            return CITY_ALIASES.get(city, city), " ".join(rest)
+    return None, location.strip()
+
+
+def _text_regex(text: str) -> Dict[str, str]:
+    words = [re.escape(word) for word in text.split() if word]
+    return {"$regex": r"\s+".join(words), "$options": "i"}
+
+
+def normalize_transaction(transaction_type: Optional[str]) -> Optional[str]:
+    if not transaction_type:
+        return None
+    value = transaction_type.lower()
+    if value in RENT_WORDS:
+        return "location"
+    if value in SALE_WORDS:
+        return "vente"
+    return None
+
+
+def build_listing_query(
+    property_type: str = None,
+    transaction_type: str = None,
+    min_price: float = None,
+    max_price: float = None,
+    location: str = None,
+    min_surface: float = None,
+    bedrooms: int = None,
+    standing: str = None,
+) -> Dict[str, Any]:
+    """Requête MongoDB servie par LISTING_INDEXES (regex seulement pour le texte libre)."""
+    query: Dict[str, Any] = {}
+    text_filters: List[dict] = []
+
+    if location:
+        city, rest = split_location(location)
+        if city:
+            query["city_slug"] = city
+        if rest:
+            regex = _text_regex(rest)
+            text_filters.append({"$or": [{"location": regex}, {"adresse": regex}, {"title": regex}]})
+
+    transaction = normalize_transaction(transaction_type)
+    if transaction:
+        query["transaction_type"] = transaction
+
+    if property_type:
+        kind = detect_property_kind(property_type)
+        if kind in SUB_KINDS:
+            # Studio : annonces importées sous le type parent avant la détection par le titre
+            query["property_kind"] = {"$in": [kind, SUB_KINDS[kind]]}
+            regex = {"$regex": KIND_PATTERNS[kind].pattern, "$options": "i"}
+            text_filters.append({"$or": [{"property_type": regex}, {"title": regex}]})
+        elif kind:
+            query["property_kind"] = kind
+        else:
+            regex = _text_regex(property_type)
+            text_filters.append({"$or": [{"property_type": regex}, {"title": regex}]})
+
+    price = {}
+    if min_price is not None:
+        price["$gte"] = min_price
+    if max_price is not None:
+        price["$lte"] = max_price
+    if price:
+        query["price_mad"] = price
+    if min_surface is not None:
+        query["surface_m2"] = {"$gte": min_surface}
+    if bedrooms is not None:
+        query["rooms_n"] = {"$gte": bedrooms}
+
+    if standing:
+        pattern = STANDING_PATTERNS.get(slugify(standing).split("_")[0], re.escape(standing))
+        regex = {"$regex": pattern, "$options": "i"}
+        text_filters.append({"$or": [{"title": regex}, {"description": regex}]})
+
+    if len(text_filters) == 1:
+        query.update(text_filters[0])
+    elif text_filters:
+        query["$and"] = text_filters
+    return query
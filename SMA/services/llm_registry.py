@@ -0,0 +1,138 @@
+# services/llm_registry.py - Modèles de chat partagés par tout le processus
+"""
+Chaque modèle de chat (avec ses outils liés ou sa sortie structurée) est construit une seule
+fois par processus puis réutilisé par tous les tours de conversation :
+
+- un seul client HTTP (httpx) pour tous les modèles OpenAI : connexions keep-alive
+  réutilisées, la poignée de main TLS n'est payée qu'à l'ouverture d'une connexion du pool ;
+- warm_up() ouvre ces connexions au démarrage, avant le premier message ;
+- après un fork (workers uvicorn, gunicorn --preload), client et modèles sont recréés dans
+  l'enfant. Les appelants (nœuds du graphe compilé, outils) ne gardent donc aucun modèle :
+  ils le relisent ici à chaque appel (simple lecture du cache).
+
+Une seule clé OpenAI par processus (OPENAI_API_KEY).
+Pool configurable : LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE, LLM_KEEPALIVE_SECONDS, LLM_TIMEOUT_SECONDS.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+DEFAULT_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o")
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 32))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", 16))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", 120))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+LLM_WARMUP_CONNECTIONS = int(os.getenv("LLM_WARMUP_CONNECTIONS", 2))
+
+_http_client: Optional[httpx.Client] = None
+_models: Dict[tuple, Any] = {}
+_pid: Optional[int] = None
+_lock = threading.RLock()
+
+
+def _reset_after_fork():
+    """Client et modèles du processus parent inutilisables dans l'enfant : on repart de zéro."""
+    global _http_client, _pid
+    if _pid != os.getpid():
+        _http_client = None
+        _models.clear()
+        _pid = os.getpid()
+
+
+def get_http_client() -> httpx.Client:
+    """Client HTTP partagé par tous les modèles (pool de connexions keep-alive)."""
+    global _http_client
+    with _lock:
+        _reset_after_fork()
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+                ),
+                timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10),
+            )
+            logger.info(f"🔌 Client HTTP LLM créé (pool max {LLM_MAX_CONNECTIONS}).")
+        return _http_client
+
+
+def _cached(key: tuple, factory: Callable[[], Any]):
+    with _lock:
+        _reset_after_fork()
+        model = _models.get(key)
+        if model is None:
+            model = factory()
+            _models[key] = model
+        return model
+
+
+def chat_model(model: str = DEFAULT_CHAT_MODEL, temperature: float = 0.0,
+               api_key: Optional[str] = None) -> ChatOpenAI:
+    """Modèle de chat partagé, construit au premier appel pour ce couple (modèle, température)."""
+    return _cached(("chat", model, temperature), lambda: ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        api_key=api_key or OPENAI_API_KEY,
+        http_client=get_http_client(),
+    ))
+
+
+def model_with_tools(name: str, tools: Sequence, model: str = DEFAULT_CHAT_MODEL,
+                     temperature: float = 0.0, api_key: Optional[str] = None):
+    """Modèle avec ses outils liés, mis en cache sous `name` (un nom par agent)."""
+    return _cached(("tools", name), lambda: chat_model(model, temperature, api_key).bind_tools(list(tools)))
+
+
+def structured_model(name: str, schema, model: str = DEFAULT_CHAT_MODEL,
+                     temperature: float = 0.0, api_key: Optional[str] = None):
+    """Modèle à sortie structurée (schéma pydantic), mis en cache sous `name`."""
+    return _cached(("structured", name), lambda: chat_model(model, temperature, api_key).with_structured_output(schema))
+
+
+def warm_up(connections: int = LLM_WARMUP_CONNECTIONS):
+    """Ouvre des connexions vers l'API (requête légère, sans tokens) avant le premier message."""
+    model = chat_model()  # Tous les modèles partagent le même pool de connexions
+    client = model.root_client
+    started = time.perf_counter()
+
+    def ping(_):
+        client.models.retrieve(model.model_name)
+
+    try:
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            list(pool.map(ping, range(connections)))
+        logger.info(f"🔥 {connections} connexion(s) OpenAI ouvertes en {(time.perf_counter() - started) * 1000:.0f} ms.")
+    except Exception as e:
+        logger.warning(f"⚠️ Préchauffage des connexions OpenAI impossible : {e}")
+
+
+def registry_stats() -> Dict[str, Any]:
+    """Modèles construits (à exposer dans /health)."""
+    with _lock:
+        return {
+            "models": sorted(":".join(str(part) for part in key[1:]) for key in _models),
+            "http_client": _http_client is not None and _pid == os.getpid(),
+        }
+
+
+def close_llm_clients():
+    """Ferme le client HTTP partagé (arrêt de l'application)."""
+    global _http_client
+    with _lock:
+        if _http_client is not None and _pid == os.getpid():
+            _http_client.close()
+        _http_client = None
+        _models.clear()
@@ -0,0 +1,177 @@
+# services/mongo_pool.py - Clients MongoDB partagés par tout le processus
+"""
+Un seul MongoClient (et un seul client Motor pour le code asynchrone) par processus,
+réutilisés par tous les outils des agents et tous les services : la poignée de main
+TCP + authentification + sélection du serveur n'est payée qu'une fois, puis les appels
+empruntent une connexion déjà ouverte du pool.
+
+Tailles du pool configurables (MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_MS).
+pool_stats() expose les métriques du pool (connexions ouvertes, empruntées, attentes).
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Configuration MongoDB
+MONGO_USER = os.getenv("MONGO_USER")
+MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
+MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
+MONGO_PORT = os.getenv("MONGO_PORT", "27017")
+MONGO_DB = os.getenv("MONGO_DB", "listings")
+MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "listings")
+
+if MONGO_USER and MONGO_PASSWORD:
+    MONGODB_URI = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
+else:
+    MONGODB_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
+
+# Pool de connexions
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 2))  # Connexions gardées chaudes
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", 300000))
+MONGO_SERVER_SELECTION_MS = int(os.getenv("MONGO_SERVER_SELECTION_MS", 5000))
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Compteurs du pool, alimentés par les événements du driver (client sync et Motor)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "checked_out": 0,
+            "pool_clears": 0,
+        }
+        self.checkout_wait_ms_total = 0.0
+        self.checkout_wait_ms_max = 0.0
+
+    def _add(self, key: str, value: int = 1):
+        with self._lock:
+            self.counters[key] += value
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add("pool_clears")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add("checkout_failures")
+
+    def connection_checked_out(self, event):
+        # Durée de l'emprunt (attente d'une connexion libre, ou ouverture d'une nouvelle)
+        wait_ms = (getattr(event, "duration", None) or 0.0) * 1000
+        with self._lock:
+            self.checkout_wait_ms_total += wait_ms
+            self.checkout_wait_ms_max = max(self.checkout_wait_ms_max, wait_ms)
+            self.counters["checkouts"] += 1
+            self.counters["checked_out"] += 1
+
+    def connection_checked_in(self, event):
+        self._add("checked_out", -1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["open_connections"] = stats["connections_created"] - stats["connections_closed"]
+            stats["checkout_wait_ms_avg"] = round(self.checkout_wait_ms_total / stats["checkouts"], 3) \
+                if stats["checkouts"] else 0.0
+            stats["checkout_wait_ms_max"] = round(self.checkout_wait_ms_max, 3)
+        return stats
+
+
+_metrics = {"sync": PoolMetrics(), "async": PoolMetrics()}
+_clients: Dict[str, Any] = {}
+_client_pids: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def _client_options(kind: str) -> Dict[str, Any]:
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_MS,
+        "event_listeners": [_metrics[kind]],
+    }
+
+
+def _get_client(kind: str, factory):
+    client = _clients.get(kind)
+    # Un client pymongo n'est pas réutilisable après un fork : on en recrée un dans l'enfant
+    if client is not None and _client_pids.get(kind) == os.getpid():
+        return client
+    with _lock:
+        client = _clients.get(kind)
+        if client is None or _client_pids.get(kind) != os.getpid():
+            client = factory(MONGODB_URI, **_client_options(kind))
+            _clients[kind] = client
+            _client_pids[kind] = os.getpid()
+            logger.info(f"🔌 Client MongoDB {kind} créé (pool max {MONGO_MAX_POOL_SIZE}).")
+        return client
+
+
+def get_sync_client() -> MongoClient:
+    """Client pymongo partagé (thread-safe)."""
+    return _get_client("sync", MongoClient)
+
+
+def get_async_client():
+    """Client Motor partagé, pour le code asynchrone (interface web)."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return _get_client("async", AsyncIOMotorClient)
+
+
+def get_collection(name: Optional[str] = None, db_name: Optional[str] = None):
+    """Collection du client partagé (par défaut : la collection des annonces)."""
+    return get_sync_client()[db_name or MONGO_DB][name or MONGO_COLLECTION]
+
+
+def get_listings_collection():
+    return get_collection(MONGO_COLLECTION)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Métriques des pools (à exposer dans /health)."""
+    return {
+        kind: {"connected": kind in _clients, "max_pool_size": MONGO_MAX_POOL_SIZE, **metrics.snapshot()}
+        for kind, metrics in _metrics.items()
+    }
+
+
+def close_clients():
+    """Ferme les clients partagés (arrêt de l'application)."""
+    with _lock:
+        for kind, client in list(_clients.items()):
+            if _client_pids.get(kind) == os.getpid():
+                client.close()
+            del _clients[kind]
+            _client_pids.pop(kind, None)
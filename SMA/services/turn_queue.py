@@ -0,0 +1,94 @@
+# services/turn_queue.py - File de traitement des messages entrants, ordonnée par utilisateur
+"""
+Le webhook WhatsApp répond tout de suite à Twilio et confie le tour de conversation à cette file :
+
+- les messages d'un même utilisateur sont traités l'un après l'autre, dans l'ordre d'arrivée
+  (l'historique de conversation n'est jamais modifié par deux tours à la fois) ;
+- les utilisateurs différents sont traités en parallèle, au plus `max_concurrency` tours à la fois ;
+- le code synchrone (graphe d'agents, Twilio, Gemini) tourne dans un pool de threads dédié,
+  de la même taille : la boucle asyncio reste libre pour recevoir les webhooks.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_TURNS = int(os.getenv("WHATSAPP_MAX_CONCURRENT_TURNS", 16))
+MAX_PENDING_PER_USER = int(os.getenv("WHATSAPP_MAX_PENDING_PER_USER", 10))
+
+Job = Callable[..., Awaitable[Any]]
+
+
+class KeyedTaskQueue:
+    """Tâches asyncio ordonnées par clé (numéro de téléphone), concurrence bornée entre clés."""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_TURNS, max_pending_per_key: int = MAX_PENDING_PER_USER):
+        self.max_concurrency = max_concurrency
+        self.max_pending_per_key = max_pending_per_key
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="turn")
+        self._semaphore = None
+        self._pending: Dict[str, Deque[tuple]] = defaultdict(deque)
+        self._workers: Dict[str, asyncio.Task] = {}
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0, "running": 0}
+
+    def submit(self, key: str, job: Job, *args) -> bool:
+        """Ajoute un tour à la file de `key` ; False si l'utilisateur a trop de messages en attente."""
+        pending = self._pending[key]
+        if len(pending) >= self.max_pending_per_key:
+            self.stats["rejected"] += 1
+            logger.warning(f"⚠️ Trop de messages en attente pour {key}, message ignoré.")
+            return False
+        pending.append((job, args))
+        self.stats["accepted"] += 1
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._drain(key))
+        return True
+
+    async def _drain(self, key: str):
+        """Traite les tours d'un utilisateur un par un, puis disparaît quand sa file est vide."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        pending = self._pending[key]
+        try:
+            while pending:
+                job, args = pending[0]
+                async with self._semaphore:
+                    self.stats["running"] += 1
+                    try:
+                        await job(*args)
+                        self.stats["completed"] += 1
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        logger.error(f"❌ Erreur lors du traitement d'un message de {key}: {e}")
+                    finally:
+                        self.stats["running"] -= 1
+                pending.popleft()
+        finally:
+            del self._workers[key]
+            if not pending:
+                self._pending.pop(key, None)
+
+    async def run_sync(self, function: Callable, *args) -> Any:
+        """Exécute du code bloquant dans le pool de threads de la file."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "users_waiting": len(self._workers),
+            "queued": sum(len(pending) for pending in self._pending.values()),
+            "max_concurrency": self.max_concurrency,
+        }
+
+    async def shutdown(self, timeout: float = 30):
+        """Laisse les tours en cours se terminer (au plus `timeout` secondes)."""
+        workers = list(self._workers.values())
+        if workers:
+            _, still_running = await asyncio.wait(workers, timeout=timeout)
+            for task in still_running:
+                task.cancel()
+        self.executor.shutdown(wait=False)
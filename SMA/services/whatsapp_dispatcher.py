@@ -0,0 +1,333 @@
+# services/whatsapp_dispatcher.py - Envoi des notifications WhatsApp en arrière-plan
+"""
+Répartiteur des messages sortants (notifications d'alertes) :
+
+- file persistante dans MongoDB (collection outbound_messages) : rien n'est perdu au redémarrage ;
+- regroupement par destinataire : plusieurs alertes pour un même numéro partent en un seul message ;
+- un seul répartiteur actif pour tous les workers (bail MongoDB) : le seau à jetons
+  (WHATSAPP_MESSAGES_PER_SECOND) est donc bien global et calé sur les limites Twilio ;
+  les autres workers se contentent de mettre en file ;
+- nouvelles tentatives avec attente exponentielle, abandon après WHATSAPP_MAX_ATTEMPTS ;
+- transport interchangeable : Twilio en production, FakeTransport (messages gardés en mémoire)
+  pour les tests et quand Twilio n'est pas configuré.
+
+Les envois tournent dans une tâche asyncio ; les appels Twilio et MongoDB (synchrones) passent
+par des threads : la boucle du webhook n'est jamais bloquée par une rafale d'alertes.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING
+
+from services.alert_service import format_grouped_notifications
+from services.leases import MongoLease
+from services.mongo_pool import get_collection
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "outbound_messages"
+MAX_MESSAGE_LENGTH = 1500  # Limite Twilio : 1600 caractères, on garde une marge
+
+MESSAGES_PER_SECOND = float(os.getenv("WHATSAPP_MESSAGES_PER_SECOND", 10))
+MAX_CONCURRENT_SENDS = int(os.getenv("WHATSAPP_MAX_CONCURRENT_SENDS", 8))
+MAX_ATTEMPTS = int(os.getenv("WHATSAPP_MAX_ATTEMPTS", 5))
+RETRY_BASE_SECONDS = float(os.getenv("WHATSAPP_RETRY_BASE_SECONDS", 5))
+RETRY_MAX_SECONDS = float(os.getenv("WHATSAPP_RETRY_MAX_SECONDS", 900))
+POLL_SECONDS = float(os.getenv("WHATSAPP_OUTBOX_POLL_SECONDS", 5))  # Messages ajoutés par d'autres processus
+SEND_TIMEOUT_SECONDS = float(os.getenv("WHATSAPP_SEND_TIMEOUT_SECONDS", 300))  # Réservation abandonnée au-delà
+LEASE_SECONDS = float(os.getenv("WHATSAPP_DISPATCHER_LEASE_SECONDS", 30))
+BATCH_SIZE = 500
+
+
+def split_message(message: str, max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Découpe un message trop long sur les sauts de ligne, puis brutalement si nécessaire."""
+    if len(message) <= max_length:
+        return [message]
+
+    chunks = []
+    current_chunk = ""
+    for part in message.replace("---", "\n---\n").split("\n"):
+        if len(current_chunk) + len(part) + 1 <= max_length:
+            current_chunk += part + "\n"
+        else:
+            if current_chunk.strip():
+                chunks.append(current_chunk.strip())
+            current_chunk = part + "\n"
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+
+    parts = []
+    for chunk in chunks:
+        while len(chunk) > max_length:
+            parts.append(chunk[:max_length])
+            chunk = chunk[max_length:]
+        if chunk:
+            parts.append(chunk)
+    if len(parts) > 1:
+        parts = [f"({i + 1}/{len(parts)})\n{part}" for i, part in enumerate(parts)]
+    return parts
+
+
+# ==================== TRANSPORTS ====================
+
+class TwilioTransport:
+    """Envoi réel via l'API WhatsApp de Twilio (appel synchrone, exécuté dans un thread)."""
+
+    def __init__(self, client, from_number: str):
+        self.client = client
+        self.from_whatsapp = f"whatsapp:{from_number}"
+
+    def send(self, to_number: str, body: str) -> None:
+        self.client.messages.create(body=body, from_=self.from_whatsapp, to=f"whatsapp:{to_number}")
+
+
+class FakeTransport:
+    """Transport local : garde les messages en mémoire (tests, Twilio non configuré)."""
+
+    def __init__(self, fail_times: int = 0):
+        self.sent: List[Dict[str, str]] = []
+        self.fail_times = fail_times  # Nombre d'échecs simulés avant le premier succès
+        self._lock = threading.Lock()
+
+    def send(self, to_number: str, body: str) -> None:
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise ConnectionError("Échec simulé")
+            self.sent.append({"to": to_number, "body": body})
+        logger.info(f"🤖 SIMULATION ENVOI WHATSAPP à {to_number}: {body[:100]}...")
+
+
+# ==================== LIMITEUR DE DÉBIT ====================
+
+class RateLimiter:
+    """Seau à jetons : `rate` messages par seconde en moyenne, rafales jusqu'à `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# ==================== RÉPARTITEUR ====================
+
+class WhatsAppDispatcher:
+    """File persistante de notifications, vidée en arrière-plan par une tâche asyncio."""
+
+    def __init__(self, transport, messages_per_second: float = MESSAGES_PER_SECOND,
+                 max_concurrent_sends: int = MAX_CONCURRENT_SENDS, collection=None, lease=None):
+        self.transport = transport
+        self.lease = lease or MongoLease("whatsapp_dispatcher", LEASE_SECONDS)
+        self.is_leader = False
+        self.limiter = RateLimiter(messages_per_second)
+        self.max_concurrent_sends = max_concurrent_sends
+        self._collection = collection
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lease_task: Optional[asyncio.Task] = None
+        self.stats = {"sent": 0, "coalesced": 0, "retried": 0, "failed": 0}
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_collection(OUTBOX_COLLECTION)
+            self._collection.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+        return self._collection
+
+    # --- Mise en file (appelable depuis n'importe quel thread) ---
+
+    def enqueue_alerts(self, notifications: List[Dict[str, Any]]) -> int:
+        """Ajoute des notifications d'alertes à la file ; retourne le nombre de messages en file."""
+        if not notifications:
+            return 0
+        now = datetime.utcnow()
+        self.collection.insert_many([
+            {
+                "phone_number": notification["phone_number"],
+                "kind": "alert",
+                "payload": notification,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now,
+            }
+            for notification in notifications
+        ])
+        self.wake_up()
+        return len(notifications)
+
+    def wake_up(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # --- Envoi (appels MongoDB synchrones : exécutés via asyncio.to_thread) ---
+
+    def _recover_stale(self) -> int:
+        """Remet en file les messages réservés par un processus arrêté en cours d'envoi."""
+        deadline = datetime.utcnow() - timedelta(seconds=SEND_TIMEOUT_SECONDS)
+        result = self.collection.update_many(
+            {"status": "sending", "claimed_at": {"$lt": deadline}},
+            {"$set": {"status": "pending"}, "$unset": {"claim": ""}},
+        )
+        if result.modified_count:
+            logger.warning(f"⚠️ {result.modified_count} notification(s) bloquée(s) en envoi remise(s) en file.")
+        return result.modified_count
+
+    def _claim_due(self) -> List[dict]:
+        """Réserve les messages à envoyer (statut 'sending' + jeton de réservation)."""
+        now = datetime.utcnow()
+        due = self.collection.find(
+            {"status": "pending", "next_attempt_at": {"$lte": now}}, {"_id": 1}
+        ).sort("next_attempt_at", ASCENDING).limit(BATCH_SIZE)
+        ids = [doc["_id"] for doc in due]
+        if not ids:
+            return []
+        claim = uuid.uuid4().hex
+        self.collection.update_many(
+            {"_id": {"$in": ids}, "status": "pending"},
+            {"$set": {"status": "sending", "claim": claim, "claimed_at": now}}
+        )
+        return list(self.collection.find({"claim": claim}))
+
+    async def _send_to_recipient(self, phone_number: str, messages: List[dict], semaphore: asyncio.Semaphore):
+        """Un seul message pour toutes les alertes en attente d'un destinataire."""
+        ids = [message["_id"] for message in messages]
+        body = format_grouped_notifications([message["payload"] for message in messages])
+        async with semaphore:
+            try:
+                for part in split_message(body):
+                    await self.limiter.acquire()
+                    await asyncio.to_thread(self.transport.send, phone_number, part)
+            except Exception as e:
+                await asyncio.to_thread(self._reschedule, messages, e)
+                return
+        await asyncio.to_thread(
+            self.collection.update_many,
+            {"_id": {"$in": ids}},
+            {"$set": {"status": "sent", "sent_at": datetime.utcnow()}, "$unset": {"claim": ""}}
+        )
+        self.stats["sent"] += 1
+        self.stats["coalesced"] += len(messages) - 1
+
+    def _reschedule(self, messages: List[dict], error: Exception):
+        """Nouvelle tentative après une attente exponentielle, ou abandon."""
+        attempts = max(message.get("attempts", 0) for message in messages) + 1
+        ids = [message["_id"] for message in messages]
+        if attempts >= MAX_ATTEMPTS:
+            update = {"status": "failed", "last_error": str(error), "attempts": attempts}
+            self.stats["failed"] += 1
+            logger.error(f"❌ Notification abandonnée après {attempts} tentatives : {error}")
+        else:
+            delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+            update = {
+                "status": "pending",
+                "last_error": str(error),
+                "attempts": attempts,
+                "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay),
+            }
+            self.stats["retried"] += 1
+            logger.warning(f"⚠️ Envoi WhatsApp échoué (tentative {attempts}), nouvel essai dans {delay:.0f} s : {error}")
+        self.collection.update_many({"_id": {"$in": ids}}, {"$set": update, "$unset": {"claim": ""}})
+
+    async def run_once(self) -> int:
+        """Envoie tous les messages dus ; retourne le nombre de destinataires traités."""
+        messages = await asyncio.to_thread(self._claim_due)
+        if not messages:
+            return 0
+        by_recipient = defaultdict(list)
+        for message in messages:
+            by_recipient[message["phone_number"]].append(message)
+        semaphore = asyncio.Semaphore(self.max_concurrent_sends)
+        await asyncio.gather(*(
+            self._send_to_recipient(phone_number, recipient_messages, semaphore)
+            for phone_number, recipient_messages in by_recipient.items()
+        ))
+        logger.info(f"📤 {len(messages)} notification(s) envoyée(s) à {len(by_recipient)} destinataire(s).")
+        return len(by_recipient)
+
+    def _next_due_in(self) -> float:
+        """Attente jusqu'au prochain message dû (nouvelle tentative), au plus POLL_SECONDS."""
+        try:
+            pending = list(self.collection.find({"status": "pending"}, {"next_attempt_at": 1})
+                           .sort("next_attempt_at", ASCENDING).limit(1))
+        except Exception:
+            return POLL_SECONDS
+        if not pending:
+            return POLL_SECONDS
+        delay = (pending[0]["next_attempt_at"] - datetime.utcnow()).total_seconds()
+        return min(POLL_SECONDS, max(0.0, delay))
+
+    async def _keep_lease(self):
+        """Prend ou renouvelle le bail toutes les LEASE_SECONDS / 3 secondes."""
+        while True:
+            try:
+                leader = await asyncio.to_thread(self.lease.acquire)
+            except Exception as e:
+                logger.warning(f"⚠️ Bail du répartiteur WhatsApp non renouvelé : {e}")
+                leader = False
+            if leader != self.is_leader:
+                self.is_leader = leader
+                logger.info(f"📤 Répartiteur WhatsApp {'actif' if leader else 'en attente'} ({self.lease.owner}).")
+                if leader:
+                    self._wakeup.set()
+            await asyncio.sleep(self.lease.lease_seconds / 3)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()  # Avant l'envoi : un ajout pendant l'envoi relance un tour
+            timeout = POLL_SECONDS
+            if self.is_leader:
+                try:
+                    await asyncio.to_thread(self._recover_stale)
+                    while self.is_leader and await self.run_once():
+                        pass
+                    timeout = await asyncio.to_thread(self._next_due_in)
+                except Exception as e:
+                    logger.error(f"❌ Erreur du répartiteur WhatsApp : {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Démarre la tâche d'envoi (à appeler depuis la boucle asyncio de l'application)."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._lease_task = asyncio.create_task(self._keep_lease())
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"📤 Répartiteur WhatsApp démarré ({type(self.transport).__name__}, "
+                    f"{self.limiter.rate:g} messages/s pour tous les workers).")
+
+    async def stop(self):
+        for task in (self._task, self._lease_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._lease_task = None
+        if self.is_leader:
+            self.is_leader = False
+            await asyncio.to_thread(self.lease.release)
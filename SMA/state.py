@@ -1,14 +1,15 @@
 # state.py
-import operator
 from typing import TypedDict, Annotated, Sequence, Optional, List, Dict, Any
 
 from langchain_core.messages import BaseMessage
+from langgraph.graph.message import add_messages
 
 class AgentState(TypedDict):
     """
     Représente l'état partagé entre tous les agents du système.
     """
-    messages: Annotated[Sequence[BaseMessage], operator.add]
+    # add_messages : même id -> message remplacé, RemoveMessage -> message retiré (compaction)
+    messages: Annotated[Sequence[BaseMessage], add_messages]
     next_agent: str
     active_property_id: Optional[str] 
     
@@ -17,4 +18,7 @@ class AgentState(TypedDict):
     
     # NOUVEAU: Stocke les derniers résultats de recherche pour sélection par numéro
     # Format: [{"id": "...", "titre": "...", "prix": "...", ...}, ...]
-    last_search_results: Optional[List[Dict[str, Any]]]
\ No newline at end of file
+    last_search_results: Optional[List[Dict[str, Any]]]
+
+    # Résumé des tours sortis de la fenêtre d'historique (voir services/history_compaction.py)
+    history_summary: Optional[str]
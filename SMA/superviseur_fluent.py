@@ -1,18 +1,21 @@
 # superviseur_fluent.py
 import os
 import re
+import threading
 from typing import Literal, Optional
 from dotenv import load_dotenv
 
 # LangChain / LangGraph
-from langchain_openai import ChatOpenAI  
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage
 from pydantic import BaseModel, Field
 
 # Imports des modules modularisés
 from state import AgentState 
+from services.history_compaction import create_history_compactor, with_history
+from services.intent_router import IntentRouter
+from services.llm_registry import chat_model, structured_model
 from agents.agent_recherche import create_search_agent 
 from agents.agent_negociation import create_negotiation_agent
 from agents.agent_juridique import create_droit_agent
@@ -38,11 +41,11 @@ def detect_property_id(text: str) -> Optional[str]:
     match = re.search(r'\b[a-f0-9]{24}\b', text, re.IGNORECASE)
     return match.group(0) if match else None
 
+# Routeur local (règles + classifieur), partagé par tous les tours du processus
+ROUTER = IntentRouter()
+
 def supervisor_node(state: AgentState):
     
-    # 1. Utilisation de GPT-4o pour le routage
-    llm = ChatOpenAI(model="gpt-4o", api_key=OPENAI_API_KEY, temperature=0) 
-
     last_msg = state["messages"][-1].content
     
     # --- 1. INTELLIGENCE RÉFLEXE (Détection d'ID) ---
@@ -60,7 +63,7 @@ def supervisor_node(state: AgentState):
         else:
             return {"next_agent": "GENERAL_CHAT", "messages": [HumanMessage(content=state["delegation_query"])]}
             
-    # --- 3. INTELLIGENCE SÉMANTIQUE (Routage LLM Classique) ---
+    # --- 3. ROUTAGE LOCAL (règles ; classifieur en mode active), sinon LLM ---
     system_prompt = """Tu es le routeur d'une agence immobilière IA. Ton rôle est UNIQUEMENT de diriger le client.
 
     RÈGLES DE ROUTAGE :
@@ -70,10 +73,11 @@ def supervisor_node(state: AgentState):
     4. Salutations simples, blabla -> 'GENERAL_CHAT'.
     """
     
-    router = llm.with_structured_output(RouteResponse)
-    decision = router.invoke([SystemMessage(content=system_prompt)] + state["messages"])
-    
-    return {"next_agent": decision.next}
+    def llm_route() -> str:
+        router = structured_model("router", RouteResponse, model="gpt-4o", temperature=0, api_key=OPENAI_API_KEY)
+        return router.invoke(with_history(system_prompt, state)).next
+
+    return {"next_agent": ROUTER.route(str(last_msg), state, fallback=llm_route)}
 
 # ==================== 2. CONSTRUCTION DU GRAPHE FINAL ====================
 
@@ -86,6 +90,7 @@ def build_fluent_graph():
     droit_node, droit_tools = create_droit_agent(OPENAI_API_KEY)
 
     # Ajout des noeuds
+    workflow.add_node("compact_history", create_history_compactor(OPENAI_API_KEY))
     workflow.add_node("supervisor", supervisor_node)
     workflow.add_node("search_agent", search_node)
     workflow.add_node("negotiation_agent", negot_node)
@@ -93,9 +98,6 @@ def build_fluent_graph():
     
     # NOUVEAU: Agent Chat Général avec personnalité DomusIA
     def general_chat_node(state: AgentState):
-        # Utilisation de GPT-4o
-        llm = ChatOpenAI(model="gpt-4o", api_key=OPENAI_API_KEY, temperature=0.5) 
-        
         system_prompt = """Tu es DomusIA 🏠, l'assistant immobilier IA le plus cool du Maroc !
         
 🎯 TES TALENTS :
@@ -110,7 +112,9 @@ def build_fluent_graph():
 
 Exemple : "Hey ! 👋 Je suis DomusIA. Je peux t'aider à trouver, négocier ou comprendre les lois immobilières. Que veux-tu faire ?"
 """
-        response = llm.invoke([SystemMessage(content=system_prompt)] + state["messages"])
+        # GPT-4o, construit une seule fois par processus (services/llm_registry.py)
+        general_llm = chat_model("gpt-4o", temperature=0.5, api_key=OPENAI_API_KEY)
+        response = general_llm.invoke(with_history(system_prompt, state))
         return {"messages": [response]}
         
     workflow.add_node("general_chat", general_chat_node)
@@ -120,7 +124,9 @@ Exemple : "Hey ! 👋 Je suis DomusIA. Je peux t'aider à trouver, négocier ou
     workflow.add_node("negotiation_tools", ToolNode(negot_tools))
     workflow.add_node("droit_tools", ToolNode(droit_tools)) 
 
-    workflow.set_entry_point("supervisor")
+    # Historique borné avant chaque tour, puis routage
+    workflow.set_entry_point("compact_history")
+    workflow.add_edge("compact_history", "supervisor")
 
     workflow.add_conditional_edges(
         "supervisor",
@@ -148,4 +154,17 @@ Exemple : "Hey ! 👋 Je suis DomusIA. Je peux t'aider à trouver, négocier ou
     
     workflow.add_edge("general_chat", END)
     
-    return workflow.compile()
\ No newline at end of file
+    return workflow.compile()
+
+
+_compiled_graph = None
+_graph_lock = threading.Lock()
+
+def get_compiled_graph():
+    """Graphe compilé une seule fois par processus, réutilisé par tous les tours."""
+    global _compiled_graph
+    if _compiled_graph is None:
+        with _graph_lock:
+            if _compiled_graph is None:
+                _compiled_graph = build_fluent_graph()
+    return _compiled_graph
\ No newline at end of file
@@ -8,19 +8,12 @@ from dotenv import load_dotenv
 dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "..", ".env")
 load_dotenv(dotenv_path)
 
+# Connexion et pool partagés avec les outils des agents (services/mongo_pool.py)
+from services.mongo_pool import close_clients, get_async_client
+
 # Configuration MongoDB
-MONGO_USER = os.getenv("MONGO_USER", "")
-MONGO_PASSWORD = os.getenv("MONGO_PASSWORD", "")
-MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
-MONGO_PORT = os.getenv("MONGO_PORT", "27017")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "real_estate_db")
 
-# Construire l'URL de connexion avec ou sans authentification
-if MONGO_USER and MONGO_PASSWORD:
-    MONGODB_URL = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
-else:
-    MONGODB_URL = f"mongodb://{MONGO_HOST}:{MONGO_PORT}"
-
 
 class Database:
     """Singleton pour la connexion MongoDB"""
@@ -31,7 +24,7 @@ class Database:
     async def connect(cls):
         """Établir la connexion à MongoDB"""
         if cls.client is None:
-            cls.client = AsyncIOMotorClient(MONGODB_URL)
+            cls.client = get_async_client()
             cls.db = cls.client[MONGODB_DB_NAME]
             # Créer les index
             await cls._create_indexes()
@@ -41,7 +34,7 @@ class Database:
     async def disconnect(cls):
         """Fermer la connexion MongoDB"""
         if cls.client:
-            cls.client.close()
+            close_clients()  # Clients Motor et pymongo partagés
             cls.client = None
             cls.db = None
             print("🔌 Déconnexion MongoDB")
@@ -16,6 +16,9 @@ from dotenv import load_dotenv
 
 # Imports locaux
 from web.database import Database
+from services.mongo_pool import get_listings_collection, pool_stats
+from db.listing_events import publish_listings_changed
+from db.normalize import normalize_listing
 from web.models import UserCreate, UserLogin, Token, SubscriptionPlan, UserRole
 from web.services.auth_service import create_access_token, decode_access_token
 from web.services.user_service import (
@@ -67,6 +70,12 @@ async def shutdown_event():
     await Database.disconnect()
 
 
+@app.get("/health")
+async def health_check():
+    """Vérification de l'état du service (avec les métriques des pools MongoDB)"""
+    return {"status": "ok", "mongo_pools": pool_stats()}
+
+
 # ==================== DÉPENDANCES ====================
 
 async def get_current_user(request: Request):
@@ -497,7 +506,6 @@ async def submit_property_submit(
 ):
     """Traitement de la soumission d'un bien avec upload d'images"""
     from datetime import datetime
-    from pymongo import MongoClient
     from fastapi import UploadFile, File
     import uuid
     import shutil
@@ -506,19 +514,6 @@ async def submit_property_submit(
     if not user:
         return RedirectResponse(url="/login", status_code=303)
     
-    # Configuration MongoDB
-    MONGO_USER = os.getenv("MONGO_USER")
-    MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
-    MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
-    MONGO_PORT = os.getenv("MONGO_PORT", "27017")
-    MONGO_DB = os.getenv("MONGO_DB", "listings")
-    MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "listings")
-    
-    if MONGO_USER and MONGO_PASSWORD:
-        MONGODB_URI = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
-    else:
-        MONGODB_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
-    
     try:
         # Traiter les fichiers uploadés
         form = await request.form()
@@ -546,9 +541,7 @@ async def submit_property_submit(
                     image_url = f"/static/uploads/properties/{unique_name}"
                     images_list.append(image_url)
         
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        db = client[MONGO_DB]
-        collection = db[MONGO_COLLECTION]
+        collection = get_listings_collection()
         
         # Préparer le document
         location = f"{city}, {adresse}" if adresse else city
@@ -578,11 +571,13 @@ async def submit_property_submit(
             "submitted_by": str(user.id),
             "submitted_by_email": user.email
         }
+        property_doc["first_seen_at"] = property_doc["scraped_at"]
+        property_doc.update(normalize_listing(property_doc))  # Champs typés, comme à l'import
         
         # Insérer dans MongoDB
         result = collection.insert_one(property_doc)
-        
-        client.close()
+        # Les alertes correspondantes partent tout de suite (services/alert_events.py)
+        publish_listings_changed(collection.database, ids=[result.inserted_id], source="submit-property")
         
         return templates.TemplateResponse("submit_property.html", {
             "request": request,
@@ -617,8 +612,6 @@ async def admin_dashboard(request: Request):
     if not user or user.role != UserRole.ADMIN:
         return RedirectResponse(url="/login", status_code=303)
     
-    from pymongo import MongoClient
-    
     # Statistiques utilisateurs
     stats = await count_users_by_role()
     
@@ -626,22 +619,8 @@ async def admin_dashboard(request: Request):
     recent_users = await get_all_users(limit=10)
     
     # Compter les biens
-    MONGO_USER = os.getenv("MONGO_USER")
-    MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
-    MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
-    MONGO_PORT = os.getenv("MONGO_PORT", "27017")
-    MONGO_DB = os.getenv("MONGO_DB", "listings")
-    MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "listings")
-    
-    if MONGO_USER and MONGO_PASSWORD:
-        MONGODB_URI = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
-    else:
-        MONGODB_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
-    
     try:
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        properties_count = client[MONGO_DB][MONGO_COLLECTION].count_documents({})
-        client.close()
+        properties_count = get_listings_collection().count_documents({})
     except:
         properties_count = 0
     
@@ -700,24 +679,8 @@ async def owner_dashboard(request: Request):
         return RedirectResponse(url="/login", status_code=303)
     
     # Récupérer les biens de ce propriétaire
-    from pymongo import MongoClient
-    
-    MONGO_USER = os.getenv("MONGO_USER")
-    MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
-    MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
-    MONGO_PORT = os.getenv("MONGO_PORT", "27017")
-    MONGO_DB = os.getenv("MONGO_DB", "listings")
-    MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "listings")
-    
-    if MONGO_USER and MONGO_PASSWORD:
-        MONGODB_URI = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
-    else:
-        MONGODB_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
-    
     try:
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        properties = list(client[MONGO_DB][MONGO_COLLECTION].find({"submitted_by": str(user.id)}))
-        client.close()
+        properties = list(get_listings_collection().find({"submitted_by": str(user.id)}))
     except:
         properties = []
     
@@ -732,33 +695,17 @@ async def owner_dashboard(request: Request):
 async def owner_delete_property(request: Request, property_id: str):
     """Supprimer un bien"""
     from bson import ObjectId
-    from pymongo import MongoClient
-    
     user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
     
-    MONGO_USER = os.getenv("MONGO_USER")
-    MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
-    MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
-    MONGO_PORT = os.getenv("MONGO_PORT", "27017")
-    MONGO_DB = os.getenv("MONGO_DB", "listings")
-    MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "listings")
-    
-    if MONGO_USER and MONGO_PASSWORD:
-        MONGODB_URI = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/?authSource=admin"
-    else:
-        MONGODB_URI = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
-    
     try:
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
         # Supprimer seulement si c'est le propriétaire OU si c'est un admin
         query = {"_id": ObjectId(property_id)}
         if user.role != UserRole.ADMIN:
             query["submitted_by"] = str(user.id)
         
-        client[MONGO_DB][MONGO_COLLECTION].delete_one(query)
-        client.close()
+        get_listings_collection().delete_one(query)
     except:
         pass
     
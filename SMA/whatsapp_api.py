@@ -1,11 +1,12 @@
 # whatsapp_api.py
 from fastapi import FastAPI, Form, Response
 from pydantic import BaseModel
+import asyncio
 import logging
 import os
 import httpx
 import base64
-from typing import Dict, Any, Optional, List
+from typing import Optional, List
 from dotenv import load_dotenv
 
 # NOUVEAUX IMPORTS TWILIO
@@ -15,8 +16,14 @@ from twilio.rest import Client
 import google.generativeai as genai
 
 # Import de votre graphe d'agents compilé et de l'état
-from superviseur_fluent import build_fluent_graph
+from superviseur_fluent import ROUTER, get_compiled_graph
 from state import AgentState
+from services.mongo_pool import close_clients, pool_stats
+from services.llm_registry import close_llm_clients, registry_stats, warm_up
+from services.alert_events import AlertEventConsumer
+from services.turn_queue import KeyedTaskQueue
+from services.conversation_store import create_conversation_store
+from services.whatsapp_dispatcher import FakeTransport, TwilioTransport, WhatsAppDispatcher, split_message
 from langchain_core.messages import HumanMessage, AIMessage
 
 # Charger les variables d'environnement (nécessaire pour Twilio et Gemini)
@@ -62,17 +69,20 @@ else:
     logger.warning("⚠️ GOOGLE_API_KEY manquant. L'analyse d'images sera désactivée.")
 
 
-# Initialisation du graphe (sera fait au démarrage de l'app)
+# Graphe compilé une fois par processus (modèles et clients LLM partagés par tous les tours)
 try:
-    SMA_APP = build_fluent_graph()
+    SMA_APP = get_compiled_graph()
     logger.info("✅ Graphe d'agents (SMA) compilé.")
 except Exception as e:
     logger.error(f"❌ Erreur critique lors de la compilation du SMA: {e}")
     SMA_APP = None
 
-# Dictionnaire pour stocker l'historique de conversation par utilisateur (Numéro de téléphone)
-# UTILISER REDIS EN PRODUCTION pour la persistance
-CHAT_HISTORY_STORE: Dict[str, Dict[str, Any]] = {}
+# État des conversations par utilisateur (numéro de téléphone) : LRU + TTL en mémoire,
+# ou MongoDB partagé entre les workers (CONVERSATION_STORE=mongo)
+CONVERSATIONS = create_conversation_store()
+
+# Tours de conversation traités en arrière-plan : ordre garanti par utilisateur, utilisateurs en parallèle
+TURN_QUEUE = KeyedTaskQueue()
 
 # Modèle pour l'état initial
 INITIAL_STATE: AgentState = {
@@ -80,7 +90,8 @@ INITIAL_STATE: AgentState = {
     "active_property_id": None,
     "next_agent": None,
     "delegation_query": None,
-    "last_search_results": None
+    "last_search_results": None,
+    "history_summary": None
 }
 
 # Message pour les utilisateurs non abonnés
@@ -141,8 +152,6 @@ def send_whatsapp_response(to_number: str, message: str) -> None:
     Envoie la réponse de l'IA à l'utilisateur via l'API WhatsApp de Twilio.
     Gère les messages longs en les découpant (limite Twilio: 1600 caractères).
     """
-    MAX_LENGTH = 1500  # Garde une marge de sécurité
-    
     if not TWILIO_CLIENT or not TWILIO_WHATSAPP_NUMBER:
         # Fallback si Twilio n'est pas configuré (mode simulation)
         logger.info(f"🤖 SIMULATION ENVOI WHATSAPP à {to_number}: {message[:100]}...")
@@ -151,45 +160,12 @@ def send_whatsapp_response(to_number: str, message: str) -> None:
     from_whatsapp = f'whatsapp:{TWILIO_WHATSAPP_NUMBER}'
     to_whatsapp = f'whatsapp:{to_number}'
     
-    # Découper le message si trop long
-    if len(message) <= MAX_LENGTH:
-        messages_to_send = [message]
-    else:
-        # Découper intelligemment (sur les sauts de ligne ou ----)
-        messages_to_send = []
-        current_chunk = ""
-        
-        # Essayer de couper sur les séparateurs naturels
-        parts = message.replace("---", "\n---\n").split("\n")
-        
-        for part in parts:
-            if len(current_chunk) + len(part) + 1 <= MAX_LENGTH:
-                current_chunk += part + "\n"
-            else:
-                if current_chunk.strip():
-                    messages_to_send.append(current_chunk.strip())
-                current_chunk = part + "\n"
-        
-        if current_chunk.strip():
-            messages_to_send.append(current_chunk.strip())
-        
-        # Si toujours un seul message trop long, couper brutalement
-        final_messages = []
-        for msg in messages_to_send:
-            while len(msg) > MAX_LENGTH:
-                final_messages.append(msg[:MAX_LENGTH])
-                msg = msg[MAX_LENGTH:]
-            if msg:
-                final_messages.append(msg)
-        messages_to_send = final_messages
+    # Découper le message si trop long (sur les sauts de ligne ou ----)
+    messages_to_send = split_message(message)
     
     # Envoyer chaque partie
     for i, msg_part in enumerate(messages_to_send):
         try:
-            # Ajouter indicateur de partie si plusieurs messages
-            if len(messages_to_send) > 1:
-                msg_part = f"({i+1}/{len(messages_to_send)})\n{msg_part}"
-            
             TWILIO_CLIENT.messages.create(
                 body=msg_part,
                 from_=from_whatsapp,
@@ -300,7 +276,7 @@ Si ce n'est PAS une image de bien immobilier, dis simplement :
 """
         
         # Appel à Gemini Vision
-        response = VISION_MODEL.generate_content([analysis_prompt, image_part])
+        response = await TURN_QUEUE.run_sync(VISION_MODEL.generate_content, [analysis_prompt, image_part])
         
         return response.text
         
@@ -321,7 +297,7 @@ async def whatsapp_webhook(
 ):
     """
     Webhook pour la réception des messages entrants de WhatsApp (via Twilio).
-    Vérifie l'abonnement avant de traiter les messages.
+    Répond immédiatement ; l'abonnement est vérifié et le message traité par handle_incoming_message.
     """
     if not SMA_APP:
          return Response(content="SMA non initialisé.", status_code=500)
@@ -329,8 +305,91 @@ async def whatsapp_webhook(
     # Le numéro de l'utilisateur est le numéro complet de 'From' (ex: whatsapp:+212...)
     # On retire le préfixe 'whatsapp:' pour l'utiliser comme clé
     user_phone = From.replace("whatsapp:", "") 
-    user_input = Body
     
+    # Accusé de réception immédiat : le tour est traité en arrière-plan, dans l'ordre des messages
+    # de cet utilisateur, en parallèle des autres conversations
+    TURN_QUEUE.submit(user_phone, handle_incoming_message, user_phone, Body, NumMedia, MediaUrl0, MediaContentType0)
+    
+    # Twilio/Meta s'attend à une réponse HTTP 200/204 rapide
+    return Response(status_code=200)
+
+
+async def reply(user_phone: str, message: str) -> None:
+    """Envoi de la réponse depuis un thread : l'appel Twilio ne bloque pas la boucle asyncio."""
+    await TURN_QUEUE.run_sync(send_whatsapp_response, user_phone, message)
+
+
+def run_turn(user_phone: str, user_input: str) -> str:
+    """
+    Exécute un tour du graphe d'agents pour cet utilisateur et enregistre le nouvel état.
+    Le verrou garantit un seul tour à la fois par utilisateur, même entre plusieurs workers.
+    """
+    with CONVERSATIONS.lock(user_phone):
+        # --- 1. Récupération de l'historique / État ---
+        current_state = CONVERSATIONS.load(user_phone) or INITIAL_STATE.copy()
+        
+        # Ajouter le nouveau message de l'utilisateur à l'historique
+        user_message = HumanMessage(content=user_input)
+        current_state["messages"] = list(current_state["messages"]) + [user_message]
+
+        # --- 2. Exécution du Graphe d'Agents ---
+        # Le graphe commence toujours au superviseur
+        result = SMA_APP.invoke(current_state, config={"recursion_limit": 30})
+        
+        # Extraire la réponse finale - chercher le dernier message AI avec du contenu textuel
+        ai_response = None
+        
+        # Parcourir les messages à l'envers pour trouver une vraie réponse
+        for msg in reversed(result["messages"]):
+            # Ignorer les messages ToolMessage (résultats d'outils)
+            if msg.__class__.__name__ == 'ToolMessage':
+                continue
+            # Ignorer les messages Human
+            if msg.__class__.__name__ == 'HumanMessage':
+                continue
+            
+            # Vérifier si c'est un message AI avec du contenu textuel
+            if hasattr(msg, 'content') and msg.content:
+                content = msg.content
+            
+                # Ignorer si c'est juste un tool call sans contenu
+                if hasattr(msg, 'tool_calls') and msg.tool_calls and not content:
+                    continue
+            
+                # Extraire le texte proprement - gérer les formats de réponse Gemini
+                extracted_text = extract_text_from_content(content)
+            
+                if extracted_text and len(extracted_text) > 5:
+                    ai_response = extracted_text
+                    break
+        
+        # Si toujours pas de réponse, essayer de formater le dernier message
+        if not ai_response:
+            last_msg = result["messages"][-1]
+            if hasattr(last_msg, 'content') and last_msg.content:
+                ai_response = extract_text_from_content(last_msg.content)
+            if not ai_response:
+                # Fallback : message d'erreur générique
+                ai_response = "Hmm 🤔 Je n'ai pas pu traiter ta demande. Peux-tu reformuler ?"
+        
+        logger.info(f"📤 Réponse AI: {ai_response[:100]}...")
+        
+        # --- 3. Mise à jour de l'état ---
+        new_state = {
+             k: result[k] for k in result if k in INITIAL_STATE
+        }
+        CONVERSATIONS.save(user_phone, new_state)
+        return ai_response
+
+
+async def handle_incoming_message(
+    user_phone: str,
+    user_input: str,
+    NumMedia: int,
+    MediaUrl0: Optional[str],
+    MediaContentType0: Optional[str]
+) -> None:
+    """Traitement complet d'un message entrant (abonnement, image, graphe d'agents, réponse)."""
     logger.info(f"🟢 Message reçu de {user_phone}: {user_input}")
     
     # ==================== VÉRIFICATION D'ABONNEMENT ====================
@@ -359,8 +418,8 @@ Renouvelez votre abonnement pour continuer à utiliser l'assistant immobilier IA
             # Service indisponible ou autre erreur
             message = "⚠️ Service temporairement indisponible. Veuillez réessayer plus tard."
         
-        send_whatsapp_response(user_phone, message)
-        return Response(status_code=200)
+        await reply(user_phone, message)
+        return
     
     # ==================== TRAITEMENT NORMAL (UTILISATEUR AUTORISÉ) ====================
     user_name = subscription_check.get("user_name", "")
@@ -384,84 +443,27 @@ Renouvelez votre abonnement pour continuer à utiliser l'assistant immobilier IA
             logger.info(f"👁 Analyse image: {image_analysis[:100]}...")
         else:
             # Média non supporté
-            send_whatsapp_response(user_phone, "⚠️ Je ne peux analyser que les images. Envoie-moi une photo de bien immobilier !")
-            return Response(status_code=200)
+            await reply(user_phone, "⚠️ Je ne peux analyser que les images. Envoie-moi une photo de bien immobilier !")
+            return
     
     # Si le message est vide et pas d'image
     if not user_input or not user_input.strip():
-        send_whatsapp_response(user_phone, "Hey ! 👋 Tu voulais me dire quelque chose ? Envoie-moi un message ou une photo de bien !")
-        return Response(status_code=200)
-    
-    # --- 1. Récupération de l'historique / État ---
-    current_state = CHAT_HISTORY_STORE.get(user_phone, INITIAL_STATE.copy())
+        await reply(user_phone, "Hey ! 👋 Tu voulais me dire quelque chose ? Envoie-moi un message ou une photo de bien !")
+        return
     
-    # Ajouter le nouveau message de l'utilisateur à l'historique
-    user_message = HumanMessage(content=user_input)
-    current_state["messages"] = current_state["messages"] + [user_message]
-
-    # --- 2. Exécution du Graphe d'Agents ---
+    # --- Tour de conversation (historique, graphe d'agents) dans le pool de threads de la file ---
     try:
-        # Le graphe commence toujours au superviseur
-        result = SMA_APP.invoke(current_state, config={"recursion_limit": 30})
-        
-        # Extraire la réponse finale - chercher le dernier message AI avec du contenu textuel
-        ai_response = None
-        
-        # Parcourir les messages à l'envers pour trouver une vraie réponse
-        for msg in reversed(result["messages"]):
-            # Ignorer les messages ToolMessage (résultats d'outils)
-            if msg.__class__.__name__ == 'ToolMessage':
-                continue
-            # Ignorer les messages Human
-            if msg.__class__.__name__ == 'HumanMessage':
-                continue
-                
-            # Vérifier si c'est un message AI avec du contenu textuel
-            if hasattr(msg, 'content') and msg.content:
-                content = msg.content
-                
-                # Ignorer si c'est juste un tool call sans contenu
-                if hasattr(msg, 'tool_calls') and msg.tool_calls and not content:
-                    continue
-                
-                # Extraire le texte proprement - gérer les formats de réponse Gemini
-                extracted_text = extract_text_from_content(content)
-                
-                if extracted_text and len(extracted_text) > 5:
-                    ai_response = extracted_text
-                    break
-        
-        # Si toujours pas de réponse, essayer de formater le dernier message
-        if not ai_response:
-            last_msg = result["messages"][-1]
-            if hasattr(last_msg, 'content') and last_msg.content:
-                ai_response = extract_text_from_content(last_msg.content)
-            if not ai_response:
-                # Fallback : message d'erreur générique
-                ai_response = "Hmm 🤔 Je n'ai pas pu traiter ta demande. Peux-tu reformuler ?"
-        
-        logger.info(f"📤 Réponse AI: {ai_response[:100]}...")
-        
-        # --- 3. Mise à jour de l'état et réponse ---
-        
-        # Sauvegarder le nouvel historique/état
-        new_state = {
-             k: result[k] for k in result if k in INITIAL_STATE
-        }
-        CHAT_HISTORY_STORE[user_phone] = new_state
+        ai_response = await TURN_QUEUE.run_sync(run_turn, user_phone, user_input)
 
         # Envoi de la réponse à WhatsApp
-        send_whatsapp_response(user_phone, ai_response)
+        await reply(user_phone, ai_response)
         
     except Exception as e:
         logger.error(f"❌ Erreur lors de l'exécution du SMA pour {user_phone}: {e}")
         import traceback
         logger.error(traceback.format_exc())
         error_message = "Désolé, une erreur interne est survenue. Peux-tu réessayer ?"
-        send_whatsapp_response(user_phone, error_message)
-
-    # Twilio/Meta s'attend à une réponse HTTP 200/204 rapide
-    return Response(status_code=200)
+        await reply(user_phone, error_message)
 
 
 # ==================== ENDPOINT DE SANTÉ ====================
@@ -472,10 +474,47 @@ async def health_check():
     return {
         "status": "ok",
         "sma_ready": SMA_APP is not None,
-        "twilio_configured": TWILIO_CLIENT is not None
+        "twilio_configured": TWILIO_CLIENT is not None,
+        "mongo_pools": pool_stats(),
+        "alert_dispatcher": {**ALERT_DISPATCHER.stats, "leader": ALERT_DISPATCHER.is_leader},
+        "turn_queue": TURN_QUEUE.snapshot(),
+        "conversations": CONVERSATIONS.stats(),
+        "router": ROUTER.snapshot(),
+        "llm": registry_stats()
     }
 
 
+# ==================== ALERTES ====================
+
+# Notifications envoyées en arrière-plan : file MongoDB, regroupement par numéro, débit limité
+if TWILIO_CLIENT:
+    ALERT_DISPATCHER = WhatsAppDispatcher(TwilioTransport(TWILIO_CLIENT, TWILIO_WHATSAPP_NUMBER))
+else:
+    ALERT_DISPATCHER = WhatsAppDispatcher(FakeTransport())  # Mode simulation
+
+# Démarré dans chaque worker ; seul le détenteur du bail lit les événements
+ALERT_CONSUMER = AlertEventConsumer(ALERT_DISPATCHER.enqueue_alerts)
+
+
+@app.on_event("startup")
+async def startup_event():
+    # Les alertes partent quelques secondes après l'import d'un bien correspondant
+    ALERT_DISPATCHER.start()
+    ALERT_CONSUMER.start()
+    # Connexions OpenAI ouvertes avant le premier message (TLS payé au démarrage)
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    ALERT_CONSUMER.stop()
+    await TURN_QUEUE.shutdown()
+    CONVERSATIONS.close()  # Écritures différées terminées avant l'arrêt
+    await ALERT_DISPATCHER.stop()
+    close_clients()
+    close_llm_clients()
+
+
 # --- Exécution ---
 if __name__ == "__main__":
     import uvicorn
@@ -1,31 +1,190 @@
+# data_processing.py
+"""
+Fusion des fichiers d'annonces de data/ en un seul fichier, sans doublons.
+
+- Fusion k-voies : les k fichiers sources sont ouverts ensemble et lus par blocs, à tour
+  de rôle ; aucun fichier n'est chargé entièrement en mémoire.
+- Dédoublonnage sur l'URL avec un ensemble d'empreintes xxh3 64 bits (un entier par annonce
+  unique au lieu de l'URL complète) : la mémoire dépend du nombre d'annonces uniques,
+  pas de la taille des fichiers. La première occurrence d'une URL est conservée.
+- Lecture parallèle optionnelle (--workers) : décompression et décodage dans des threads,
+  avec des files bornées.
+- Sortie JSONL (défaut), JSONL zstd ou tableau JSON compact.
+
+Usage :
+    python data_processing.py
+    python data_processing.py --workers 4 --format jsonl --compression zstd
+"""
+import argparse
 import os
-import json
-
-# Dossier contenant les fichiers JSON
-data_dir = "data"
-combined_filename = os.path.join(data_dir, "combined_data.json")
-
-all_data = []
-
-# Parcours de tous les fichiers dans le dossier data/
-for filename in os.listdir(data_dir):
-    if filename.endswith(".json") and filename != "combined_data.json":  # éviter le fichier combiné lui-même
-        file_path = os.path.join(data_dir, filename)
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    all_data.extend(data)  # ajoute toutes les annonces
-                else:
-                    print(f"⚠️ Le fichier {filename} n'est pas une liste JSON")
-        except Exception as e:
-            print(f"❌ Erreur lors de la lecture de {filename} : {e}")
-
-# Sauvegarde du fichier combiné
-try:
-    with open(combined_filename, "w", encoding="utf-8") as f:
-        json.dump(all_data, f, indent=4, ensure_ascii=False)
-    print(f"✅ Tous les fichiers JSON ont été combinés dans '{combined_filename}'")
-    print(f"Nombre total d'annonces : {len(all_data)}")
-except Exception as e:
-    print(f"❌ Erreur lors de l'écriture du fichier combiné : {e}")
+import queue
+import threading
+import time
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import xxhash
+
+from scraping.output import JsonArrayWriter, RecordWriter, is_records_file, iter_records
+
+DATA_DIR = "data"
+COMBINED_PREFIX = "combined_data"
+OUTPUT_FORMATS = ("jsonl", "json")
+CHUNK_RECORDS = 1000  # Annonces lues d'un coup dans une source avant de passer à la suivante
+
+_END = object()  # Fin d'une source (lecture parallèle)
+
+
+def list_sources(data_dir: str = DATA_DIR) -> List[str]:
+    """Fichiers d'annonces à fusionner (sauf le fichier combiné lui-même)."""
+    return [
+        os.path.join(data_dir, filename)
+        for filename in sorted(os.listdir(data_dir))
+        if is_records_file(filename) and not filename.startswith(COMBINED_PREFIX)
+    ]
+
+
+def _read_chunks(path: str, chunk_records: int) -> Iterator[List[dict]]:
+    records = iter_records(path)
+    while True:
+        chunk = list(islice(records, chunk_records))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _round_robin(sources: List[str], chunk_records: int, errors: Dict[str, str]) -> Iterator[Tuple[str, List[dict]]]:
+    """Fusion k-voies séquentielle : un bloc de chaque source à tour de rôle."""
+    readers = [(path, _read_chunks(path, chunk_records)) for path in sources]
+    while readers:
+        still_open = []
+        for path, reader in readers:
+            try:
+                chunk = next(reader, None)
+            except Exception as e:
+                errors[path] = str(e)
+                continue
+            if chunk is not None:
+                yield path, chunk
+                still_open.append((path, reader))
+        readers = still_open
+
+
+def _parallel(sources: List[str], chunk_records: int, workers: int,
+              errors: Dict[str, str]) -> Iterator[Tuple[str, List[dict]]]:
+    """Fusion k-voies parallèle : `workers` threads lisent les sources dans une file bornée."""
+    chunks: queue.Queue = queue.Queue(maxsize=workers * 2)
+    todo: queue.Queue = queue.Queue()
+    for path in sources:
+        todo.put(path)
+
+    def _reader():
+        while True:
+            try:
+                path = todo.get_nowait()
+            except queue.Empty:
+                chunks.put(_END)
+                return
+            try:
+                for chunk in _read_chunks(path, chunk_records):
+                    chunks.put((path, chunk))
+            except Exception as e:
+                errors[path] = str(e)
+
+    threads = [threading.Thread(target=_reader, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    finished = 0
+    while finished < len(threads):
+        item = chunks.get()
+        if item is _END:
+            finished += 1
+        else:
+            yield item
+
+
+def merge_sources(sources: List[str], output_path: str, output_format: str = "jsonl",
+                  compression: Optional[str] = None, workers: int = 0,
+                  chunk_records: int = CHUNK_RECORDS) -> dict:
+    """Fusionne et dédoublonne les sources ; retourne les compteurs de la fusion."""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Format inconnu : {output_format}. Formats disponibles : {', '.join(OUTPUT_FORMATS)}")
+    if output_format == "json":
+        writer = JsonArrayWriter(output_path)
+    else:
+        writer = RecordWriter(output_path, compression=compression)
+
+    seen = set()  # Empreintes xxh3 64 bits des URLs déjà écrites
+    errors: Dict[str, str] = {}
+    per_source = {os.path.basename(path): 0 for path in sources}
+    read = duplicates = without_url = 0
+    start = time.monotonic()
+
+    if workers > 0:
+        chunks = _parallel(sources, chunk_records, workers, errors)
+    else:
+        chunks = _round_robin(sources, chunk_records, errors)
+    with writer:
+        for path, chunk in chunks:
+            per_source[os.path.basename(path)] += len(chunk)
+            read += len(chunk)
+            unique = []
+            for record in chunk:
+                url = record.get("url")
+                if not url:
+                    without_url += 1  # Impossible à dédoublonner : gardée telle quelle
+                    unique.append(record)
+                    continue
+                digest = xxhash.xxh3_64_intdigest(url.encode("utf-8"))
+                if digest in seen:
+                    duplicates += 1
+                    continue
+                seen.add(digest)
+                unique.append(record)
+            writer.write_many(unique)
+
+    return {
+        "path": writer.path,
+        "read": read,
+        "written": writer.count,
+        "duplicates": duplicates,
+        "without_url": without_url,
+        "per_source": per_source,
+        "errors": errors,
+        "seconds": round(time.monotonic() - start, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fusionne et dédoublonne les fichiers d'annonces de data/.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Dossier des fichiers d'annonces (défaut : data)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="jsonl",
+                        help="jsonl (défaut) ou tableau JSON compact")
+    parser.add_argument("--compression", choices=("zstd",), help="Compresse la sortie JSONL en zstd")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Threads de lecture des sources (défaut : 0, lecture séquentielle)")
+    args = parser.parse_args(argv)
+
+    output_path = os.path.join(args.data_dir, f"{COMBINED_PREFIX}.{args.format}")
+    sources = list_sources(args.data_dir)
+    try:
+        result = merge_sources(sources, output_path, args.format, args.compression, args.workers)
+    except Exception as e:
+        print(f"❌ Erreur lors de l'écriture du fichier combiné : {e}")
+        return
+
+    # Un ancien fichier combiné dans un autre format serait importé à la place du nouveau
+    for filename in os.listdir(args.data_dir):
+        path = os.path.join(args.data_dir, filename)
+        if filename.startswith(COMBINED_PREFIX) and is_records_file(filename) and path != result["path"]:
+            os.remove(path)
+
+    for path, error in result["errors"].items():
+        print(f"❌ Erreur lors de la lecture de {os.path.basename(path)} : {error}")
+    print(f"✅ {len(sources)} fichiers d'annonces combinés dans '{result['path']}' en {result['seconds']} s")
+    print(f"Annonces lues : {result['read']} | uniques : {result['written']} | "
+          f"doublons ignorés : {result['duplicates']} | sans URL : {result['without_url']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# db/listing_events.py
+"""
+Événements « annonces modifiées » publiés par l'import (MongoDBHandler) et par la
+soumission d'un bien sur le site, consommés par le service d'alertes.
+
+Les événements sont écrits dans une collection plafonnée (capped) : le consommateur la lit
+avec un curseur tailable qui attend côté serveur les nouveaux documents (aucune requête
+quand rien n'est importé) et reprend après redémarrage depuis le dernier _id traité.
+Une collection plafonnée fonctionne aussi sur un MongoDB autonome, sans replica set
+(les change streams en exigent un).
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+EVENTS_COLLECTION = os.getenv("MONGO_EVENTS_COLLECTION", "listing_events")
+EVENTS_MAX_BYTES = int(os.getenv("MONGO_EVENTS_MAX_BYTES", 64 * 1024 * 1024))
+LISTINGS_CHANGED = "listings_changed"
+
+_ready_databases = set()
+
+
+def get_events_collection(database):
+    """Collection plafonnée des événements (créée au premier appel)."""
+    if database.name not in _ready_databases:
+        try:
+            database.create_collection(EVENTS_COLLECTION, capped=True, size=EVENTS_MAX_BYTES)
+            # Un curseur tailable meurt sur une collection vide : premier document de départ
+            database[EVENTS_COLLECTION].insert_one({"type": "created", "created_at": datetime.now(timezone.utc)})
+            logger.info(f"📣 Collection d'événements '{EVENTS_COLLECTION}' créée.")
+        except CollectionInvalid:
+            pass  # Déjà créée
+        _ready_databases.add(database.name)
+    return database[EVENTS_COLLECTION]
+
+
+def publish_listings_changed(database, urls: Iterable[str] = (), ids: Iterable = (),
+                             source: str = "") -> Optional[object]:
+    """Publie un événement pour des annonces nouvelles ou modifiées ; retourne son _id."""
+    urls, ids = list(urls), list(ids)
+    if not urls and not ids:
+        return None
+    try:
+        result = get_events_collection(database).insert_one({
+            "type": LISTINGS_CHANGED,
+            "urls": urls,
+            "ids": ids,
+            "source": source,
+            "created_at": datetime.now(timezone.utc),
+        })
+        return result.inserted_id
+    except Exception as e:
+        # Les alertes seront rattrapées par la vérification périodique
+        logger.error(f"❌ Événement non publié ({len(urls) + len(ids)} annonces) : {e}")
+        return None
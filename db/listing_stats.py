@@ -0,0 +1,319 @@
+# db/listing_stats.py
+"""
+Statistiques de prix calculées par MongoDB (pipeline d'agrégation) sur les champs normalisés.
+
+- market_stats(collection, match) : statistiques exactes d'un sous-ensemble d'annonces
+  (nombre, min, max, moyenne, percentiles, répartition par transaction et par type de bien).
+- build_stats_cube(collection) : cube de statistiques ville × quartier × type de bien ×
+  transaction × nombre de pièces (avec ses agrégats partiels : ville seule, ville × transaction...),
+  recalculé après chaque import dans sa propre collection, sous un nouveau numéro de version.
+- StatsCube : le cube chargé en mémoire ; rechargé seulement quand la version stockée change.
+  Les outils des agents y lisent leurs chiffres sans requête MongoDB.
+
+Les percentiles utilisent l'accumulateur $percentile (MongoDB 7.0+, méthode approchée) ;
+sur un serveur plus ancien, les statistiques sont renvoyées sans percentiles.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+CUBE_COLLECTION = os.getenv("MONGO_STATS_CUBE_COLLECTION", "listing_stats_cube")
+CUBE_META_ID = "meta"
+# Ancienne vue par ville, remplacée par le cube : supprimée au premier calcul du cube
+LEGACY_STATS_COLLECTION = os.getenv("MONGO_STATS_COLLECTION", "listing_stats_by_city")
+CUBE_CHECK_SECONDS = float(os.getenv("STATS_CUBE_CHECK_SECONDS", 60))  # Vérification de la version
+MIN_CELL_COUNT = int(os.getenv("STATS_CUBE_MIN_COUNT", 5))  # En dessous, la cellule n'est pas représentative
+
+PERCENTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+BREAKDOWNS = {"by_transaction": "$transaction_type", "by_property_kind": "$property_kind"}
+
+ANY = "*"  # Dimension agrégée (toutes valeurs)
+UNKNOWN = "?"  # Valeur absente de l'annonce
+CUBE_DIMENSIONS = ("city", "district", "kind", "transaction", "rooms")
+
+# Combinaisons de dimensions calculées ; les autres dimensions valent ANY
+GROUPING_SETS = (
+    (),
+    ("transaction",),
+    ("kind",),
+    ("kind", "transaction"),
+    ("city",),
+    ("city", "transaction"),
+    ("city", "kind"),
+    ("city", "kind", "transaction"),
+    ("city", "kind", "transaction", "rooms"),
+    ("city", "district"),
+    ("city", "district", "transaction"),
+    ("city", "district", "kind"),
+    ("city", "district", "kind", "transaction"),
+    ("city", "district", "kind", "transaction", "rooms"),
+)
+
+# Recherche de la cellule la plus précise : loyers et prix de vente ne se mélangent pas
+_LOOKUP_ORDER = sorted(GROUPING_SETS, key=lambda grouping: ("transaction" in grouping, len(grouping)), reverse=True)
+
+_VALID_PRICE = {"$gt": ["$price_mad", 0]}
+_VALID_SURFACE = {"$gt": ["$surface_m2", 0]}
+_PRICE_PER_M2 = {"$cond": [
+    {"$and": [_VALID_PRICE, _VALID_SURFACE]},
+    {"$divide": ["$price_mad", "$surface_m2"]},
+    None,
+]}
+_ROOMS_BUCKET = {"$switch": {
+    "branches": [
+        {"case": {"$not": [{"$gt": ["$rooms_n", 0]}]}, "then": UNKNOWN},
+        {"case": {"$gte": ["$rooms_n", 5]}, "then": "5+"},
+    ],
+    "default": {"$toString": "$rooms_n"},
+}}
+_DIMENSION_FIELDS = {
+    "city": "$city_slug",
+    "district": "$district_slug",
+    "kind": "$property_kind",
+    "transaction": "$transaction_type",
+    "rooms": _ROOMS_BUCKET,
+}
+
+
+def rooms_bucket(rooms) -> Optional[str]:
+    """Tranche de pièces du cube : 1, 2, 3, 4 ou '5+' (None si inconnu)."""
+    if not rooms or rooms <= 0:
+        return None
+    return "5+" if rooms >= 5 else str(int(rooms))
+
+
+def _accumulators(with_percentiles: bool, price_per_m2=_PRICE_PER_M2) -> Dict[str, Any]:
+    accumulators = {
+        "count": {"$sum": 1},
+        "priced": {"$sum": {"$cond": [_VALID_PRICE, 1, 0]}},
+        "min": {"$min": "$price_mad"},  # $min / $max / $avg ignorent les null (prix sur demande)
+        "max": {"$max": "$price_mad"},
+        "mean": {"$avg": "$price_mad"},
+        "price_per_m2": {"$avg": price_per_m2},
+    }
+    if with_percentiles:
+        accumulators["percentiles"] = {
+            "$percentile": {"input": "$price_mad", "p": list(PERCENTILES), "method": "approximate"}
+        }
+    return accumulators
+
+
+def _pipeline(match: dict, with_percentiles: bool) -> list:
+    accumulators = _accumulators(with_percentiles)
+    facets = {"overall": [{"$group": {"_id": None, **accumulators}}]}
+    for name, field in BREAKDOWNS.items():
+        facets[name] = [
+            {"$group": {"_id": field, **accumulators}},
+            {"$sort": {"count": -1}},
+        ]
+    return [{"$match": match}, {"$facet": facets}]
+
+
+def _round(value):
+    return round(value) if isinstance(value, (int, float)) else value
+
+
+def _percentiles(values) -> Dict[str, Any]:
+    return {f"p{int(p * 100)}": _round(value) for p, value in zip(PERCENTILES, values)}
+
+
+def _format_group(group: dict) -> dict:
+    stats = {key: _round(group.get(key)) for key in ("count", "priced", "min", "max", "mean", "price_per_m2")}
+    if group.get("percentiles"):
+        stats["percentiles"] = _percentiles(group["percentiles"])
+        stats["median"] = stats["percentiles"]["p50"]
+    if group.get("price_per_m2_percentiles"):
+        stats["price_per_m2_percentiles"] = _percentiles(group["price_per_m2_percentiles"])
+        stats["price_per_m2_median"] = stats["price_per_m2_percentiles"]["p50"]
+    return stats
+
+
+def market_stats(collection, match: Optional[dict] = None) -> Optional[dict]:
+    """Statistiques exactes des annonces qui correspondent à `match` (None si aucune)."""
+    try:
+        facets = next(collection.aggregate(_pipeline(match or {}, True), allowDiskUse=True))
+    except OperationFailure as e:
+        logger.warning(f"⚠️ $percentile indisponible (MongoDB < 7.0 ?), statistiques sans percentiles : {e}")
+        facets = next(collection.aggregate(_pipeline(match or {}, False), allowDiskUse=True))
+    if not facets["overall"]:
+        return None
+    stats = _format_group(facets["overall"][0])
+    for name in BREAKDOWNS:
+        stats[name] = {group["_id"] or "inconnu": _format_group(group) for group in facets[name]}
+    return stats
+
+
+def _cube_pipeline(cube_collection, version: int, with_percentiles: bool) -> list:
+    """Une copie de chaque annonce par combinaison de GROUPING_SETS, puis un $group sur les clés."""
+    keys = [
+        {dim: {"$ifNull": [_DIMENSION_FIELDS[dim], UNKNOWN]} if dim in grouping else ANY for dim in CUBE_DIMENSIONS}
+        for grouping in GROUPING_SETS
+    ]
+    accumulators = _accumulators(with_percentiles, price_per_m2="$price_per_m2")
+    if with_percentiles:
+        accumulators["price_per_m2_percentiles"] = {
+            "$percentile": {"input": "$price_per_m2", "p": list(PERCENTILES), "method": "approximate"}
+        }
+    return [
+        {"$project": {"_id": 0, "price_mad": 1, "price_per_m2": _PRICE_PER_M2, "keys": keys}},
+        {"$unwind": "$keys"},
+        {"$group": {"_id": "$keys", **accumulators}},
+        {"$set": {"_id": {"$mergeObjects": ["$_id", {"v": {"$literal": version}}]}}},
+        {"$merge": {
+            "into": {"db": cube_collection.database.name, "coll": cube_collection.name},
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def build_stats_cube(collection, cube_collection=None) -> int:
+    """
+    Recalcule le cube sous une nouvelle version, puis bascule le document de version et
+    supprime les cellules des versions précédentes. Retourne le nombre de cellules.
+    """
+    if cube_collection is None:
+        cube_collection = collection.database[CUBE_COLLECTION]
+    start = time.monotonic()
+    version = time.time_ns() // 1_000_000
+    try:
+        collection.aggregate(_cube_pipeline(cube_collection, version, True), allowDiskUse=True)
+    except OperationFailure as e:
+        logger.warning(f"⚠️ $percentile indisponible (MongoDB < 7.0 ?), cube sans percentiles : {e}")
+        collection.aggregate(_cube_pipeline(cube_collection, version, False), allowDiskUse=True)
+
+    cells = cube_collection.count_documents({"_id.v": version})
+    cube_collection.replace_one(
+        {"_id": CUBE_META_ID},
+        {"_id": CUBE_META_ID, "version": version, "cells": cells, "built_at": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+    cube_collection.delete_many({"_id.v": {"$exists": True, "$ne": version}})
+    _drop_legacy_stats(collection.database)
+    logger.info(f"📈 Cube de statistiques recalculé : {cells} cellules en {time.monotonic() - start:.1f} s.")
+    return cells
+
+
+def _drop_legacy_stats(database):
+    """Supprime la vue listing_stats_by_city (données figées depuis le passage au cube)."""
+    try:
+        if LEGACY_STATS_COLLECTION in database.list_collection_names(filter={"name": LEGACY_STATS_COLLECTION}):
+            database.drop_collection(LEGACY_STATS_COLLECTION)
+            logger.info(f"🗑️ Ancienne collection {LEGACY_STATS_COLLECTION} supprimée (remplacée par le cube).")
+    except PyMongoError as e:
+        logger.warning(f"⚠️ Ancienne collection {LEGACY_STATS_COLLECTION} non supprimée : {e}")
+
+
+def _cube_key(criteria: Dict[str, Any]) -> tuple:
+    return tuple(criteria.get(dim) or ANY for dim in CUBE_DIMENSIONS)
+
+
+class StatsCube:
+    """
+    Cube de statistiques en mémoire. La version stockée est relue au plus toutes les
+    `check_seconds` ; le cube n'est rechargé que si elle a changé (nouvel import).
+    """
+
+    def __init__(self, cube_collection, check_seconds: float = CUBE_CHECK_SECONDS):
+        self.collection = cube_collection
+        self.check_seconds = check_seconds
+        self._state = (None, {}, {})  # (version, cellules, cellules filles par dimension)
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._state[0]
+
+    def _load(self, version) -> tuple:
+        cells, children = {}, defaultdict(dict)
+        for doc in self.collection.find({"_id.v": version}):
+            key = tuple(doc["_id"].get(dim, ANY) for dim in CUBE_DIMENSIONS)
+            cell = _format_group(doc)
+            cells[key] = cell
+            for i, value in enumerate(key):
+                if value != ANY:
+                    parent = key[:i] + (ANY,) + key[i + 1:]
+                    children[(parent, CUBE_DIMENSIONS[i])][value] = cell
+        logger.info(f"📦 Cube de statistiques chargé : {len(cells)} cellules (version {version}).")
+        return version, cells, dict(children)
+
+    def refresh(self, force: bool = False):
+        """Recharge le cube si sa version a changé (sans effet avant check_seconds)."""
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < self.check_seconds:
+            return
+        with self._lock:
+            if not force and self._checked_at is not None and now - self._checked_at < self.check_seconds:
+                return
+            self._checked_at = now
+            try:
+                meta = self.collection.find_one({"_id": CUBE_META_ID}) or {}
+                if meta.get("version") != self.version:
+                    self._state = self._load(meta.get("version"))
+            except PyMongoError as e:
+                logger.warning(f"⚠️ Cube de statistiques non rechargé, version {self.version} conservée : {e}")
+
+    def cell(self, **criteria) -> Optional[dict]:
+        """Cellule exacte (city, district, kind, transaction, rooms ; absentes = toutes valeurs)."""
+        self.refresh()
+        return self._state[1].get(_cube_key(criteria))
+
+    def breakdown(self, dimension: str, **criteria) -> Dict[str, dict]:
+        """Cellules filles d'une cellule selon une dimension : {valeur: statistiques}."""
+        self.refresh()
+        return dict(self._state[2].get((_cube_key(criteria), dimension), {}))
+
+    def lookup(self, min_count: int = MIN_CELL_COUNT, **criteria) -> Optional[dict]:
+        """
+        Cellule la plus précise d'au moins `min_count` annonces pour ces critères : les
+        dimensions sont abandonnées une à une (pièces, quartier...) tant que l'échantillon est trop petit.
+        """
+        self.refresh()
+        cells = self._state[1]
+        given = {dim: value for dim, value in criteria.items() if value}
+        for grouping in _LOOKUP_ORDER:
+            if not set(grouping) <= given.keys():
+                continue
+            dimensions = {dim: given[dim] for dim in grouping}
+            cell = cells.get(_cube_key(dimensions))
+            if cell and (cell.get("count") or 0) >= min_count:
+                return {**cell, "dimensions": dimensions}
+        return None
+
+    def summary(self, **criteria) -> Optional[dict]:
+        """Même forme que market_stats : cellule + répartition par transaction et par type."""
+        stats = self.cell(**criteria)
+        if stats is None:
+            return None
+        stats = dict(stats)
+        for name, dimension in (("by_transaction", "transaction"), ("by_property_kind", "kind")):
+            groups = self.breakdown(dimension, **criteria)
+            stats[name] = {
+                ("inconnu" if value == UNKNOWN else value): group
+                for value, group in sorted(groups.items(), key=lambda item: -(item[1].get("count") or 0))
+            }
+        return stats
+
+
+_cubes: Dict[str, StatsCube] = {}
+_cubes_lock = threading.Lock()
+
+
+def get_stats_cube(cube_collection) -> StatsCube:
+    """Cube en mémoire partagé par le processus (un par collection)."""
+    key = cube_collection.full_name
+    if key in _cubes:
+        return _cubes[key]
+    with _cubes_lock:
+        if key not in _cubes:
+            _cubes[key] = StatsCube(cube_collection)
+        return _cubes[key]
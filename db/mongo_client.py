@@ -1,7 +1,10 @@
 # db/mongo_client_optimized.py
 import os
+import json
 import logging
+import threading
 import ijson  # pip install ijson
+import xxhash
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 from pymongo import MongoClient, UpdateOne, ASCENDING
@@ -9,6 +12,10 @@ from pymongo.errors import BulkWriteError
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
 
+from db.listing_events import publish_listings_changed
+from db.listing_stats import CUBE_COLLECTION, build_stats_cube
+from db.normalize import NORMALIZED_FIELDS, normalize_listing
+
 # Configuration du logging pour un suivi pro
 logging.basicConfig(
     level=logging.INFO,
@@ -24,6 +31,23 @@ load_dotenv()
 BATCH_SIZE = 2000      # Nombre d'opérations par envoi (ajuster selon la taille des docs)
 MAX_WORKERS = 4        # Nombre de threads parallèles pour l'écriture
 
+# Champs exclus de l'empreinte : ils changent à chaque passage sans que l'annonce change.
+# date_publication est relative chez Avito ("il y a 3 heures") : elle varie à chaque crawl.
+VOLATILE_FIELDS = {"_id", "date_scraped", "scraped_at", "content_hash", "date_publication",
+                   "first_seen_at", "last_seen_at", "content_changed_at", *NORMALIZED_FIELDS}
+
+
+def content_hash(item: dict) -> str:
+    """Empreinte xxh3 du contenu d'une annonce (clés triées, hors champs volatils)."""
+    content = {key: value for key, value in item.items() if key not in VOLATILE_FIELDS}
+    payload = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return xxhash.xxh3_64_hexdigest(payload.encode("utf-8"))
+
+
+def _url_key(url: str) -> int:
+    return xxhash.xxh3_64_intdigest(url.encode("utf-8"))
+
+
 class MongoDBHandler:
     def __init__(self):
         self.user = os.getenv("MONGO_USER")
@@ -41,7 +65,13 @@ class MongoDBHandler:
         )
         self.db = self.client[self.db_name]
         self.collection = self.db[self.collection_name]
-        
+
+        # Empreintes déjà connues (empreinte de l'URL -> empreinte du contenu) : évite de
+        # relire la base pour une annonce vue plus tôt dans le même import
+        self._content_hashes = {}
+        self._stats_lock = threading.Lock()
+        self.stats = {"inserted": 0, "changed": 0, "unchanged": 0}
+
         self._ensure_indexes()
 
     def _ensure_indexes(self):
@@ -56,30 +86,92 @@ class MongoDBHandler:
         except Exception as e:
             logger.error(f"❌ Erreur indexation : {e}")
 
+    def _stored_fingerprints(self, urls: list) -> dict:
+        """
+        Empreinte stockée de chaque URL déjà en base : cache mémoire d'abord, puis une seule
+        requête $in (index unique sur url) pour les autres.
+        Renvoie url -> (empreinte, first_seen_at à renseigner). Une annonce importée avant le
+        suivi n'a ni empreinte ("") ni first_seen_at (repris de son scraped_at) : elle est réécrite une fois.
+        """
+        known = {}
+        missing = []
+        for url in urls:
+            cached = self._content_hashes.get(_url_key(url))
+            if cached is None:
+                missing.append(url)
+            else:
+                known[url] = (cached, None)
+        if missing:
+            cursor = self.collection.find(
+                {"url": {"$in": missing}},
+                {"url": 1, "content_hash": 1, "first_seen_at": 1, "scraped_at": 1, "_id": 0}
+            )
+            for doc in cursor:
+                legacy_first_seen = None if "first_seen_at" in doc else doc.get("scraped_at") or True
+                known[doc["url"]] = (doc.get("content_hash") or "", legacy_first_seen)
+        return known
+
     def _process_batch(self, batch: list):
         """
         Fonction exécutée par les workers pour envoyer un lot à MongoDB.
+        Seules les annonces nouvelles ou modifiées (empreinte différente) sont réécrites ;
+        les autres ne reçoivent qu'un last_seen_at, en une seule opération par lot.
         """
         if not batch:
             return 0
 
+        now = datetime.now(timezone.utc)
+        hashes = {}
+        items = {}
+        for item in batch:
+            if item.get("url"):
+                items[item["url"]] = item  # Doublon dans le lot : la dernière version gagne
+        if not items:
+            return 0
+
+        stored = self._stored_fingerprints(list(items))
         operations = []
-        scraped_at = datetime.now(timezone.utc)
+        written = []
+        unchanged = []
+        inserted = 0
 
-        for item in batch:
-            if not item.get("url"):
+        for url, item in items.items():
+            hashes[url] = content_hash(item)
+            stored_hash, legacy_first_seen = stored.get(url, (None, None))
+            if stored_hash == hashes[url]:
+                unchanged.append(url)
                 continue
-            
-            item["scraped_at"] = scraped_at
-            
+
+            document = {key: value for key, value in item.items() if key not in VOLATILE_FIELDS}
+            document.update({
+                "date_scraped": item.get("date_scraped"),
+                "content_hash": hashes[url],
+                "scraped_at": now,  # Dernière modification : c'est ce que lisent les alertes
+                "content_changed_at": now,
+                "last_seen_at": now,
+            })
+            document.update(normalize_listing(item))  # price_mad, surface_m2, rooms_n...
+            if legacy_first_seen is not None:
+                document["first_seen_at"] = now if legacy_first_seen is True else legacy_first_seen
+            update = {"$set": document}
+            if stored_hash is None:
+                inserted += 1
+                update["$setOnInsert"] = {"first_seen_at": now}
+
             # UpdateOne est idempotent : si ça existe, on met à jour, sinon on crée.
-            operations.append(
-                UpdateOne(
-                    {"url": item["url"]}, 
-                    {"$set": item}, 
-                    upsert=True
-                )
-            )
+            operations.append(UpdateOne({"url": url}, update, upsert=True))
+            written.append(url)
+
+        if unchanged:
+            try:
+                self.collection.update_many({"url": {"$in": unchanged}}, {"$set": {"last_seen_at": now}})
+            except Exception as e:
+                logger.error(f"❌ Erreur de mise à jour de last_seen_at : {e}")
+
+        with self._stats_lock:
+            self.stats["inserted"] += inserted
+            self.stats["changed"] += len(operations) - inserted
+            self.stats["unchanged"] += len(unchanged)
 
         if not operations:
             return 0
@@ -89,19 +181,88 @@ class MongoDBHandler:
             # Mongo n'arrête pas le batch si une erreur survient sur un item
             # et peut paralléliser le traitement en interne.
             result = self.collection.bulk_write(operations, ordered=False)
+            # Empreintes mises en cache seulement après une écriture réussie
+            for url in items:
+                self._content_hashes[_url_key(url)] = hashes[url]
+            # Les alertes sont vérifiées dès la fin du lot, sans attendre la fin de l'import
+            publish_listings_changed(self.db, urls=written, source="import")
             return result.upserted_count + result.modified_count
         except BulkWriteError as bwe:
             logger.warning(f"⚠️ Erreur partielle dans le batch : {bwe.details['nWriteErrors']} erreurs.")
+            publish_listings_changed(self.db, urls=written, source="import")
             return bwe.details['nInserted'] + bwe.details['nUpserted'] + bwe.details['nModified']
         except Exception as e:
             logger.error(f"❌ Erreur critique d'écriture : {e}")
             return 0
 
+    def backfill_normalized_fields(self, only_missing: bool = True, redetect_transaction=None) -> int:
+        """
+        Calcule les champs normalisés (price_mad, surface_m2...) des annonces déjà en base.
+        À lancer une fois après la mise en place, ou avec only_missing=False après une
+        évolution des règles de normalisation.
+
+        `redetect_transaction` (filtre MongoDB) : annonces dont le transaction_type stocké est
+        ignoré et recalculé d'après le titre et le prix, par exemple celles de la catégorie
+        Avito "immobilier", marquées "location" à tort : {"url": {"$regex": "avito\\.ma"}}.
+        """
+        if redetect_transaction:
+            self.collection.update_many(redetect_transaction, {"$unset": {"transaction_type": ""}})
+        query = {"$or": [{field: {"$exists": False}} for field in NORMALIZED_FIELDS]} if only_missing else {}
+        projection = {"title": 1, "url": 1, "price": 1, "prix": 1, "surface": 1, "rooms": 1,
+                      "chambres": 1, "property_type": 1, "location": 1, "adresse": 1, "transaction_type": 1}
+        operations = []
+        updated = 0
+        for doc in self.collection.find(query, projection, batch_size=BATCH_SIZE):
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": normalize_listing(doc)}))
+            if len(operations) >= BATCH_SIZE:
+                updated += self.collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            updated += self.collection.bulk_write(operations, ordered=False).modified_count
+        logger.info(f"🧮 Champs normalisés calculés pour {updated} annonces.")
+        return updated
+
+    def refresh_stats(self):
+        """Recalcule le cube des statistiques de marché (après un import)."""
+        try:
+            build_stats_cube(self.collection, self.db[CUBE_COLLECTION])
+        except Exception as e:
+            logger.error(f"❌ Erreur de recalcul des statistiques : {e}")
+
+    def _known_urls_query(self, source_sites=None) -> dict:
+        query = {"url": {"$nin": [None, ""]}}
+        if source_sites:
+            query["source_site"] = {"$in": list(source_sites)}
+        return query
+
+    def count_known_urls(self, source_sites=None) -> int:
+        """Nombre d'annonces déjà importées (optionnellement filtré par site source)."""
+        return self.collection.count_documents(self._known_urls_query(source_sites))
+
+    def iter_known_urls(self, source_sites=None):
+        """
+        Générateur des URLs déjà importées, utilisé par le scraping incrémental.
+        Projection minimale et gros lots pour limiter le transfert.
+        """
+        cursor = self.collection.find(
+            self._known_urls_query(source_sites),
+            {"url": 1, "_id": 0},
+            batch_size=10000
+        )
+        for doc in cursor:
+            yield doc["url"]
+
     def stream_parse_json(self, file_path: Path):
         """
         Générateur qui lit le fichier JSON item par item sans charger le fichier complet en RAM.
-        Gère les listes simples ou les listes de listes.
+        Gère les listes simples ou les listes de listes, ainsi que le JSONL (.jsonl / .jsonl.zst)
+        produit par les scrapers.
         """
+        if file_path.name.endswith((".jsonl", ".jsonl.zst")):
+            from scraping.output import iter_records
+            yield from iter_records(str(file_path))
+            return
+
         with open(file_path, 'rb') as f:
             # 'item' correspond à chaque élément du tableau JSON principal
             # ijson.items est un générateur paresseux
@@ -160,16 +321,34 @@ class MongoDBHandler:
                     total_processed += f.result()
 
         logger.info(f"🏁 Import terminé. Total opérations réussies : {total_processed}")
+        logger.info(
+            f"📊 {self.stats['inserted']} nouvelles, {self.stats['changed']} modifiées, "
+            f"{self.stats['unchanged']} inchangées (non réécrites)."
+        )
+        if self.stats["inserted"] or self.stats["changed"]:
+            self.refresh_stats()
 
 if __name__ == "__main__":
+    # Depuis la racine du projet : python -m db.mongo_client [--backfill]
+    import sys
+
+    if "--backfill" in sys.argv:
+        MongoDBHandler().backfill_normalized_fields(only_missing="--all" not in sys.argv)
+        sys.exit(0)
+
     # Ajustement du chemin pour correspondre à votre structure
     current_dir = Path(__file__).resolve().parent
     # On remonte d'un cran si le script est dans /db, sinon ajustez selon votre structure
-    json_file = current_dir.parent / "data" / "combined_data.json"
-    
-    if not json_file.exists():
+    candidates = [
+        current_dir.parent / "data" / "combined_data.jsonl",
+        current_dir.parent / "data" / "combined_data.jsonl.zst",
+        current_dir.parent / "data" / "combined_data.json",
         # Fallback si exécuté depuis la racine
-        json_file = Path("data/combined_data.json")
+        Path("data/combined_data.jsonl"),
+        Path("data/combined_data.jsonl.zst"),
+        Path("data/combined_data.json"),
+    ]
+    json_file = next((path for path in candidates if path.exists()), candidates[0])
 
     handler = MongoDBHandler()
     handler.import_data(json_file)
\ No newline at end of file
@@ -0,0 +1,179 @@
+# db/normalize.py
+"""
+Normalisation des annonces à l'import : champs typés calculés une fois pour toutes
+à partir des chaînes brutes ("1 200 000 DH", "109 m²", "3 pièces"...).
+
+Les outils de recherche, d'alertes et de statistiques peuvent ainsi filtrer
+directement dans MongoDB (et profiter des index) au lieu de nettoyer chaque document en Python.
+"""
+import re
+import unicodedata
+from typing import Optional
+
+from scraping.config import CITIES
+
+# Champs calculés : jamais pris en compte dans l'empreinte de contenu
+NORMALIZED_FIELDS = ("price_mad", "surface_m2", "rooms_n", "transaction_type", "city_slug", "district_slug",
+                     "property_kind", "is_price_on_request")
+
+_NUMBER = re.compile(r"\d[\d\s.,\u00a0\u202f]*")
+_ON_REQUEST = re.compile(r"consulter|demander|sur demande|nous contacter", re.IGNORECASE)
+_FOREIGN_CURRENCY = re.compile(r"€|eur\b|\$|usd\b", re.IGNORECASE)
+_RENT = re.compile(r"louer|location|/\s*mois|/\s*nuit|par mois|mensuel|vacances", re.IGNORECASE)
+_SALE = re.compile(r"vendre|vente|achat|acheter|promotion|r[ée]sidence", re.IGNORECASE)
+
+_CITY_SLUGS = frozenset(CITIES)
+
+# Type de bien normalisé : premier motif trouvé dans property_type, sinon dans le titre
+PROPERTY_KINDS = (
+    ("studio", re.compile(r"studio", re.IGNORECASE)),
+    ("appartement", re.compile(r"appartement|duplex|penthouse", re.IGNORECASE)),
+    ("villa", re.compile(r"villa", re.IGNORECASE)),
+    ("riad", re.compile(r"riad", re.IGNORECASE)),
+    ("maison", re.compile(r"maison", re.IGNORECASE)),
+    ("bureau", re.compile(r"bureau|plateau", re.IGNORECASE)),
+    ("local", re.compile(r"local|locaux|commerce|magasin|boutique", re.IGNORECASE)),
+    ("terrain", re.compile(r"terrain", re.IGNORECASE)),
+)
+KIND_PATTERNS = dict(PROPERTY_KINDS)
+
+# Sous-types rangés par les sites sous un type parent ("Studio meublé" dans la catégorie
+# "Appartements") : cherchés d'abord dans le titre
+SUB_KINDS = {"studio": "appartement"}
+
+
+def slugify(value: str) -> str:
+    """'Salé' -> 'sale', 'El Jadida' -> 'el_jadida' (même forme que scraping.config.CITIES)."""
+    text = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_")
+
+
+def parse_number(value) -> Optional[float]:
+    """
+    Premier nombre d'une chaîne, séparateurs de milliers compris :
+    '1 200 000 DH' -> 1200000, '1.200.000' -> 1200000, '85,5 m²' -> 85.5.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value))
+    if not match:
+        return None
+    digits = re.sub(r"[\s\u00a0\u202f]", "", match.group(0)).rstrip(".,")
+    if "." in digits and "," in digits:
+        # Le dernier séparateur est la décimale
+        decimal = "." if digits.rfind(".") > digits.rfind(",") else ","
+        thousands = "," if decimal == "." else "."
+        digits = digits.replace(thousands, "").replace(decimal, ".")
+    else:
+        for sep in (".", ","):
+            parts = digits.split(sep)
+            if len(parts) > 2 or (len(parts) == 2 and len(parts[1]) == 3):
+                digits = digits.replace(sep, "")  # Séparateur de milliers
+            elif len(parts) == 2:
+                digits = digits.replace(sep, ".")
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+def normalize_price(value) -> tuple:
+    """Retourne (prix en MAD ou None, prix sur demande)."""
+    if value is None or value == "":
+        return None, True
+    if isinstance(value, str):
+        if _ON_REQUEST.search(value):
+            return None, True
+        if _FOREIGN_CURRENCY.search(value):
+            return None, False  # Pas de conversion : mieux vaut aucun prix qu'un prix faux
+    price = parse_number(value)
+    if not price:
+        return None, True
+    return price, False
+
+
+def normalize_rooms(value) -> Optional[int]:
+    number = parse_number(value)
+    return int(number) if number else None
+
+
+def detect_transaction_type(item: dict) -> Optional[str]:
+    """
+    'location' ou 'vente' : celui de la catégorie scrapée s'il est présent, sinon
+    d'après le titre, l'URL, le prix ('/ mois') et le type de bien.
+    """
+    declared = str(item.get("transaction_type") or "")
+    if declared in ("location", "vente"):
+        return declared
+    if declared.startswith("location"):
+        return "location"  # "location_saisonniere" (formulaire du site)
+    text = " ".join(str(item.get(key) or "") for key in ("title", "url", "price", "property_type"))
+    if _RENT.search(text):
+        return "location"
+    if _SALE.search(text):
+        return "vente"
+    return None
+
+
+def detect_property_kind(*texts) -> Optional[str]:
+    """'Appartements, Villas' -> 'appartement', 'Bureau/Commerce' -> 'bureau'."""
+    for text in texts:
+        if not text:
+            continue
+        matches = [(match.start(), kind) for kind, pattern in PROPERTY_KINDS
+                   for match in [pattern.search(str(text))] if match]
+        if matches:
+            return min(matches)[1]  # Le premier type cité
+    return None
+
+
+def detect_listing_kind(property_type, title) -> Optional[str]:
+    """('Appartements à louer', 'Studio meublé Agdal') -> 'studio' ; sinon detect_property_kind."""
+    title_kind = detect_property_kind(title)
+    if title_kind in SUB_KINDS and detect_property_kind(property_type) in (None, SUB_KINDS[title_kind]):
+        return title_kind
+    return detect_property_kind(property_type, title)
+
+
+def detect_city_slug(location) -> Optional[str]:
+    """
+    Ville d'une localisation 'Quartier, Ville' (Mubawab) ou 'Ville, Quartier' (Avito) :
+    la partie qui correspond à une ville connue, sinon la localisation si elle n'a qu'une partie.
+    """
+    if not location:
+        return None
+    parts = [slugify(part) for part in str(location).split(",") if part.strip()]
+    for part in parts:
+        if part in _CITY_SLUGS:
+            return part
+    return parts[0] if len(parts) == 1 else None
+
+
+def detect_district_slug(location) -> Optional[str]:
+    """Quartier d'une localisation 'Agdal, Rabat' -> 'agdal' (seulement si la ville est reconnue)."""
+    if not location:
+        return None
+    parts = [slugify(part) for part in str(location).split(",") if part.strip()]
+    if not any(part in _CITY_SLUGS for part in parts):
+        return None
+    districts = [part for part in parts if part and part not in _CITY_SLUGS]
+    return districts[0] if districts else None
+
+
+def normalize_listing(item: dict) -> dict:
+    """Champs typés d'une annonce (à ajouter au document MongoDB)."""
+    price_mad, on_request = normalize_price(item.get("price", item.get("prix")))
+    surface = parse_number(item.get("surface"))
+    location = item.get("location") or item.get("adresse")
+    return {
+        "price_mad": price_mad,
+        "surface_m2": surface or None,
+        "rooms_n": normalize_rooms(item.get("rooms", item.get("chambres"))),
+        "transaction_type": detect_transaction_type(item),
+        "city_slug": detect_city_slug(location),
+        "district_slug": detect_district_slug(location),
+        "property_kind": detect_listing_kind(item.get("property_type"), item.get("title")),
+        "is_price_on_request": on_request,
+    }
@@ -0,0 +1,20 @@
+# scraping/__init__.py
+"""
+Moteur de scraping partagé (Mubawab, Avito).
+Chaque catégorie est une CategorySpec déclarative (voir specs.py), exécutée par engine.py.
+"""
+from scraping.specs import CategorySpec, CATEGORIES, get_spec
+from scraping.engine import crawl_category, crawl_city, run_categories, run_category
+from scraping.orchestrator import RunReport, WorkUnit
+
+__all__ = [
+    "CategorySpec",
+    "CATEGORIES",
+    "get_spec",
+    "crawl_category",
+    "crawl_city",
+    "run_categories",
+    "run_category",
+    "RunReport",
+    "WorkUnit",
+]
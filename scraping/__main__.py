@@ -0,0 +1,69 @@
+# scraping/__main__.py
+"""
+Lance une ou plusieurs catégories depuis la ligne de commande.
+
+    python -m scraping                      # toutes les catégories
+    python -m scraping terrains_a_vendre_muwabab bureaux_muwabab
+    python -m scraping --incremental        # s'arrête sur les annonces déjà importées
+    python -m scraping --cache replay       # reparse le dernier crawl depuis le cache, sans réseau
+    python -m scraping --sinks mongo        # mode pipeline : upserts MongoDB pendant le crawl, sans fichiers
+"""
+import argparse
+import asyncio
+import logging
+
+from scraping.config import HTTP_CACHE_MODE, INCREMENTAL_STOP_AFTER_PAGES, MAX_CONCURRENT_CITIES, PARSE_WORKERS, SINKS
+from scraping.http_cache import CACHE_MODES
+from scraping.pipeline import parse_sinks
+from scraping.specs import CATEGORIES, get_spec
+from scraping.engine import run_categories
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scraping des annonces immobilières")
+    parser.add_argument("categories", nargs="*", help="Noms des catégories (défaut : toutes)")
+    parser.add_argument("--max-cities", type=int, default=MAX_CONCURRENT_CITIES,
+                        help="Nombre de villes crawlées en parallèle par domaine")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Arrête la pagination d'une ville quand les annonces sont déjà en base")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Ignore le journal de reprise d'un batch interrompu")
+    parser.add_argument("--cache", choices=CACHE_MODES, default=HTTP_CACHE_MODE,
+                        help="Cache HTTP disque : on (revalidé), off, replay (sans réseau)")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help="Processus de parsing HTML (0 : parsing dans la boucle asyncio)")
+    parser.add_argument("--sinks", type=parse_sinks, default=SINKS,
+                        help="Sorties des annonces : files, mongo ou files,mongo (défaut : SCRAPING_SINKS)")
+    parser.add_argument("--stop-after", type=int, default=INCREMENTAL_STOP_AFTER_PAGES,
+                        help="Pages consécutives sans nouveauté avant l'arrêt (mode incrémental)")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%H:%M:%S"
+    )
+
+    specs = [get_spec(name) for name in args.categories] if args.categories else CATEGORIES
+    report = asyncio.run(run_categories(
+        specs,
+        max_concurrent_cities=args.max_cities,
+        incremental=args.incremental,
+        stop_after_known_pages=args.stop_after,
+        resume=not args.fresh,
+        cache_mode=args.cache,
+        parse_workers=args.parse_workers,
+        sinks=args.sinks,
+    ))
+
+    print("\n--- ✅ Scraping terminé ! ---")
+    for name, category in report.categories.items():
+        print(f"  {name}: {category['listings']} annonces, {category['pages']} pages, "
+              f"{category['cities_failed']}/{category['cities']} ville(s) en échec")
+    for unit in report.failed_units:
+        print(f"  ❌ {unit['category']} / {unit['city'] or 'tout le Maroc'} (page {unit['next_page']}) : {unit['error']}")
+    print(f"Nombre total d'annonces extraites : {sum(report.counts.values())} en {report.duration_s:.0f} s")
+
+
+if __name__ == "__main__":
+    main()
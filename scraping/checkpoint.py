@@ -0,0 +1,117 @@
+# scraping/checkpoint.py
+"""
+Journal de reprise des crawls longs.
+
+Chaque page terminée est ajoutée (avec ses annonces) à un fichier JSONL en append-only,
+puis chaque ville terminée est marquée. Si le processus meurt, le batch suivant relit le
+journal : les villes terminées ne sont pas recrawlées et les villes interrompues
+reprennent à la page suivante. Le journal est supprimé quand le batch se termine sans erreur.
+"""
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CityProgress:
+    """Avancement d'une ville relu depuis le journal."""
+    pages: Dict[int, List[dict]] = field(default_factory=dict)
+    done: bool = False
+
+    @property
+    def next_page(self) -> int:
+        """Première page à (re)crawler : la pagination est séquentielle et sans trou."""
+        page = 1
+        while page in self.pages:
+            page += 1
+        return page
+
+    @property
+    def records(self) -> List[dict]:
+        return [record for page in sorted(self.pages) if page < self.next_page for record in self.pages[page]]
+
+
+class CheckpointJournal:
+    """Journal JSONL des unités (catégorie, ville, page) terminées."""
+
+    def __init__(self, path: str, date_scraped: str):
+        self.path = path
+        self.date_scraped = date_scraped
+        self._progress: Dict[Tuple[str, str], CityProgress] = {}
+        self._file = None
+
+    @staticmethod
+    def _key(category: str, city: Optional[str]) -> Tuple[str, str]:
+        return category, city or "*"
+
+    @classmethod
+    def open(cls, path: str, date_scraped: str, resume: bool = True,
+             max_age_hours: Optional[float] = None) -> "CheckpointJournal":
+        """
+        Ouvre le journal. Si un journal d'un batch interrompu existe (et `resume`),
+        il est relu et sa date de scraping est conservée. Un journal plus vieux que
+        `max_age_hours` appartient à un batch précédent : il est ignoré.
+        """
+        journal = cls(path, date_scraped)
+        if os.path.exists(path):
+            too_old = max_age_hours is not None and time.time() - os.path.getmtime(path) > max_age_hours * 3600
+            if resume and not too_old:
+                journal._load()
+            else:
+                os.remove(path)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        is_new = not os.path.exists(path)
+        journal._file = open(path, "a", encoding="utf-8")
+        if is_new:
+            journal._write({"type": "run", "date_scraped": journal.date_scraped})
+        return journal
+
+    def _load(self):
+        units = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Dernière ligne tronquée par le crash
+
+                kind = entry.get("type")
+                if kind == "run":
+                    self.date_scraped = entry["date_scraped"]
+                elif kind == "page":
+                    progress = self._progress.setdefault(self._key(entry["category"], entry["city"]), CityProgress())
+                    progress.pages[entry["page"]] = entry["records"]
+                    units += 1
+                elif kind == "city_done":
+                    self._progress.setdefault(self._key(entry["category"], entry["city"]), CityProgress()).done = True
+
+        done = sum(1 for progress in self._progress.values() if progress.done)
+        logger.info(f"♻️ Reprise depuis {self.path} : {units} pages et {done} villes déjà terminées.")
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def progress(self, category: str, city: Optional[str]) -> Optional[CityProgress]:
+        """Avancement connu d'une ville (None si elle n'a jamais été commencée)."""
+        return self._progress.get(self._key(category, city))
+
+    def page_done(self, category: str, city: Optional[str], page: int, records: List[dict]):
+        self._write({"type": "page", "category": category, "city": city, "page": page, "records": records})
+
+    def city_done(self, category: str, city: Optional[str]):
+        self._write({"type": "city_done", "category": category, "city": city})
+
+    def close(self, completed: bool = False):
+        """Ferme le journal ; le supprime si le batch s'est terminé sans erreur."""
+        if self._file:
+            self._file.close()
+            self._file = None
+        if completed and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,92 @@
+# scraping/config.py
+"""
+Configuration commune du moteur de scraping (en-têtes, villes, dossiers, limites).
+Les valeurs numériques peuvent être surchargées par variables d'environnement.
+"""
+import os
+
+# --- En-têtes HTTP ---
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                  "AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/122.0.0.0 Safari/537.36"
+}
+
+# --- Sites ---
+MUBAWAB_BASE_URL = "https://www.mubawab.ma"
+AVITO_BASE_URL = "https://www.avito.ma"
+SCRAPERAPI_URL = "http://api.scraperapi.com"
+SCRAPERAPI_KEY = os.getenv("SCRAPERAPI_KEY")
+
+# Liste des villes à scraper (nettoyée des doublons)
+CITIES = tuple(sorted(set([
+    "marrakech", "casablanca", "rabat", "tanger", "fes", "mohammedia",
+    "oujda", "tetouan", "settat", "khouribga", "benguerir", "youssoufia",
+    "safi", "sale", "temara", "bouskoura", "agadir", "meknes", "kenitra",
+    "el_jadida", "nador", "berrechid", "khemisset", "larache", "guelmim",
+    "taourirt", "sidi_kacem", "taza", "azrou", "ouarzazate", "beni_mellal",
+    "midelt", "aita_azza", "sidi_slimane", "sidi_kaouki", "imouzzer_kandar",
+    "oued_zem", "ain_sefra", "tiflet", "sidi_bel_abbes", "bouznika",
+    "sidi_ifni", "azemmour", "tafraout", "sidi_rahhal", "ouazzane",
+    "sidi_hajji", "sidi_yaala", "ifrane", "azilal", "tiznit",
+    "oued_edaoud", "berrchid", "berkane", "essaouira", "dakhla",
+])))
+
+# --- Sorties ---
+DATA_DIR = os.getenv("SCRAPING_DATA_DIR", "data")
+STATE_DIR = os.path.join(DATA_DIR, "state")  # Sous-dossier : ignoré par data_processing.py
+CRAWL_STATE_PATH = os.path.join(STATE_DIR, "crawl_state.json")
+REPORTS_DIR = os.path.join(STATE_DIR, "reports")  # Rapports JSON des batchs
+CHECKPOINT_DIR = os.path.join(STATE_DIR, "checkpoints")
+CHECKPOINT_MAX_AGE_HOURS = float(os.getenv("SCRAPING_CHECKPOINT_MAX_AGE_HOURS", 20))  # Au-delà : nouveau batch
+HTTP_CACHE_DIR = os.path.join(STATE_DIR, "http_cache")
+HTTP_CACHE_MODE = os.getenv("SCRAPING_HTTP_CACHE", "on")  # "on", "off" ou "replay" (cache seul, sans réseau)
+HTTP_CACHE_TTL = float(os.getenv("SCRAPING_HTTP_CACHE_TTL", 0))  # Secondes sans revalidation (0 : toujours revalider)
+HTTP_CACHE_MAX_MB = int(os.getenv("SCRAPING_HTTP_CACHE_MAX_MB", 1024))  # Au-delà : éviction LRU
+OUTPUT_COMPRESSION = os.getenv("SCRAPING_OUTPUT_COMPRESSION", "").lower() or None  # "zstd" -> fichiers .jsonl.zst
+OUTPUT_BUFFER_RECORDS = int(os.getenv("SCRAPING_OUTPUT_BUFFER", 500))  # Annonces en tampon avant écriture disque
+
+# --- Mode pipeline (annonces envoyées directement dans MongoDB) ---
+SINKS = os.getenv("SCRAPING_SINKS", "files")  # "files", "mongo" ou "files,mongo"
+PIPELINE_BATCH_SIZE = int(os.getenv("SCRAPING_PIPELINE_BATCH", 500))  # Annonces par lot d'upserts
+PIPELINE_FLUSH_SECONDS = float(os.getenv("SCRAPING_PIPELINE_FLUSH_SECONDS", 5))  # Âge max d'un lot incomplet
+PIPELINE_MAX_PENDING_BATCHES = int(os.getenv("SCRAPING_PIPELINE_MAX_PENDING", 8))  # Au-delà : contre-pression
+
+# --- Parsing ---
+PARSER_BACKEND = os.getenv("SCRAPING_PARSER_BACKEND", "lxml")  # "lxml" (rapide) ou "bs4" (référence)
+
+# --- Mode incrémental ---
+INCREMENTAL_STOP_AFTER_PAGES = int(os.getenv("SCRAPING_INCREMENTAL_STOP_AFTER", 2))  # Pages sans nouveauté avant arrêt
+KNOWN_URLS_USE_BLOOM = os.getenv("SCRAPING_KNOWN_URLS_BLOOM", "1") == "1"
+
+# --- Performances ---
+MAX_CONCURRENT_CITIES = int(os.getenv("SCRAPING_MAX_CONCURRENT_CITIES", 8))  # Villes crawlées en parallèle
+MAX_CONNECTIONS = int(os.getenv("SCRAPING_MAX_CONNECTIONS", 32))             # Taille du pool HTTP
+REQUEST_TIMEOUT = float(os.getenv("SCRAPING_REQUEST_TIMEOUT", 10))
+SCRAPERAPI_TIMEOUT = 120  # Timeout plus long pour l'API (rendu JavaScript)
+MAX_THROTTLE_RETRIES = int(os.getenv("SCRAPING_MAX_THROTTLE_RETRIES", 3))  # Nouveaux essais après un 429/503
+UNIT_TIMEOUT = float(os.getenv("SCRAPING_UNIT_TIMEOUT", 900))  # Secondes par tentative d'une ville, puis remise en file
+UNIT_RETRIES = int(os.getenv("SCRAPING_UNIT_RETRIES", 2))  # Nouvelles tentatives d'une ville en erreur
+UNIT_RETRY_BACKOFF = float(os.getenv("SCRAPING_UNIT_RETRY_BACKOFF", 30))  # Attente avant la 1re nouvelle tentative (doublée ensuite)
+PARSE_WORKERS = int(os.getenv("SCRAPING_PARSE_WORKERS", 2))  # Processus de parsing HTML (0 : dans la boucle asyncio)
+
+
+def _parse_rate_limits(value: str) -> dict:
+    """Lit "mubawab.ma=3:5,avito.ma=1:2" -> {"mubawab.ma": (3.0, 5), "avito.ma": (1.0, 2)}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        domain, _, spec = item.partition("=")
+        rate, _, burst = spec.partition(":")
+        limits[domain.strip().lower()] = (float(rate), int(burst or 1))
+    return limits
+
+
+# --- Débit par domaine : (requêtes/seconde, rafale max) ---
+# Budget commun à toutes les catégories d'un même batch.
+RATE_LIMITS = {
+    "mubawab.ma": (3.0, 5),
+    "avito.ma": (1.0, 2),
+    "api.scraperapi.com": (1.0, 5),
+}
+RATE_LIMITS.update(_parse_rate_limits(os.getenv("SCRAPING_RATE_LIMITS", "")))
+DEFAULT_RATE_LIMIT = (1.0, 1)
@@ -0,0 +1,414 @@
+# scraping/engine.py
+"""
+Moteur de scraping asynchrone.
+
+Un seul client HTTP (pool de connexions keep-alive) est partagé par toutes les catégories.
+La pagination d'une ville reste séquentielle (on s'arrête à la première page vide),
+mais les villes de toutes les catégories sont crawlées en parallèle par des workers
+répartis par domaine, avec délai maximal et nouvelles tentatives (orchestrator.py).
+Le débit vers chaque hôte est réglé par un limiteur par domaine commun (rate_limit.py).
+En mode incrémental, la pagination d'une ville s'arrête quand elle ne ramène plus
+que des annonces déjà connues (incremental.py).
+Chaque page terminée est journalisée pour pouvoir reprendre un batch interrompu (checkpoint.py).
+Les annonces sont écrites en JSONL au fil du crawl, sans liste complète en mémoire (output.py),
+et/ou envoyées directement dans MongoDB en mode pipeline (pipeline.py).
+Les pages passent par un cache disque revalidé par ETag / Last-Modified (http_cache.py).
+"""
+import asyncio
+import logging
+import os
+import time
+import zlib
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from scraping.config import (
+    CHECKPOINT_DIR, CHECKPOINT_MAX_AGE_HOURS, CRAWL_STATE_PATH, DATA_DIR, DEFAULT_HEADERS,
+    HTTP_CACHE_DIR, HTTP_CACHE_MAX_MB, HTTP_CACHE_MODE, HTTP_CACHE_TTL,
+    INCREMENTAL_STOP_AFTER_PAGES, KNOWN_URLS_USE_BLOOM, MAX_CONCURRENT_CITIES, MAX_CONNECTIONS, MAX_THROTTLE_RETRIES,
+    PARSE_WORKERS, REPORTS_DIR, REQUEST_TIMEOUT, SCRAPERAPI_KEY, SCRAPERAPI_TIMEOUT, SCRAPERAPI_URL, SINKS,
+    UNIT_RETRIES, UNIT_RETRY_BACKOFF, UNIT_TIMEOUT,
+)
+from scraping.checkpoint import CheckpointJournal
+from scraping.http_cache import HttpCache
+from scraping.incremental import CrawlState, KnownUrls
+from scraping.orchestrator import ParsePool, RunReport, WorkUnit, interleave_units, run_units
+from scraping.output import RecordSink, RecordWriter, TeeSink, ZSTD_SUFFIX
+from scraping.pipeline import MongoSink, parse_sinks
+from scraping.rate_limit import DomainRateLimiter, THROTTLE_STATUS_CODES, parse_retry_after
+from scraping.specs import CategorySpec, get_spec
+
+logger = logging.getLogger(__name__)
+
+# Codes HTTP qui signifient « plus de pages » (les autres erreurs sont transitoires)
+END_OF_PAGINATION_STATUS_CODES = (400, 404, 410)
+
+
+class TransientFetchError(Exception):
+    """Erreur réseau ou blocage (403, 5xx...) : la ville est retentée, puis reprise au prochain lancement."""
+
+
+@dataclass
+class CrawlContext:
+    """Ressources partagées par toutes les catégories d'un même batch."""
+    client: httpx.AsyncClient
+    limiter: DomainRateLimiter
+    date_scraped: str
+    max_concurrent_cities: int = MAX_CONCURRENT_CITIES
+    known_urls: Optional[KnownUrls] = None  # Défini uniquement en mode incrémental
+    stop_after_known_pages: int = INCREMENTAL_STOP_AFTER_PAGES
+    crawl_state: Optional[CrawlState] = None
+    journal: Optional[CheckpointJournal] = None
+    cache: Optional[HttpCache] = None
+    parse_pool: Optional[ParsePool] = None
+    unit_timeout: Optional[float] = UNIT_TIMEOUT
+    unit_retries: int = UNIT_RETRIES
+    unit_retry_backoff: float = UNIT_RETRY_BACKOFF
+
+
+def create_client(max_connections: int = MAX_CONNECTIONS) -> httpx.AsyncClient:
+    """Client HTTP asynchrone partagé (connexions réutilisées entre les pages et les villes)."""
+    return httpx.AsyncClient(
+        headers=DEFAULT_HEADERS,
+        timeout=REQUEST_TIMEOUT,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+    )
+
+
+async def _send(ctx: CrawlContext, spec: CategorySpec, url: str, headers: Optional[dict] = None) -> httpx.Response:
+    """Envoie la requête (directe ou via ScraperAPI) après avoir obtenu un jeton du domaine."""
+    await ctx.limiter.acquire(spec.request_domain)
+    if spec.fetch_via == "scraperapi":
+        payload = {
+            "api_key": SCRAPERAPI_KEY,
+            "url": url,
+            "render": "true",      # Demande l'exécution du JavaScript
+            "country_code": "ma",  # Spécifie une IP marocaine
+        }
+        return await ctx.client.get(SCRAPERAPI_URL, params=payload, timeout=SCRAPERAPI_TIMEOUT)
+    return await ctx.client.get(url, headers=headers)
+
+
+async def fetch_page(ctx: CrawlContext, spec: CategorySpec, url: str) -> Optional[str]:
+    """
+    Récupère le HTML d'une page de résultats.
+    Un 429/503 ralentit le domaine et la requête est retentée. Renvoie None quand le
+    site signale la fin de la pagination (404...) et lève TransientFetchError pour
+    toute autre erreur HTTP ou réseau.
+
+    Avec le cache : une page plus récente que le TTL est servie sans réseau, sinon elle est
+    revalidée (304 -> corps en cache). En mode replay, une page absente termine la pagination.
+    """
+    cache = ctx.cache
+    cached = cache.get(url) if cache else None
+    if cached and cache.is_fresh(cached):
+        cache.hits += 1
+        return cached.body
+    if cache and cache.replay_only:
+        logger.info(f"⏹️  Page absente du cache (mode replay) : {url}. Fin de la pagination.")
+        return None
+
+    # ScraperAPI ne transmet pas les en-têtes conditionnels : le cache n'y sert qu'au TTL
+    headers = cached.conditional_headers() if cached and spec.fetch_via == "direct" else None
+    domain = spec.request_domain
+    try:
+        for _ in range(MAX_THROTTLE_RETRIES + 1):
+            response = await _send(ctx, spec, url, headers)
+            if response.status_code not in THROTTLE_STATUS_CODES:
+                break
+            ctx.limiter.penalize(domain, parse_retry_after(response.headers.get("Retry-After")))
+
+        if response.status_code == 304 and cached:
+            ctx.limiter.reward(domain)
+            cache.mark_revalidated(url)
+            cache.revalidated += 1
+            return cached.body
+
+        response.raise_for_status()
+        ctx.limiter.reward(domain)
+        if cache:
+            cache.misses += 1
+            cache.store(url, response.text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return response.text
+
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code in END_OF_PAGINATION_STATUS_CODES:
+            logger.info(f"⏹️  Erreur HTTP {e.response.status_code} pour {url}. Fin de la pagination.")
+            return None
+        raise TransientFetchError(f"Erreur HTTP {e.response.status_code} pour {url}") from e
+    except httpx.HTTPError as e:
+        raise TransientFetchError(f"La requête a échoué pour {url}: {e!r}") from e
+
+
+def restore_unit(ctx: CrawlContext, unit: WorkUnit) -> bool:
+    """
+    Reprend l'avancement d'une ville depuis le journal (annonces déjà trouvées réécrites).
+    Retourne True si la ville était déjà terminée.
+    """
+    progress = ctx.journal.progress(unit.spec.name, unit.city) if ctx.journal else None
+    if not progress:
+        return False
+    records = progress.records
+    unit.sink.write_many(records)
+    unit.count = len(records)
+    unit.next_page = progress.next_page
+    unit.pages_fetched = unit.next_page - 1
+    unit.top_url = records[0].get("url") if records else None
+    if progress.done:
+        unit.status = "done"
+        logger.info(f"♻️ [{unit.spec.name}] {unit.label} déjà terminé (journal de reprise).")
+    return progress.done
+
+
+async def crawl_city(ctx: CrawlContext, unit: WorkUnit) -> int:
+    """
+    Parcourt les pages d'une ville pour une catégorie à partir de `unit.next_page` et écrit
+    les annonces au fil de l'eau. L'avancement est mis à jour après chaque page : après une
+    erreur ou un délai dépassé, une nouvelle tentative continue là où celle-ci s'est arrêtée.
+    Retourne le nombre d'annonces écrites pour la ville.
+
+    En mode incrémental, on s'arrête après `stop_after_known_pages` pages consécutives
+    sans URL nouvelle, ou dès la première page sans nouveauté qui contient le point
+    haut du passage précédent.
+    """
+    spec, city, label = unit.spec, unit.city, unit.label
+    logger.info(f"🚀 [{spec.name}] Démarrage du scraping pour : {label} (page {unit.next_page})")
+    high_water_url = ctx.crawl_state.high_water_url(spec.name, city) if ctx.crawl_state else None
+
+    for page_number in range(unit.next_page, spec.max_pages + 1):
+        await unit.sink.wait_for_capacity()  # Contre-pression : MongoDB en retard -> pas de nouvelle page
+        url = spec.url_for(city, page_number)
+        html = await fetch_page(ctx, spec, url)  # TransientFetchError : nouvelle tentative par l'orchestrateur
+        if html is None:
+            break
+
+        try:
+            page_records = await ctx.parse_pool.parse(spec, html, ctx.date_scraped) if ctx.parse_pool \
+                else spec.parse_page(html, spec, ctx.date_scraped)
+        except Exception as e:
+            # On continue à la page suivante par précaution
+            logger.error(f"❌ [{spec.name}] Erreur inattendue lors de l'analyse de {url}: {e}")
+            unit.next_page = page_number + 1
+            continue
+
+        if spec.transaction_type:
+            # Information portée par la catégorie, absente des pages Mubawab
+            for record in page_records:
+                record.setdefault("transaction_type", spec.transaction_type)
+
+        if not page_records:
+            logger.info(f"⏹️  [{spec.name}] Aucune annonce sur la page {page_number} pour {label}. Fin de la pagination.")
+            break
+
+        # Aucun await entre l'écriture et la mise à jour de l'avancement : une annulation
+        # (délai dépassé) ne peut pas laisser une page écrite mais non comptée
+        logger.info(f"✅ [{spec.name}] {label} page {page_number}: {len(page_records)} annonces.")
+        unit.sink.write_many(page_records)
+        unit.count += len(page_records)
+        unit.pages_fetched = page_number
+        unit.next_page = page_number + 1
+        if ctx.journal:
+            ctx.journal.page_done(spec.name, city, page_number, page_records)
+        page_urls = [record["url"] for record in page_records if record.get("url")]
+        if unit.top_url is None and page_urls:
+            unit.top_url = page_urls[0]
+
+        if ctx.known_urls is not None:
+            page_new = sum(1 for url in page_urls if url not in ctx.known_urls)
+            unit.new_listings += page_new
+            unit.stale_pages = 0 if page_new else unit.stale_pages + 1
+
+            if unit.stale_pages and high_water_url in page_urls:
+                logger.info(f"⏹️  [{spec.name}] Point haut atteint page {page_number} pour {label}.")
+                break
+            if unit.stale_pages >= ctx.stop_after_known_pages:
+                logger.info(f"⏹️  [{spec.name}] {unit.stale_pages} page(s) sans nouveauté pour {label}. Arrêt incrémental.")
+                break
+    else:
+        logger.warning(f"⚠️ [{spec.name}] Limite de {spec.max_pages} pages atteinte pour {label}.")
+
+    if ctx.crawl_state is not None and unit.top_url:
+        ctx.crawl_state.record(spec.name, city, unit.top_url, unit.pages_fetched, unit.new_listings)
+    if ctx.journal:
+        ctx.journal.city_done(spec.name, city)
+
+    return unit.count
+
+
+def category_units(ctx: CrawlContext, spec: CategorySpec, sink: RecordSink) -> List[WorkUnit]:
+    """Une unité par ville, avancement repris du journal ; vide si la catégorie ne peut pas tourner."""
+    if spec.fetch_via == "scraperapi" and not SCRAPERAPI_KEY:
+        logger.error(f"❌ [{spec.name}] SCRAPERAPI_KEY non défini. Catégorie ignorée.")
+        return []
+    units = [WorkUnit(spec, city, sink) for city in spec.crawl_cities()]
+    for unit in units:
+        restore_unit(ctx, unit)
+    return units
+
+
+async def crawl_units(ctx: CrawlContext, units: List[WorkUnit]):
+    """Passe les unités non terminées à l'orchestrateur (files par domaine, délais, nouvelles tentatives)."""
+    await run_units(
+        [unit for unit in units if unit.status != "done"],
+        lambda unit: crawl_city(ctx, unit),
+        workers_per_domain=ctx.max_concurrent_cities,
+        timeout=ctx.unit_timeout,
+        retries=ctx.unit_retries,
+        backoff=ctx.unit_retry_backoff,
+    )
+
+
+async def crawl_category(ctx: CrawlContext, spec: CategorySpec, sink: RecordSink) -> int:
+    """
+    Crawle toutes les villes d'une catégorie (bornées par domaine, voir orchestrator.py).
+    Toutes les villes partagent la même sortie : les annonces sont entrelacées dans le fichier.
+    """
+    units = category_units(ctx, spec, sink)
+    await crawl_units(ctx, units)
+    return sum(unit.count for unit in units)
+
+
+def open_writer(spec: CategorySpec, output_dir: str = DATA_DIR) -> RecordWriter:
+    """Ouvre data/<output_filename> (suffixe .zst si la compression est activée)."""
+    writer = RecordWriter(os.path.join(output_dir, spec.output_filename))
+    # Une copie dans l'autre format serait fusionnée en double par data_processing.py
+    for stale in (spec.output_filename, spec.output_filename + ZSTD_SUFFIX):
+        stale_path = os.path.join(output_dir, stale)
+        if stale_path != writer.path and os.path.exists(stale_path):
+            os.remove(stale_path)
+    return writer
+
+
+def load_known_urls(specs: List[CategorySpec]) -> Optional[KnownUrls]:
+    """Charge les URLs déjà importées ; None (crawl complet) si MongoDB est injoignable."""
+    try:
+        return KnownUrls.from_mongo({spec.base_url for spec in specs}, use_bloom=KNOWN_URLS_USE_BLOOM)
+    except Exception as e:
+        logger.warning(f"⚠️ URLs connues indisponibles ({e}). Crawl complet.")
+        return None
+
+
+def checkpoint_path(specs: List[CategorySpec]) -> str:
+    """Un journal par ensemble de catégories (un script seul ne reprend pas le batch complet)."""
+    names = sorted(spec.name for spec in specs)
+    if len(names) == 1:
+        filename = f"{names[0]}.jsonl"
+    else:
+        filename = f"batch_{zlib.crc32(','.join(names).encode()):08x}.jsonl"
+    return os.path.join(CHECKPOINT_DIR, filename)
+
+
+async def run_categories(
+    specs: Iterable[CategorySpec],
+    max_concurrent_cities: int = MAX_CONCURRENT_CITIES,
+    output_dir: str = DATA_DIR,
+    incremental: bool = False,
+    stop_after_known_pages: int = INCREMENTAL_STOP_AFTER_PAGES,
+    resume: bool = True,
+    cache_mode: str = HTTP_CACHE_MODE,
+    parse_workers: int = PARSE_WORKERS,
+    sinks: Optional[Iterable[str]] = None,
+) -> RunReport:
+    """
+    Lance plusieurs catégories dans la même boucle asyncio avec un client et un
+    limiteur de débit communs : toutes les catégories partagent le budget de chaque hôte.
+    Toutes les villes de toutes les catégories passent par les mêmes files de travail par domaine.
+    Avec `resume`, un batch interrompu reprend là où il s'était arrêté (journal de reprise).
+    `cache_mode` : "on" (cache revalidé), "off" ou "replay" (cache seul, sans réseau).
+    `sinks` : "files" (data/*.jsonl) et/ou "mongo" (upserts pendant le crawl), défaut SCRAPING_SINKS.
+    Retourne le rapport du batch (annonces, pages, échecs par catégorie), aussi enregistré en JSON.
+    """
+    specs = list(specs)
+    sinks = tuple(sinks) if sinks else parse_sinks(SINKS)
+    started = time.monotonic()
+    known_urls = load_known_urls(specs) if incremental else None
+    crawl_state = CrawlState.load(CRAWL_STATE_PATH)
+    journal = CheckpointJournal.open(
+        checkpoint_path(specs), datetime.now().isoformat(),
+        resume=resume, max_age_hours=CHECKPOINT_MAX_AGE_HOURS,
+    )
+    report = RunReport(started_at=datetime.now().isoformat())
+    cache = None
+    if cache_mode != "off":
+        cache = HttpCache(HTTP_CACHE_DIR, ttl_seconds=HTTP_CACHE_TTL,
+                          max_bytes=HTTP_CACHE_MAX_MB * 1024 * 1024, mode=cache_mode)
+    parse_pool = ParsePool(parse_workers)
+    mongo_sink = MongoSink() if "mongo" in sinks else None
+
+    client = create_client()
+    ctx = CrawlContext(
+        client=client,
+        limiter=DomainRateLimiter(),
+        date_scraped=journal.date_scraped,
+        max_concurrent_cities=max_concurrent_cities,
+        known_urls=known_urls,
+        stop_after_known_pages=stop_after_known_pages,
+        crawl_state=crawl_state,
+        journal=journal,
+        cache=cache,
+        parse_pool=parse_pool,
+    )
+    units_by_category: Dict[str, List[WorkUnit]] = {}
+    completed = False
+    try:
+        with ExitStack() as writers:
+            for spec in specs:
+                try:
+                    owned = [open_writer(spec, output_dir)] if "files" in sinks else []
+                    sink = TeeSink(owned + ([mongo_sink] if mongo_sink else []), owned=owned)
+                    writers.callback(sink.close)
+                    units_by_category[spec.name] = category_units(ctx, spec, sink)
+                except Exception as e:
+                    logger.error(f"❌ Erreur dans la catégorie {spec.name}: {e} (continuation)")
+                    report.add_category(spec, [], status="failed", error=str(e))
+
+            async with client:
+                await crawl_units(ctx, interleave_units(units_by_category.values()))
+        if mongo_sink:
+            await mongo_sink.aclose()
+            report.sinks["mongo"] = mongo_sink.stats()
+            mongo_sink = None
+
+        for spec in specs:
+            if spec.name not in units_by_category:
+                continue
+            units = units_by_category[spec.name]
+            report.add_category(spec, units, status=None if units else "skipped")
+            logger.info(f"💾 [{spec.name}] {report.categories[spec.name]['listings']} annonces enregistrées.")
+        completed = report.completed
+    finally:
+        if mongo_sink:  # Batch interrompu : on n'abandonne pas les lots déjà prêts
+            mongo_sink.close()
+        parse_pool.close()
+        journal.close(completed=completed)
+        if cache:
+            cache.close()
+        if not completed:
+            logger.warning(f"♻️ Batch incomplet : journal de reprise conservé ({journal.path}).")
+
+    if cache_mode != "replay":  # Un reparsing du cache ne doit pas déplacer les points hauts
+        crawl_state.save()
+    report.limiter = ctx.limiter.stats()
+    report.cache = cache.stats() if cache else {}
+    report.finish(started)
+    logger.info(f"📊 Débit final par domaine (req/s) : {report.limiter}")
+    if cache:
+        logger.info(f"🗄️ Cache HTTP : {report.cache}")
+    logger.info(f"🧾 Rapport du batch : {report.save(REPORTS_DIR)}")
+    return report
+
+
+def run_category(name: str, incremental: bool = False) -> int:
+    """Point d'entrée synchrone utilisé par les scripts scraper_*.py."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%H:%M:%S"
+    )
+    report = asyncio.run(run_categories([get_spec(name)], incremental=incremental))
+    return report.counts[name]
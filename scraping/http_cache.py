@@ -0,0 +1,184 @@
+# scraping/http_cache.py
+"""
+Cache HTTP sur disque pour les pages de résultats.
+
+- Index SQLite par URL (ETag, Last-Modified, date de récupération, dernier accès).
+- Corps adressés par contenu (xxh3_128), compressés en zstd : deux URLs qui renvoient
+  la même page partagent le même fichier.
+- Revalidation conditionnelle (If-None-Match / If-Modified-Since) : un 304 réutilise le corps.
+- TTL : une entrée plus récente que le TTL est servie sans requête réseau.
+- Taille maximale avec éviction LRU (dernier accès).
+- Mode "replay" : uniquement le cache, aucun accès réseau (reparsing d'un ancien crawl).
+"""
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import xxhash
+import zstandard
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODES = ("on", "off", "replay")
+_EVICTION_CHECK_EVERY = 100  # Stockages entre deux vérifications de la taille
+_EVICTION_TARGET = 0.9       # On évince jusqu'à 90 % de la taille maximale
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    body: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (now or time.time()) - self.fetched_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """En-têtes de revalidation à ajouter à la requête."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """Cache disque partagé par toutes les catégories (et tous les processus) d'un batch."""
+
+    def __init__(self, directory: str, ttl_seconds: float = 0, max_bytes: int = 1 << 30, mode: str = "on"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Mode de cache inconnu : {mode}. Modes disponibles : {', '.join(CACHE_MODES)}")
+        self.directory = directory
+        self.bodies_dir = os.path.join(directory, "bodies")
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._stores = 0
+
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body_hash TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+            CREATE INDEX IF NOT EXISTS entries_body_hash ON entries (body_hash);
+            CREATE TABLE IF NOT EXISTS bodies (hash TEXT PRIMARY KEY, size INTEGER NOT NULL);
+        """)
+        self._compressor = zstandard.ZstdCompressor(level=6)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    @property
+    def replay_only(self) -> bool:
+        return self.mode == "replay"
+
+    def _body_path(self, body_hash: str) -> str:
+        # Deux niveaux de répertoires pour éviter des dossiers à plusieurs dizaines de milliers de fichiers
+        return os.path.join(self.bodies_dir, body_hash[:2], body_hash + ".zst")
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Entrée du cache pour cette URL (None si absente ou si le corps a disparu)."""
+        row = self._db.execute(
+            "SELECT etag, last_modified, body_hash, fetched_at FROM entries WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, body_hash, fetched_at = row
+        try:
+            with open(self._body_path(body_hash), "rb") as f:
+                body = self._decompressor.decompress(f.read()).decode("utf-8")
+        except (OSError, zstandard.ZstdError):
+            self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            self._db.commit()
+            return None
+        self._db.execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        self._db.commit()
+        return CachedResponse(url, body, etag, last_modified, fetched_at)
+
+    def is_fresh(self, cached: CachedResponse) -> bool:
+        return self.replay_only or cached.age() < self.ttl_seconds
+
+    def store(self, url: str, body: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        data = body.encode("utf-8")
+        body_hash = xxhash.xxh3_128_hexdigest(data)
+        path = self._body_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            compressed = self._compressor.compress(data)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+            self._db.execute("INSERT OR REPLACE INTO bodies (hash, size) VALUES (?, ?)", (body_hash, len(compressed)))
+
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (url, etag, last_modified, body_hash, fetched_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, body_hash, now, now),
+        )
+        self._db.commit()
+
+        self._stores += 1
+        if self._stores % _EVICTION_CHECK_EVERY == 0:
+            self.evict()
+
+    def mark_revalidated(self, url: str):
+        """Réponse 304 : le corps en cache est toujours valable, on repart pour un TTL."""
+        now = time.time()
+        self._db.execute("UPDATE entries SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+        self._db.commit()
+
+    def size(self) -> int:
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+
+    def evict(self) -> int:
+        """Supprime les entrées les moins récemment utilisées au-delà de la taille maximale."""
+        total = self.size()
+        if total <= self.max_bytes:
+            return 0
+
+        target = self.max_bytes * _EVICTION_TARGET
+        evicted = 0
+        rows = self._db.execute("SELECT url, body_hash FROM entries ORDER BY accessed_at").fetchall()
+        for url, body_hash in rows:
+            if total <= target:
+                break
+            self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            evicted += 1
+            still_used = self._db.execute("SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1", (body_hash,)).fetchone()
+            if still_used:
+                continue
+            size = self._db.execute("SELECT size FROM bodies WHERE hash = ?", (body_hash,)).fetchone()
+            self._db.execute("DELETE FROM bodies WHERE hash = ?", (body_hash,))
+            total -= size[0] if size else 0
+            try:
+                os.remove(self._body_path(body_hash))
+            except FileNotFoundError:
+                pass
+        self._db.commit()
+        logger.info(f"🧹 Cache HTTP : {evicted} entrées évincées ({total / 1024 / 1024:.0f} Mo restants).")
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses}
+
+    def close(self):
+        if not self.replay_only:
+            self.evict()
+        self._db.close()
@@ -0,0 +1,120 @@
+# scraping/incremental.py
+"""
+Scraping incrémental : on arrête la pagination d'une ville dès qu'elle ne ramène
+plus d'annonces nouvelles.
+
+- KnownUrls : index des URLs déjà importées dans MongoDB (set exact ou filtre de Bloom
+  compact quand la base est grosse).
+- CrawlState : point haut (high-water mark) par catégorie/ville, c.-à-d. la première
+  annonce vue en page 1 au dernier passage, persisté dans data/state/crawl_state.json.
+"""
+import json
+import logging
+import math
+import os
+from datetime import datetime
+from typing import Iterable, Optional
+
+import xxhash
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Filtre de Bloom (double hachage xxh3-128). Faux positifs possibles, jamais de faux négatifs."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = xxhash.xxh3_128_intdigest(item.encode("utf-8"))
+        h1, h2 = digest & 0xFFFFFFFFFFFFFFFF, digest >> 64
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class KnownUrls:
+    """Ensemble des URLs déjà connues, en mémoire exacte (set) ou approchée (Bloom)."""
+
+    def __init__(self, urls: Iterable[str] = (), capacity: Optional[int] = None, error_rate: float = 0.001):
+        self._urls = BloomFilter(capacity, error_rate) if capacity else set()
+        for url in urls:
+            self._urls.add(url)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._urls
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    @classmethod
+    def from_mongo(cls, source_sites: Optional[Iterable[str]] = None, use_bloom: bool = True,
+                   error_rate: float = 0.001) -> "KnownUrls":
+        """Charge les URLs déjà importées depuis la collection des annonces."""
+        from db.mongo_client import MongoDBHandler
+
+        handler = MongoDBHandler()
+        try:
+            capacity = handler.count_known_urls(source_sites) if use_bloom else None
+            known = cls(handler.iter_known_urls(source_sites), capacity=capacity, error_rate=error_rate)
+        finally:
+            handler.client.close()
+
+        logger.info(f"📚 {len(known)} URLs déjà connues chargées ({'Bloom' if use_bloom else 'set'}).")
+        return known
+
+
+class CrawlState:
+    """Point haut et statistiques du dernier passage, par catégorie et par ville."""
+
+    def __init__(self, path: str, data: Optional[dict] = None):
+        self.path = path
+        self.data = data or {}
+
+    @classmethod
+    def load(cls, path: str) -> "CrawlState":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(path, json.load(f))
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ État de crawl illisible ({path}) : {e}. Repart de zéro.")
+            return cls(path)
+
+    @staticmethod
+    def _city_key(city: Optional[str]) -> str:
+        return city or "*"
+
+    def high_water_url(self, category: str, city: Optional[str]) -> Optional[str]:
+        return self.data.get(category, {}).get(self._city_key(city), {}).get("top_url")
+
+    def record(self, category: str, city: Optional[str], top_url: str, pages: int, new_listings: int):
+        self.data.setdefault(category, {})[self._city_key(city)] = {
+            "top_url": top_url,
+            "pages": pages,
+            "new_listings": new_listings,
+            "crawled_at": datetime.now().isoformat(),
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,218 @@
+# scraping/orchestrator.py
+"""
+Orchestration d'un batch de scraping.
+
+Chaque couple (catégorie, ville) devient une unité de travail. Les unités sont réparties
+dans une file par domaine contacté, vidée par un nombre fixe de workers asyncio : toutes
+les catégories d'un même site partagent les mêmes workers, sans retardataire qui bloque le batch.
+
+- Délai maximal par tentative : une unité qui dépasse le délai retourne en fin de file et
+  reprend à la page suivante (elle ne compte comme échec que si elle n'a pas avancé).
+- Nouvelles tentatives avec attente croissante pour les erreurs réseau / blocages.
+- Le parsing HTML peut être déporté dans quelques processus (ParsePool) pour libérer la boucle.
+- Un rapport structuré (RunReport) résume le batch et est enregistré en JSON.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from itertools import chain, zip_longest
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from scraping.output import RecordSink
+from scraping.specs import CategorySpec
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WorkUnit:
+    """Une ville d'une catégorie ; garde son avancement pour qu'une reprise continue à la page suivante."""
+    spec: CategorySpec
+    city: Optional[str]
+    sink: RecordSink  # Fichier JSONL et/ou MongoDB, partagé par les villes de la catégorie
+    next_page: int = 1
+    count: int = 0
+    pages_fetched: int = 0
+    top_url: Optional[str] = None
+    new_listings: int = 0
+    stale_pages: int = 0
+    attempts: int = 0   # Tentatives échouées (erreur, ou délai dépassé sans progression)
+    timeouts: int = 0
+    status: str = "pending"  # pending, done, failed
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def label(self) -> str:
+        return self.city or "tout le Maroc"
+
+
+def interleave_units(units_by_category: Iterable[List[WorkUnit]]) -> List[WorkUnit]:
+    """Alterne les catégories (ville 1 de chaque catégorie, puis ville 2...) pour les faire avancer ensemble."""
+    return [unit for unit in chain.from_iterable(zip_longest(*units_by_category)) if unit is not None]
+
+
+async def run_units(
+    units: List[WorkUnit],
+    crawl: Callable[[WorkUnit], Awaitable[int]],
+    workers_per_domain: int,
+    timeout: Optional[float],
+    retries: int,
+    backoff: float,
+):
+    """
+    Vide une file par domaine avec `workers_per_domain` workers. Chaque unité est terminée
+    (status "done") ou abandonnée après `retries` nouvelles tentatives (status "failed").
+    """
+    queues: Dict[str, asyncio.Queue] = {}
+    for unit in units:
+        queues.setdefault(unit.spec.request_domain, asyncio.Queue()).put_nowait(unit)
+
+    pending_requeues = set()  # Références aux tâches de remise en file (sinon collectables)
+
+    async def _requeue_later(queue: asyncio.Queue, unit: WorkUnit, delay: float):
+        await asyncio.sleep(delay)
+        queue.put_nowait(unit)
+        queue.task_done()  # Après la remise en file : join() ne se termine pas pendant l'attente
+
+    async def _worker(queue: asyncio.Queue):
+        while True:
+            unit = await queue.get()
+            page_before = unit.next_page
+            start = time.monotonic()
+            delay = 0.0
+            try:
+                await asyncio.wait_for(crawl(unit), timeout)
+                unit.status = "done"
+            except asyncio.TimeoutError:
+                unit.timeouts += 1
+                if unit.next_page == page_before:
+                    unit.attempts += 1
+                unit.error = f"délai de {timeout:.0f} s dépassé (page {unit.next_page})"
+                logger.warning(f"⏱️ [{unit.spec.name}] {unit.label} : {unit.error}, remise en file.")
+            except Exception as e:
+                unit.attempts += 1
+                unit.error = str(e)
+                delay = backoff * 2 ** (unit.attempts - 1)
+                logger.warning(f"⚠️ [{unit.spec.name}] {unit.label} : {e} (tentative {unit.attempts}/{retries + 1}).")
+            finally:
+                unit.elapsed += time.monotonic() - start
+
+            if unit.status == "done":
+                queue.task_done()
+            elif unit.attempts > retries:
+                unit.status = "failed"
+                logger.error(f"❌ [{unit.spec.name}] {unit.label} abandonnée après {unit.attempts} échecs : {unit.error}")
+                queue.task_done()
+            else:
+                task = asyncio.create_task(_requeue_later(queue, unit, delay))
+                pending_requeues.add(task)
+                task.add_done_callback(pending_requeues.discard)
+
+    workers = [
+        asyncio.create_task(_worker(queue))
+        for queue in queues.values()
+        for _ in range(max(1, workers_per_domain))
+    ]
+    try:
+        await asyncio.gather(*(queue.join() for queue in queues.values()))
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def _parse_page(spec: CategorySpec, html: str, date_scraped: str) -> list:
+    return spec.parse_page(html, spec, date_scraped)
+
+
+def _warm_up():
+    return os.getpid()
+
+
+class ParsePool:
+    """
+    Parsing des pages dans quelques processus : la boucle asyncio reste disponible pour le réseau.
+    Avec 0 worker, le parsing se fait directement dans la boucle.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor = None
+        if workers > 0:
+            # fork : les processus enfants n'ont pas à réimporter le script principal (main_scraping.py)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            # Lance les processus tout de suite, avant l'ouverture des connexions réseau
+            self._executor.submit(_warm_up).result()
+
+    async def parse(self, spec: CategorySpec, html: str, date_scraped: str) -> list:
+        if self._executor is None:
+            return _parse_page(spec, html, date_scraped)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _parse_page, spec, html, date_scraped)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+@dataclass
+class RunReport:
+    """Résumé structuré d'un batch (renvoyé par run_categories et enregistré en JSON)."""
+    started_at: str
+    finished_at: Optional[str] = None
+    duration_s: float = 0.0
+    categories: Dict[str, dict] = field(default_factory=dict)
+    failed_units: List[dict] = field(default_factory=list)
+    limiter: Dict[str, float] = field(default_factory=dict)
+    cache: Dict[str, int] = field(default_factory=dict)
+    sinks: Dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        """Nombre d'annonces par catégorie."""
+        return {name: category["listings"] for name, category in self.categories.items()}
+
+    @property
+    def completed(self) -> bool:
+        """Vrai si aucune ville n'est à reprendre (une catégorie ignorée faute de clé n'en a pas)."""
+        return not self.failed_units and all(category["status"] != "failed" for category in self.categories.values())
+
+    def add_category(self, spec: CategorySpec, units: List[WorkUnit], status: Optional[str] = None, error: str = None):
+        failed = [unit for unit in units if unit.status != "done"]
+        self.categories[spec.name] = {
+            "status": status or ("done" if not failed else "partial"),
+            "listings": sum(unit.count for unit in units),
+            "cities": len(units),
+            "cities_failed": len(failed),
+            "pages": sum(unit.pages_fetched for unit in units),
+            "retries": sum(unit.attempts for unit in units),
+            "timeouts": sum(unit.timeouts for unit in units),
+            "seconds": round(sum(unit.elapsed for unit in units), 1),
+        }
+        if error:
+            self.categories[spec.name]["error"] = error
+        self.failed_units += [
+            {"category": spec.name, "city": unit.city, "next_page": unit.next_page, "error": unit.error}
+            for unit in failed
+        ]
+
+    def finish(self, started: float):
+        self.finished_at = datetime.now().isoformat()
+        self.duration_s = round(time.monotonic() - started, 1)
+
+    def save(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"run_{self.started_at[:19].replace(':', '-')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=4, ensure_ascii=False)
+        return path
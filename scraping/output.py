@@ -0,0 +1,182 @@
+# scraping/output.py
+"""
+Sortie des annonces en JSON Lines (une annonce par ligne), éventuellement compressée en zstd.
+
+Les annonces sont écrites au fil du crawl via un tampon borné : la mémoire reste constante
+quel que soit le nombre d'annonces, et les étapes suivantes (fusion, import Mongo) peuvent
+lire le fichier avant la fin du crawl.
+"""
+import json
+import logging
+import os
+from typing import Iterator, List, Optional
+
+import zstandard
+
+from scraping.config import OUTPUT_BUFFER_RECORDS, OUTPUT_COMPRESSION
+
+logger = logging.getLogger(__name__)
+
+ZSTD_SUFFIX = ".zst"
+RECORD_SUFFIXES = (".jsonl", ".jsonl" + ZSTD_SUFFIX, ".json")
+
+
+class RecordSink:
+    """Sortie d'annonces (fichier JSONL, MongoDB...) alimentée par les villes d'une catégorie."""
+
+    def write_many(self, records: List[dict]):
+        raise NotImplementedError
+
+    async def wait_for_capacity(self):
+        """Contre-pression : attendue entre deux pages tant que la sortie a trop de retard."""
+
+    def close(self):
+        pass
+
+
+class TeeSink(RecordSink):
+    """Diffuse les annonces vers plusieurs sorties ; ne ferme que celles qu'elle possède."""
+
+    def __init__(self, sinks: List[RecordSink], owned: Optional[List[RecordSink]] = None):
+        self.sinks = sinks
+        self.owned = owned if owned is not None else sinks
+
+    def write_many(self, records: List[dict]):
+        for sink in self.sinks:
+            sink.write_many(records)
+
+    async def wait_for_capacity(self):
+        for sink in self.sinks:
+            await sink.wait_for_capacity()
+
+    def close(self):
+        for sink in self.owned:
+            sink.close()
+
+
+class RecordWriter(RecordSink):
+    """
+    Écrivain JSONL partagé par toutes les villes d'une catégorie.
+    Les lignes sont accumulées puis écrites par lots de `buffer_records`.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = OUTPUT_COMPRESSION,
+                 buffer_records: int = OUTPUT_BUFFER_RECORDS):
+        if compression not in (None, "", "zstd"):
+            raise ValueError(f"Compression non supportée : {compression}")
+        self.compressed = compression == "zstd"
+        if self.compressed and not path.endswith(ZSTD_SUFFIX):
+            path += ZSTD_SUFFIX
+        self.path = path
+        self.buffer_records = max(1, buffer_records)
+        self.count = 0
+        self._buffer: List[str] = []
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._raw = open(path, "wb")
+        self._stream = (
+            zstandard.ZstdCompressor(level=3).stream_writer(self._raw) if self.compressed else self._raw
+        )
+
+    def write(self, record: dict):
+        self._buffer.append(json.dumps(record, ensure_ascii=False))
+        self.count += 1
+        if len(self._buffer) >= self.buffer_records:
+            self.flush()
+
+    def write_many(self, records: List[dict]):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """Vide le tampon sur disque (bloc zstd complet : lisible par un lecteur concurrent)."""
+        if self._buffer:
+            self._stream.write(("\n".join(self._buffer) + "\n").encode("utf-8"))
+            self._buffer.clear()
+        if self.compressed:
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        self._raw.flush()
+
+    def close(self):
+        self.flush()
+        self._stream.close()
+        if not self._raw.closed:
+            self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonArrayWriter(RecordSink):
+    """Tableau JSON compact (sans indentation), écrit en streaming : pour les outils qui attendent du .json."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[")
+
+    def write(self, record: dict):
+        self._file.write(("\n" if not self.count else ",\n")
+                         + json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self.count += 1
+
+    def write_many(self, records: List[dict]):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write("\n]\n")
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_records(path: str) -> Iterator[dict]:
+    """
+    Relit un fichier d'annonces annonce par annonce : JSONL, JSONL zstd ou ancien
+    tableau JSON (lu en streaming avec ijson).
+    """
+    if path.endswith(".json"):
+        import ijson  # Ancien format, uniquement pour les fichiers déjà produits
+
+        with open(path, "rb") as f:
+            for item in ijson.items(f, "item"):
+                # Les anciens fichiers peuvent contenir des listes de listes
+                items = item if isinstance(item, list) else [item]
+                for record in items:
+                    if isinstance(record, dict):
+                        yield record
+        return
+
+    with open(path, "rb") as raw:
+        stream = zstandard.ZstdDecompressor().stream_reader(raw) if path.endswith(ZSTD_SUFFIX) else raw
+        buffer = b""
+        while True:
+            chunk = stream.read(1 << 16)
+            if not chunk:
+                break
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+        if buffer.strip():
+            try:
+                yield json.loads(buffer)
+            except json.JSONDecodeError:
+                # Dernière ligne tronquée : fichier encore en cours d'écriture
+                logger.warning(f"⚠️ Dernière ligne incomplète ignorée dans {path}")
+
+
+def is_records_file(filename: str) -> bool:
+    return filename.endswith(RECORD_SUFFIXES)
@@ -0,0 +1,39 @@
+# scraping/parser_backends.py
+"""
+Choix du backend de parsing HTML des pages de résultats.
+
+- "lxml" : XPath précompilés (parsers_lxml.py), nettement plus rapide ; backend par défaut.
+- "bs4"  : BeautifulSoup + html.parser (parsers.py), implémentation de référence.
+
+Les deux backends produisent les mêmes annonces : `python -m scraping.regression` le vérifie
+sur le corpus de pages enregistrées et compare leur débit (--bench).
+"""
+import logging
+from functools import lru_cache
+from typing import Callable, Optional
+
+from scraping import parsers
+from scraping.config import PARSER_BACKEND
+
+logger = logging.getLogger(__name__)
+
+PARSER_BACKENDS = ("lxml", "bs4")
+PAGE_KINDS = ("mubawab", "promotion", "avito")
+
+
+@lru_cache(maxsize=None)
+def get_page_parser(kind: str, backend: Optional[str] = None) -> Callable:
+    """Retourne le parser de page `parse_<kind>_page` du backend demandé (défaut : SCRAPING_PARSER_BACKEND)."""
+    backend = backend or PARSER_BACKEND
+    if kind not in PAGE_KINDS:
+        raise KeyError(f"Type de page inconnu : {kind}. Types disponibles : {', '.join(PAGE_KINDS)}")
+    if backend not in PARSER_BACKENDS:
+        raise KeyError(f"Backend de parsing inconnu : {backend}. Backends disponibles : {', '.join(PARSER_BACKENDS)}")
+
+    module = parsers
+    if backend == "lxml":
+        try:
+            from scraping import parsers_lxml as module
+        except ImportError as e:
+            logger.warning(f"⚠️ lxml indisponible ({e}) : utilisation de BeautifulSoup.")
+    return getattr(module, f"parse_{kind}_page")
@@ -0,0 +1,384 @@
+# scraping/parsers.py
+"""
+Parsers des pages de résultats (Mubawab, Avito, promotions Mubawab).
+Chaque parser de page prend le HTML brut et renvoie la liste des annonces
+au format commun (mêmes clés que les anciens scripts scraper_*.py).
+Une liste vide signifie « fin de la pagination » pour la ville.
+"""
+import re
+
+from bs4 import BeautifulSoup
+
+MUBAWAB_END_OF_PAGES = "Cette page n'est plus disponible"
+
+
+def _build_record(**fields) -> dict:
+    """Assemble le dictionnaire final avec toutes les clés attendues en aval."""
+    record = {
+        "title": None,
+        "price": None,
+        "location": None,
+        "adresse": "",
+        "property_type": None,
+        "url": None,
+        "source_site": None,
+        "surface": None,
+        "rooms": None,
+        "description": None,
+        "balcon": str(False),
+        "piscine": str(False),
+        "ascenseur": str(False),
+        "etage": None,
+        "age_bien": None,
+        "caracteristiques_supp": "",
+        "images": "",
+        "contact": None,
+        "date_scraped": None,
+        "date_publication": None,
+    }
+    record.update(fields)
+    return record
+
+
+# ==================== MUBAWAB ====================
+
+def parse_mubawab_ad(ad_element, source_site: str, date_scraped: str, property_type: str) -> dict:
+    """
+    Extrait les informations d'une seule annonce Mubawab (div.listingBox).
+    Le type de bien est inféré de la catégorie scrapée.
+    """
+    # --- URL et Titre ---
+    title = None
+    annonce_url = None
+    try:
+        title_link_tag = ad_element.select_one("h2.listingTit a")
+        if title_link_tag:
+            title = title_link_tag.get_text(strip=True)
+            annonce_url = title_link_tag.get('href')
+    except Exception:
+        pass
+
+    # --- Prix ---
+    price = None
+    try:
+        price_tag = ad_element.select_one("span.priceTag")
+        if price_tag:
+            price = re.sub(r'\s+', ' ', price_tag.get_text(strip=True)).replace("\u00a0", " ")
+    except Exception:
+        pass
+
+    # --- Localisation ---
+    location = None
+    try:
+        location_tag = ad_element.select_one("span.listingH3")
+        if location_tag:
+            location = " ".join(location_tag.get_text(strip=True).split())
+    except Exception:
+        pass
+
+    # --- Surface, Pièces, Chambres ---
+    surface = None
+    pieces = None
+    bedrooms = None
+    try:
+        for detail in ad_element.select("div.adDetailFeature"):
+            icon_tag = detail.select_one("i")
+            if not icon_tag:
+                continue
+
+            icon_class = icon_tag.get("class", [])
+            span_text = " ".join(detail.select_one("span").get_text(strip=True).split())
+
+            if "icon-triangle" in icon_class:
+                surface = span_text
+            elif "icon-house-boxes" in icon_class:
+                pieces = span_text.split(" ")[0]
+            elif "icon-bed" in icon_class:
+                bedrooms = span_text.split(" ")[0]
+    except Exception:
+        pass
+
+    # --- Description ---
+    description = None
+    try:
+        desc_tag = ad_element.select_one("p.listingP")
+        if desc_tag:
+            description = desc_tag.get_text(strip=True)
+    except Exception:
+        pass
+
+    # --- Caractéristiques (Balcon, Piscine, Ascenseur, etc.) ---
+    caracteristiques_supp_list = []
+    balcon = False
+    piscine = False
+    ascenseur = False
+    try:
+        for feat in ad_element.select("div.adFeatures div.adFeature span"):
+            feat_text = feat.get_text(strip=True).lower()
+            if feat_text:
+                caracteristiques_supp_list.append(feat_text.capitalize())
+
+                if "terrasse" in feat_text or "balcon" in feat_text:
+                    balcon = True
+                if "piscine" in feat_text:
+                    piscine = True
+                if "ascenseur" in feat_text:
+                    ascenseur = True
+    except Exception:
+        pass
+
+    # --- Images ---
+    images = []
+    try:
+        images_tags = ad_element.select("div.adSlider img[data-lazy]")
+        images = [img.get("data-lazy") for img in images_tags if img.get("data-lazy")]
+    except Exception:
+        pass
+
+    return _build_record(
+        title=title,
+        price=price,
+        location=location,
+        property_type=property_type,
+        url=annonce_url,
+        source_site=source_site,
+        surface=surface,
+        rooms=pieces or bedrooms,  # Priorise "Pièces" ou "Chambres"
+        description=description,
+        balcon=str(balcon),
+        piscine=str(piscine),
+        ascenseur=str(ascenseur),
+        caracteristiques_supp=";".join(caracteristiques_supp_list),
+        images=";".join(images),
+        date_scraped=date_scraped,
+    )
+
+
+def parse_mubawab_page(html: str, spec, date_scraped: str) -> list:
+    """Parse une page de résultats Mubawab et ne garde que les vraies annonces (/fr/a/)."""
+    if MUBAWAB_END_OF_PAGES in html:
+        return []
+
+    soup = BeautifulSoup(html, "html.parser")
+    ad_prefix = f"{spec.base_url}/fr/a/"
+
+    records = []
+    for ad in soup.find_all("div", class_="listingBox"):
+        link_ref = ad.get('linkref')
+        if link_ref and link_ref.startswith(ad_prefix):
+            records.append(parse_mubawab_ad(ad, spec.base_url, date_scraped, spec.property_type))
+    return records
+
+
+# ==================== MUBAWAB (PROMOTIONS) ====================
+
+def parse_promotion_ad(ad_element, source_site: str, date_scraped: str) -> dict:
+    """Extrait les informations d'une seule annonce de promotion (div.promotionBox)."""
+    # --- URL et Titre ---
+    title = None
+    annonce_url = None
+    try:
+        link_tag = ad_element.find("a")
+        if link_tag:
+            relative_url = link_tag.get('href')
+            if relative_url:
+                annonce_url = source_site + relative_url
+
+        title_tag = ad_element.select_one("h4")
+        if title_tag:
+            title = title_tag.get_text(strip=True)
+    except Exception:
+        pass
+
+    # --- Prix ---
+    price = None
+    try:
+        price_tag = ad_element.select_one("span.price")
+        if price_tag:
+            price = re.sub(r'\s+', ' ', price_tag.get_text(strip=True)).replace("\u00a0", " ")
+    except Exception:
+        pass
+
+    # --- Localisation ---
+    location = None
+    try:
+        location_tag = ad_element.select_one("span.location")
+        if location_tag:
+            location = location_tag.get_text(strip=True)
+    except Exception:
+        pass
+
+    # --- Type de propriété ---
+    property_type = None
+    try:
+        type_tag = ad_element.select_one("span.types")
+        if type_tag:
+            property_type = type_tag.get_text(strip=True)
+    except Exception:
+        pass
+
+    # --- Description ---
+    description = None
+    try:
+        desc_tag = ad_element.select_one("p.desc")
+        if desc_tag:
+            description = desc_tag.get_text(strip=True)
+    except Exception:
+        pass
+
+    # --- Caractéristiques ---
+    caracteristiques_supp_list = []
+    try:
+        for feat in ad_element.select("div.proDetails span"):
+            feat_text = feat.get_text(strip=True)
+            if feat_text:
+                caracteristiques_supp_list.append(feat_text)
+    except Exception:
+        pass
+
+    # --- Images ---
+    images = []
+    try:
+        img_tag = ad_element.select_one("div.imgBox img")
+        if img_tag and img_tag.get('src'):
+            images = [img_tag.get('src')]
+    except Exception:
+        pass
+
+    return _build_record(
+        title=title,
+        price=price,
+        location=location,
+        property_type=property_type or "Promotion Immobilière",  # Fallback
+        url=annonce_url,
+        source_site=source_site,
+        description=description,
+        caracteristiques_supp=";".join(caracteristiques_supp_list),
+        images=";".join(images),
+        date_scraped=date_scraped,
+    )
+
+
+def parse_promotion_page(html: str, spec, date_scraped: str) -> list:
+    """Parse une page du listing des promotions immobilières Mubawab."""
+    soup = BeautifulSoup(html, "html.parser")
+    return [
+        parse_promotion_ad(ad, spec.base_url, date_scraped)
+        for ad in soup.find_all("div", class_="promotionBox")
+    ]
+
+
+# ==================== AVITO ====================
+
+def parse_avito_ad(ad_element, source_site: str, date_scraped: str) -> dict:
+    """Extrait les informations d'une seule annonce Avito (a.sc-1jge648-0)."""
+    # --- URL ---
+    try:
+        annonce_url = ad_element.get('href')
+        if annonce_url and not annonce_url.startswith('http'):
+            annonce_url = source_site + annonce_url
+    except Exception:
+        annonce_url = None
+
+    # --- Titre ---
+    try:
+        title = ad_element.find("p", class_="iHApav").get('title')
+    except Exception:
+        title = None
+
+    # --- Prix ---
+    price = None
+    try:
+        price_element = ad_element.find("p", class_="dJAfqm")
+        if price_element:
+            # Vérifier s'il s'agit de "Demander le prix"
+            if price_element.find("span", class_="fftEKO"):
+                price = "Demander le prix"
+            else:
+                price_span = price_element.find("span", class_="PuYkS")
+                currency_span = price_element.find("span", class_="eHXozK")  # Devise
+
+                if price_span and currency_span:
+                    price_value = price_span.text.strip().replace("\u202f", "")
+                    price = f"{price_value} {currency_span.text.strip()}"
+                else:
+                    # Fallback si la structure est inattendue
+                    price = price_element.get_text(strip=True, separator=" ")
+    except Exception:
+        price = None
+
+    # --- Localisation et Type de propriété ---
+    property_type = None
+    location = None
+    try:
+        location_p = ad_element.find("div", class_="fHMeoC").find("p", class_="layWaX")
+        if location_p:
+            full_location_text = location_p.text.strip()
+            # Sépare "Appartements dans Casablanca, Maarif"
+            parts = full_location_text.split(" dans ")
+            if len(parts) == 2:
+                property_type = parts[0].strip()
+                location = parts[1].strip()
+            else:
+                location = full_location_text  # Fallback
+    except Exception:
+        pass
+
+    # --- Caractéristiques (Surface, Chambres, etc.) ---
+    surface = None
+    rooms = None
+    caracteristiques_supp_list = []
+    try:
+        for span in ad_element.select(".sc-b57yxx-2.cCLvhv > span.cAiIZZ"):
+            inner_span = span.find("span", title=True)
+            if inner_span:
+                feature_title = inner_span.get('title')
+                feature_value = inner_span.get_text(strip=True).replace("\u202f", "")
+
+                caracteristiques_supp_list.append(f"{feature_title}: {feature_value}")
+
+                if feature_title == "Chambres":
+                    rooms = feature_value
+                elif feature_title == "Surface totale":
+                    surface = feature_value  # ex: "109 m²"
+    except Exception:
+        pass
+
+    # --- Images ---
+    images = []
+    try:
+        main_image = ad_element.find("img", class_="kdSDie").get('src')
+        if main_image:
+            images = [main_image]
+    except Exception:
+        pass
+
+    # --- Date de Publication ---
+    try:
+        date_pub = ad_element.find("div", class_="jDipnj").find("p", class_="layWaX").text.strip()
+    except Exception:
+        date_pub = None
+
+    return _build_record(
+        title=title,
+        price=price,
+        location=location,
+        property_type=property_type,
+        url=annonce_url,
+        source_site=source_site,
+        surface=surface,
+        rooms=rooms,
+        caracteristiques_supp=";".join(caracteristiques_supp_list),
+        images=";".join(images),
+        date_scraped=date_scraped,
+        date_publication=date_pub,
+    )
+
+
+def parse_avito_page(html: str, spec, date_scraped: str) -> list:
+    """Parse une page de résultats Avito."""
+    soup = BeautifulSoup(html, "html.parser")
+    return [
+        parse_avito_ad(ad, spec.base_url, date_scraped)
+        for ad in soup.find_all("a", class_="sc-1jge648-0")
+    ]
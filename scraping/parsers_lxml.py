@@ -0,0 +1,342 @@
+# scraping/parsers_lxml.py
+"""
+Backend lxml des parsers de pages (voir parsers.py pour le backend BeautifulSoup de référence).
+
+Les sélecteurs sont des XPath compilés une seule fois au chargement du module.
+Chaque fonction reproduit exactement les champs (et les cas limites) du parser
+BeautifulSoup correspondant : les deux backends doivent produire les mêmes annonces.
+"""
+import re
+
+import lxml.html
+from lxml import etree
+
+from scraping.parsers import MUBAWAB_END_OF_PAGES, _build_record
+
+
+def _cls(name: str) -> str:
+    """Prédicat XPath équivalent au sélecteur CSS `.name`."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _xpath(expression: str) -> etree.XPath:
+    return etree.XPath(expression, smart_strings=False)
+
+
+_TEXT_NODES = _xpath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+
+
+def _text(element) -> str:
+    """Équivalent de `Tag.text` (commentaires et scripts exclus, comme BeautifulSoup)."""
+    return "".join(_TEXT_NODES(element))
+
+
+def _strings(element) -> list:
+    return [s.strip() for s in _TEXT_NODES(element) if s.strip()]
+
+
+def _text_strip(element, separator: str = "") -> str:
+    """Équivalent de `Tag.get_text(strip=True, separator=...)`."""
+    return separator.join(_strings(element))
+
+
+def _first(xpath: etree.XPath, element):
+    found = xpath(element)
+    return found[0] if found else None
+
+
+def _parse_document(html: str):
+    try:
+        return lxml.html.document_fromstring(html)
+    except ValueError:
+        # Chaîne avec déclaration d'encodage XML : lxml exige des octets
+        return lxml.html.document_fromstring(html.encode("utf-8"))
+
+
+# ==================== MUBAWAB ====================
+
+_MUBAWAB_ADS = _xpath(f"//div[{_cls('listingBox')}]")
+_MUBAWAB_TITLE_LINK = _xpath(f".//h2[{_cls('listingTit')}]//a")
+_MUBAWAB_PRICE = _xpath(f".//span[{_cls('priceTag')}]")
+_MUBAWAB_LOCATION = _xpath(f".//span[{_cls('listingH3')}]")
+_MUBAWAB_DETAILS = _xpath(f".//div[{_cls('adDetailFeature')}]")
+_MUBAWAB_DETAIL_ICON = _xpath(".//i")
+_MUBAWAB_DETAIL_SPAN = _xpath(".//span")
+_MUBAWAB_DESCRIPTION = _xpath(f".//p[{_cls('listingP')}]")
+_MUBAWAB_FEATURES = _xpath(f".//div[{_cls('adFeatures')}]//div[{_cls('adFeature')}]//span")
+_MUBAWAB_IMAGES = _xpath(f".//div[{_cls('adSlider')}]//img[@data-lazy]")
+
+
+def parse_mubawab_ad(ad_element, source_site: str, date_scraped: str, property_type: str) -> dict:
+    """Extrait une annonce Mubawab (div.listingBox), comme parsers.parse_mubawab_ad."""
+    title = None
+    annonce_url = None
+    title_link_tag = _first(_MUBAWAB_TITLE_LINK, ad_element)
+    if title_link_tag is not None:
+        title = _text_strip(title_link_tag)
+        annonce_url = title_link_tag.get("href")
+
+    price = None
+    price_tag = _first(_MUBAWAB_PRICE, ad_element)
+    if price_tag is not None:
+        price = re.sub(r'\s+', ' ', _text_strip(price_tag)).replace("\u00a0", " ")
+
+    location = None
+    location_tag = _first(_MUBAWAB_LOCATION, ad_element)
+    if location_tag is not None:
+        location = " ".join(_text_strip(location_tag).split())
+
+    # --- Surface, Pièces, Chambres ---
+    surface = None
+    pieces = None
+    bedrooms = None
+    for detail in _MUBAWAB_DETAILS(ad_element):
+        icon_tag = _first(_MUBAWAB_DETAIL_ICON, detail)
+        if icon_tag is None:
+            continue
+        span_tag = _first(_MUBAWAB_DETAIL_SPAN, detail)
+        if span_tag is None:
+            break  # Le parser BeautifulSoup abandonne les détails restants dans ce cas
+
+        icon_class = (icon_tag.get("class") or "").split()
+        span_text = " ".join(_text_strip(span_tag).split())
+
+        if "icon-triangle" in icon_class:
+            surface = span_text
+        elif "icon-house-boxes" in icon_class:
+            pieces = span_text.split(" ")[0]
+        elif "icon-bed" in icon_class:
+            bedrooms = span_text.split(" ")[0]
+
+    description = None
+    desc_tag = _first(_MUBAWAB_DESCRIPTION, ad_element)
+    if desc_tag is not None:
+        description = _text_strip(desc_tag)
+
+    # --- Caractéristiques (Balcon, Piscine, Ascenseur, etc.) ---
+    caracteristiques_supp_list = []
+    balcon = False
+    piscine = False
+    ascenseur = False
+    for feat in _MUBAWAB_FEATURES(ad_element):
+        feat_text = _text_strip(feat).lower()
+        if feat_text:
+            caracteristiques_supp_list.append(feat_text.capitalize())
+
+            if "terrasse" in feat_text or "balcon" in feat_text:
+                balcon = True
+            if "piscine" in feat_text:
+                piscine = True
+            if "ascenseur" in feat_text:
+                ascenseur = True
+
+    images = [img.get("data-lazy") for img in _MUBAWAB_IMAGES(ad_element) if img.get("data-lazy")]
+
+    return _build_record(
+        title=title,
+        price=price,
+        location=location,
+        property_type=property_type,
+        url=annonce_url,
+        source_site=source_site,
+        surface=surface,
+        rooms=pieces or bedrooms,  # Priorise "Pièces" ou "Chambres"
+        description=description,
+        balcon=str(balcon),
+        piscine=str(piscine),
+        ascenseur=str(ascenseur),
+        caracteristiques_supp=";".join(caracteristiques_supp_list),
+        images=";".join(images),
+        date_scraped=date_scraped,
+    )
+
+
+def parse_mubawab_page(html: str, spec, date_scraped: str) -> list:
+    """Parse une page de résultats Mubawab et ne garde que les vraies annonces (/fr/a/)."""
+    if MUBAWAB_END_OF_PAGES in html:
+        return []
+
+    root = _parse_document(html)
+    ad_prefix = f"{spec.base_url}/fr/a/"
+
+    records = []
+    for ad in _MUBAWAB_ADS(root):
+        link_ref = ad.get("linkref")
+        if link_ref and link_ref.startswith(ad_prefix):
+            records.append(parse_mubawab_ad(ad, spec.base_url, date_scraped, spec.property_type))
+    return records
+
+
+# ==================== MUBAWAB (PROMOTIONS) ====================
+
+_PROMOTION_ADS = _xpath(f"//div[{_cls('promotionBox')}]")
+_PROMOTION_LINK = _xpath(".//a")
+_PROMOTION_TITLE = _xpath(".//h4")
+_PROMOTION_PRICE = _xpath(f".//span[{_cls('price')}]")
+_PROMOTION_LOCATION = _xpath(f".//span[{_cls('location')}]")
+_PROMOTION_TYPE = _xpath(f".//span[{_cls('types')}]")
+_PROMOTION_DESCRIPTION = _xpath(f".//p[{_cls('desc')}]")
+_PROMOTION_FEATURES = _xpath(f".//div[{_cls('proDetails')}]//span")
+_PROMOTION_IMAGE = _xpath(f".//div[{_cls('imgBox')}]//img")
+
+
+def parse_promotion_ad(ad_element, source_site: str, date_scraped: str) -> dict:
+    """Extrait une annonce de promotion (div.promotionBox), comme parsers.parse_promotion_ad."""
+    annonce_url = None
+    link_tag = _first(_PROMOTION_LINK, ad_element)
+    if link_tag is not None:
+        relative_url = link_tag.get("href")
+        if relative_url:
+            annonce_url = source_site + relative_url
+
+    title_tag = _first(_PROMOTION_TITLE, ad_element)
+    title = _text_strip(title_tag) if title_tag is not None else None
+
+    price = None
+    price_tag = _first(_PROMOTION_PRICE, ad_element)
+    if price_tag is not None:
+        price = re.sub(r'\s+', ' ', _text_strip(price_tag)).replace("\u00a0", " ")
+
+    location_tag = _first(_PROMOTION_LOCATION, ad_element)
+    location = _text_strip(location_tag) if location_tag is not None else None
+
+    type_tag = _first(_PROMOTION_TYPE, ad_element)
+    property_type = _text_strip(type_tag) if type_tag is not None else None
+
+    desc_tag = _first(_PROMOTION_DESCRIPTION, ad_element)
+    description = _text_strip(desc_tag) if desc_tag is not None else None
+
+    caracteristiques_supp_list = [
+        feat_text for feat_text in (_text_strip(feat) for feat in _PROMOTION_FEATURES(ad_element)) if feat_text
+    ]
+
+    images = []
+    img_tag = _first(_PROMOTION_IMAGE, ad_element)
+    if img_tag is not None and img_tag.get("src"):
+        images = [img_tag.get("src")]
+
+    return _build_record(
+        title=title,
+        price=price,
+        location=location,
+        property_type=property_type or "Promotion Immobilière",  # Fallback
+        url=annonce_url,
+        source_site=source_site,
+        description=description,
+        caracteristiques_supp=";".join(caracteristiques_supp_list),
+        images=";".join(images),
+        date_scraped=date_scraped,
+    )
+
+
+def parse_promotion_page(html: str, spec, date_scraped: str) -> list:
+    """Parse une page du listing des promotions immobilières Mubawab."""
+    root = _parse_document(html)
+    return [parse_promotion_ad(ad, spec.base_url, date_scraped) for ad in _PROMOTION_ADS(root)]
+
+
+# ==================== AVITO ====================
+
+_AVITO_ADS = _xpath(f"//a[{_cls('sc-1jge648-0')}]")
+_AVITO_TITLE = _xpath(f".//p[{_cls('iHApav')}]")
+_AVITO_PRICE = _xpath(f".//p[{_cls('dJAfqm')}]")
+_AVITO_PRICE_ON_REQUEST = _xpath(f".//span[{_cls('fftEKO')}]")
+_AVITO_PRICE_VALUE = _xpath(f".//span[{_cls('PuYkS')}]")
+_AVITO_CURRENCY = _xpath(f".//span[{_cls('eHXozK')}]")
+_AVITO_LOCATION_BLOCK = _xpath(f".//div[{_cls('fHMeoC')}]")
+_AVITO_DATE_BLOCK = _xpath(f".//div[{_cls('jDipnj')}]")
+_AVITO_LAYWAX = _xpath(f".//p[{_cls('layWaX')}]")
+_AVITO_FEATURES = _xpath(f".//*[{_cls('sc-b57yxx-2')} and {_cls('cCLvhv')}]/span[{_cls('cAiIZZ')}]")
+_AVITO_FEATURE_TITLE = _xpath(".//span[@title]")
+_AVITO_IMAGE = _xpath(f".//img[{_cls('kdSDie')}]")
+
+
+def _avito_block_text(ad_element, block_xpath):
+    """Texte du p.layWaX d'un bloc Avito, None si le bloc ou le paragraphe manque."""
+    block = _first(block_xpath, ad_element)
+    if block is None:
+        return None
+    paragraph = _first(_AVITO_LAYWAX, block)
+    return _text(paragraph).strip() if paragraph is not None else None
+
+
+def parse_avito_ad(ad_element, source_site: str, date_scraped: str) -> dict:
+    """Extrait une annonce Avito (a.sc-1jge648-0), comme parsers.parse_avito_ad."""
+    annonce_url = ad_element.get("href")
+    if annonce_url and not annonce_url.startswith("http"):
+        annonce_url = source_site + annonce_url
+
+    title_tag = _first(_AVITO_TITLE, ad_element)
+    title = title_tag.get("title") if title_tag is not None else None
+
+    price = None
+    price_element = _first(_AVITO_PRICE, ad_element)
+    if price_element is not None:
+        # Vérifier s'il s'agit de "Demander le prix"
+        if _first(_AVITO_PRICE_ON_REQUEST, price_element) is not None:
+            price = "Demander le prix"
+        else:
+            price_span = _first(_AVITO_PRICE_VALUE, price_element)
+            currency_span = _first(_AVITO_CURRENCY, price_element)
+
+            if price_span is not None and currency_span is not None:
+                price_value = _text(price_span).strip().replace("\u202f", "")
+                price = f"{price_value} {_text(currency_span).strip()}"
+            else:
+                # Fallback si la structure est inattendue
+                price = _text_strip(price_element, separator=" ")
+
+    property_type = None
+    location = None
+    full_location_text = _avito_block_text(ad_element, _AVITO_LOCATION_BLOCK)
+    if full_location_text is not None:
+        # Sépare "Appartements dans Casablanca, Maarif"
+        parts = full_location_text.split(" dans ")
+        if len(parts) == 2:
+            property_type = parts[0].strip()
+            location = parts[1].strip()
+        else:
+            location = full_location_text  # Fallback
+
+    # --- Caractéristiques (Surface, Chambres, etc.) ---
+    surface = None
+    rooms = None
+    caracteristiques_supp_list = []
+    for span in _AVITO_FEATURES(ad_element):
+        inner_span = _first(_AVITO_FEATURE_TITLE, span)
+        if inner_span is not None:
+            feature_title = inner_span.get("title")
+            feature_value = _text_strip(inner_span).replace("\u202f", "")
+
+            caracteristiques_supp_list.append(f"{feature_title}: {feature_value}")
+
+            if feature_title == "Chambres":
+                rooms = feature_value
+            elif feature_title == "Surface totale":
+                surface = feature_value  # ex: "109 m²"
+
+    images = []
+    image_tag = _first(_AVITO_IMAGE, ad_element)
+    if image_tag is not None and image_tag.get("src"):
+        images = [image_tag.get("src")]
+
+    return _build_record(
+        title=title,
+        price=price,
+        location=location,
+        property_type=property_type,
+        url=annonce_url,
+        source_site=source_site,
+        surface=surface,
+        rooms=rooms,
+        caracteristiques_supp=";".join(caracteristiques_supp_list),
+        images=";".join(images),
+        date_scraped=date_scraped,
+        date_publication=_avito_block_text(ad_element, _AVITO_DATE_BLOCK),
+    )
+
+
+def parse_avito_page(html: str, spec, date_scraped: str) -> list:
+    """Parse une page de résultats Avito."""
+    root = _parse_document(html)
+    return [parse_avito_ad(ad, spec.base_url, date_scraped) for ad in _AVITO_ADS(root)]
@@ -0,0 +1,124 @@
+# scraping/pipeline.py
+"""
+Mode pipeline : les annonces parsées partent directement dans MongoDB pendant le crawl.
+
+Plus de passage par data/*.jsonl -> combined_data -> import : MongoSink regroupe les annonces
+en lots d'upserts (MongoDBHandler._process_batch) envoyés par un pool de threads. Le nombre
+de lots en cours est borné ; au-delà, les villes attendent avant de demander la page suivante
+(contre-pression). Les lots partent aussi après quelques secondes, même incomplets : une
+nouvelle annonce est cherchable peu après avoir été scrapée.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from scraping.config import PIPELINE_BATCH_SIZE, PIPELINE_FLUSH_SECONDS, PIPELINE_MAX_PENDING_BATCHES
+from scraping.output import RecordSink
+
+logger = logging.getLogger(__name__)
+
+SINK_NAMES = ("files", "mongo")
+
+
+def parse_sinks(value: str) -> tuple:
+    """Lit "files,mongo" -> ("files", "mongo") en vérifiant les noms."""
+    sinks = tuple(dict.fromkeys(part.strip().lower() for part in value.split(",") if part.strip()))
+    unknown = [sink for sink in sinks if sink not in SINK_NAMES]
+    if unknown or not sinks:
+        raise ValueError(f"Sorties inconnues : {value!r}. Sorties disponibles : {', '.join(SINK_NAMES)}")
+    return sinks
+
+
+class MongoSink(RecordSink):
+    """Sortie MongoDB partagée par toutes les catégories d'un batch (upserts par lots)."""
+
+    def __init__(self, handler_factory: Optional[Callable] = None, batch_size: int = PIPELINE_BATCH_SIZE,
+                 flush_seconds: float = PIPELINE_FLUSH_SECONDS,
+                 max_pending_batches: int = PIPELINE_MAX_PENDING_BATCHES, workers: int = 4):
+        if handler_factory is None:
+            from db.mongo_client import MongoDBHandler
+            handler_factory = MongoDBHandler
+        self.handler = handler_factory()
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending_batches = max(1, max_pending_batches)
+        self.received = 0
+        self.written = 0
+        self.batches = 0
+        self._buffer: List[dict] = []
+        self._buffer_since: Optional[float] = None
+        self._pending: List[Future] = []
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mongo-sink")
+
+    def write_many(self, records: List[dict]):
+        if not records:
+            return
+        if self._buffer_since is None:
+            self._buffer_since = time.monotonic()
+        # Copie : le lot est envoyé par un autre thread, les annonces restent partagées avec les autres sorties
+        self._buffer.extend(dict(record) for record in records)
+        self.received += len(records)
+        while len(self._buffer) >= self.batch_size:
+            self._submit(self._buffer[:self.batch_size])
+            self._buffer = self._buffer[self.batch_size:]
+            self._buffer_since = time.monotonic() if self._buffer else None
+        if self._buffer and time.monotonic() - self._buffer_since >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._submit(self._buffer)
+            self._buffer = []
+        self._buffer_since = None
+
+    def _submit(self, batch: List[dict]):
+        self.batches += 1
+        self._pending.append(self._executor.submit(self.handler._process_batch, batch))
+
+    def _collect_done(self):
+        still_pending = []
+        for future in self._pending:
+            if future.done():
+                self._count_result(future)
+            else:
+                still_pending.append(future)
+        self._pending = still_pending
+
+    def _count_result(self, future: Future):
+        try:
+            self.written += future.result() or 0
+        except Exception as e:
+            # Un lot en échec ne doit pas interrompre le crawl : les fichiers restent la source de reprise
+            logger.error(f"❌ Lot MongoDB en échec : {e}")
+
+    async def wait_for_capacity(self):
+        if self._buffer and time.monotonic() - self._buffer_since >= self.flush_seconds:
+            self.flush()
+        self._collect_done()
+        while len(self._pending) >= self.max_pending_batches:
+            await asyncio.wrap_future(self._pending[0])
+            self._collect_done()
+
+    async def aclose(self):
+        """Envoie le dernier lot et attend la fin de toutes les écritures sans bloquer la boucle."""
+        self.flush()
+        if self._pending:
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in self._pending), return_exceptions=True)
+        self.close()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+        for future in self._pending:
+            self._count_result(future)
+        self._pending = []
+        if self.written and hasattr(self.handler, "refresh_stats"):
+            self.handler.refresh_stats()  # Cube de statistiques à jour après l'import
+        logger.info(f"🍃 Pipeline MongoDB : {self.received} annonces reçues, {self.written} écritures, {self.batches} lots.")
+
+    def stats(self) -> Dict[str, int]:
+        stats = {"received": self.received, "written": self.written, "batches": self.batches}
+        stats.update(getattr(self.handler, "stats", {}))  # Nouvelles / modifiées / inchangées
+        return stats
@@ -0,0 +1,114 @@
+# scraping/rate_limit.py
+"""
+Limiteur de débit par domaine (token bucket) partagé par toutes les catégories.
+
+Chaque hôte (mubawab.ma, avito.ma, api.scraperapi.com) a son propre seau :
+`rate` jetons par seconde, au plus `burst` jetons en réserve. Sur un 429/503 le
+débit est divisé par deux et le domaine est mis en pause (Retry-After si fourni),
+puis il remonte progressivement vers le débit configuré à chaque succès.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from scraping.config import DEFAULT_RATE_LIMIT, RATE_LIMITS
+
+logger = logging.getLogger(__name__)
+
+# Codes HTTP qui signalent que l'on va trop vite
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class TokenBucket:
+    """Seau à jetons asynchrone avec backoff adaptatif (AIMD)."""
+
+    def __init__(self, rate: float, burst: int, min_rate: Optional[float] = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 10
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Attend qu'un jeton soit disponible (les appelants sont servis dans l'ordre d'arrivée)."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, retry_after: Optional[float] = None):
+        """Réduit le débit de moitié et bloque le domaine pendant `retry_after` secondes."""
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        pause = retry_after if retry_after is not None else 1 / self.rate
+        self.blocked_until = max(self.blocked_until, now + pause)
+
+    def reward(self):
+        """Remonte doucement le débit après une réponse réussie."""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class DomainRateLimiter:
+    """Registre des seaux par domaine. Une instance est partagée par tout un batch."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 default: Tuple[float, int] = DEFAULT_RATE_LIMIT):
+        self.limits = dict(RATE_LIMITS if limits is None else limits)
+        self.default = default
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    @staticmethod
+    def normalize(domain: str) -> str:
+        domain = domain.lower()
+        return domain[4:] if domain.startswith("www.") else domain
+
+    def bucket(self, domain: str) -> TokenBucket:
+        domain = self.normalize(domain)
+        if domain not in self._buckets:
+            rate, burst = self.limits.get(domain, self.default)
+            self._buckets[domain] = TokenBucket(rate, burst)
+        return self._buckets[domain]
+
+    async def acquire(self, domain: str):
+        await self.bucket(domain).acquire()
+
+    def penalize(self, domain: str, retry_after: Optional[float] = None):
+        bucket = self.bucket(domain)
+        bucket.penalize(retry_after)
+        logger.warning(f"🐢 {self.normalize(domain)} ralenti : {bucket.rate:.2f} req/s")
+
+    def reward(self, domain: str):
+        self.bucket(domain).reward()
+
+    def stats(self) -> Dict[str, float]:
+        """Débit courant par domaine (pour les logs de fin de batch)."""
+        return {domain: round(bucket.rate, 3) for domain, bucket in self._buckets.items()}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Lit l'en-tête Retry-After (en secondes uniquement ; les dates HTTP sont ignorées)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
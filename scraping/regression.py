@@ -0,0 +1,269 @@
+# scraping/regression.py
+"""
+Corpus de pages HTML enregistrées et harnais de non-régression / benchmark des parsers.
+
+Le corpus est rangé par catégorie : scraping/fixtures/<catégorie>/<ville>_p<page>.html
+(ville "all" pour les catégories sans découpage par ville). À côté de chaque page, le
+fichier .golden.json contient les annonces attendues. Aucun accès réseau n'est nécessaire.
+
+Usage :
+    python -m scraping.regression                       # compare tous les backends aux golden (code 1 si écart)
+    python -m scraping.regression --bench --repeat 50   # pages/s, annonces/s et pic mémoire par parser
+    python -m scraping.regression --bench --save-baseline bench_baseline.json
+    python -m scraping.regression --bench --baseline bench_baseline.json --tolerance 0.25
+    python -m scraping.regression --update-golden       # régénère les golden avec le parser de référence (bs4)
+    python -m scraping.regression --record appartement_a_vendre_muwabab --city rabat   # enregistre une page live
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from scraping.parser_backends import PARSER_BACKENDS, get_page_parser
+from scraping.specs import CATEGORIES, CategorySpec, get_spec
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+GOLDEN_SUFFIX = ".golden.json"
+REFERENCE_BACKEND = "bs4"
+DATE_SCRAPED = "2025-01-01T00:00:00"  # Date figée pour des golden stables
+
+_FIXTURE_NAME = re.compile(r"^(?P<city>.+)_p(?P<page>\d+)\.html$")
+
+
+@dataclass
+class FixturePage:
+    """Une page de résultats enregistrée pour une catégorie."""
+    spec: CategorySpec
+    path: str
+    city: Optional[str]
+    page: int
+    html: str
+
+    @property
+    def golden_path(self) -> str:
+        return self.path[:-len(".html")] + GOLDEN_SUFFIX
+
+    @property
+    def label(self) -> str:
+        return os.path.relpath(self.path, FIXTURES_DIR)
+
+    def parse(self, backend: str) -> List[dict]:
+        return get_page_parser(self.spec.page_kind, backend)(self.html, self.spec, DATE_SCRAPED)
+
+
+def fixture_path(spec: CategorySpec, city: Optional[str], page: int) -> str:
+    return os.path.join(FIXTURES_DIR, spec.name, f"{city or 'all'}_p{page}.html")
+
+
+def load_corpus(names: Optional[Iterable[str]] = None) -> List[FixturePage]:
+    """Charge les pages enregistrées (toutes les catégories par défaut)."""
+    specs = [get_spec(name) for name in names] if names else list(CATEGORIES)
+    pages = []
+    for spec in specs:
+        category_dir = os.path.join(FIXTURES_DIR, spec.name)
+        if not os.path.isdir(category_dir):
+            continue
+        for filename in sorted(os.listdir(category_dir)):
+            match = _FIXTURE_NAME.match(filename)
+            if not match:
+                continue
+            path = os.path.join(category_dir, filename)
+            with open(path, "r", encoding="utf-8") as f:
+                html = f.read()
+            city = None if match["city"] == "all" else match["city"]
+            pages.append(FixturePage(spec, path, city, int(match["page"]), html))
+    return pages
+
+
+def _load_golden(page: FixturePage) -> Optional[List[dict]]:
+    if not os.path.exists(page.golden_path):
+        return None
+    with open(page.golden_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _describe_diff(expected: List[dict], actual: List[dict]) -> str:
+    if len(expected) != len(actual):
+        return f"{len(actual)} annonces au lieu de {len(expected)}"
+    for index, (want, got) in enumerate(zip(expected, actual)):
+        fields = sorted(key for key in set(want) | set(got) if want.get(key) != got.get(key))
+        if fields:
+            key = fields[0]
+            return f"annonce {index}, champs {', '.join(fields)} (ex. {key}: {want.get(key)!r} -> {got.get(key)!r})"
+    return "ordre des champs différent"
+
+
+def check_corpus(pages: List[FixturePage], backends: Iterable[str]) -> List[str]:
+    """Compare chaque page parsée aux golden ; retourne la liste des écarts."""
+    failures = []
+    for page in pages:
+        golden = _load_golden(page)
+        if golden is None:
+            failures.append(f"{page.label} : golden manquant (lancer --update-golden)")
+            continue
+        for backend in backends:
+            records = page.parse(backend)
+            if records != golden:
+                failures.append(f"{page.label} [{backend}] : {_describe_diff(golden, records)}")
+    return failures
+
+
+def update_golden(pages: List[FixturePage]):
+    for page in pages:
+        records = page.parse(REFERENCE_BACKEND)
+        with open(page.golden_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=4, ensure_ascii=False)
+            f.write("\n")
+        print(f"💾 {page.label} : {len(records)} annonces -> {os.path.basename(page.golden_path)}")
+
+
+def bench_corpus(pages: List[FixturePage], backends: Iterable[str], repeat: int) -> Dict[str, Dict[str, dict]]:
+    """
+    Mesure, par backend et par parser (mubawab / promotion / avito) : pages/s, annonces/s
+    et pic mémoire moyen d'une page (tracemalloc, mesuré sur une passe séparée).
+    tracemalloc ne voit que les allocations Python : l'arbre lxml, alloué en C, n'y figure pas.
+    """
+    results: Dict[str, Dict[str, dict]] = {}
+    kinds = sorted({page.spec.page_kind for page in pages})
+    for backend in backends:
+        results[backend] = {}
+        for kind in kinds:
+            kind_pages = [page for page in pages if page.spec.page_kind == kind]
+            records = sum(len(page.parse(backend)) for page in kind_pages)  # Échauffement
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for page in kind_pages:
+                    page.parse(backend)
+            elapsed = time.perf_counter() - start
+
+            peaks = []
+            tracemalloc.start()
+            for page in kind_pages:
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                page.parse(backend)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            tracemalloc.stop()
+
+            results[backend][kind] = {
+                "pages": len(kind_pages),
+                "pages_per_s": len(kind_pages) * repeat / elapsed,
+                "records_per_s": records * repeat / elapsed,
+                "peak_kib_per_page": sum(peaks) / len(peaks) / 1024,
+            }
+    return results
+
+
+def compare_baseline(results: Dict[str, Dict[str, dict]], baseline: dict, tolerance: float) -> List[str]:
+    """Parsers plus lents que la référence enregistrée au-delà de la tolérance (ex. 0.25 = -25 %)."""
+    regressions = []
+    for backend, kinds in results.items():
+        for kind, result in kinds.items():
+            reference = baseline.get(backend, {}).get(kind)
+            if reference and result["pages_per_s"] < reference * (1 - tolerance):
+                regressions.append(
+                    f"{backend}/{kind} : {result['pages_per_s']:.0f} pages/s (référence {reference:.0f})"
+                )
+    return regressions
+
+
+def print_bench(results: Dict[str, Dict[str, dict]]):
+    print(f"{'parser':<10} {'backend':<7} {'pages':>5} {'pages/s':>9} {'annonces/s':>11} {'pic Kio/page':>13}")
+    for backend, kinds in results.items():
+        for kind, result in kinds.items():
+            print(f"{kind:<10} {backend:<7} {result['pages']:>5} {result['pages_per_s']:>9.1f} "
+                  f"{result['records_per_s']:>11.0f} {result['peak_kib_per_page']:>13.0f}")
+
+
+def record_page(name: str, city: Optional[str], page: int = 1) -> str:
+    """Télécharge une page live (limiteur et client du moteur) et l'ajoute au corpus."""
+    import asyncio
+    from datetime import datetime
+
+    from scraping.engine import CrawlContext, create_client, fetch_page
+    from scraping.rate_limit import DomainRateLimiter
+
+    spec = get_spec(name)
+    city = city if spec.cities else None
+    if spec.cities and city is None:
+        city = spec.cities[0]
+
+    async def _fetch():
+        async with create_client() as client:
+            ctx = CrawlContext(client=client, limiter=DomainRateLimiter(), date_scraped=datetime.now().isoformat())
+            return await fetch_page(ctx, spec, spec.url_for(city, page))
+
+    html = asyncio.run(_fetch())
+    if html is None:
+        raise RuntimeError(f"Page introuvable : {spec.url_for(city, page)}")
+
+    path = fixture_path(spec, city, page)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return path
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Non-régression et benchmark des parsers sur le corpus HTML enregistré.")
+    parser.add_argument("categories", nargs="*", help="Catégories à vérifier (défaut : toutes)")
+    parser.add_argument("--backend", action="append", choices=PARSER_BACKENDS,
+                        help="Backend à vérifier / mesurer (répétable, défaut : tous)")
+    parser.add_argument("--bench", action="store_true", help="Mesure le débit et la mémoire de chaque parser")
+    parser.add_argument("--repeat", type=int, default=20, help="Passes sur le corpus pour le benchmark (défaut : 20)")
+    parser.add_argument("--baseline", help="Échoue si un parser est plus lent que cette référence JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Ralentissement toléré (défaut : 0.25)")
+    parser.add_argument("--save-baseline", help="Enregistre les pages/s mesurées comme référence")
+    parser.add_argument("--update-golden", action="store_true", help="Régénère les golden avec le parser bs4")
+    parser.add_argument("--record", metavar="CATEGORIE", help="Enregistre une page live dans le corpus")
+    parser.add_argument("--city", help="Ville de la page à enregistrer (défaut : première ville)")
+    parser.add_argument("--page", type=int, default=1, help="Numéro de la page à enregistrer")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        path = record_page(args.record, args.city, args.page)
+        print(f"💾 Page enregistrée : {path} (penser à --update-golden après vérification)")
+        return 0
+
+    pages = load_corpus(args.categories)
+    if not pages:
+        print("❌ Aucune page dans le corpus.")
+        return 1
+
+    if args.update_golden:
+        update_golden(pages)
+        return 0
+
+    backends = args.backend or list(PARSER_BACKENDS)
+    failures = check_corpus(pages, backends)
+    for failure in failures:
+        print(f"❌ {failure}")
+    print(f"{'✅' if not failures else '❌'} {len(pages)} pages, {len(backends)} backend(s) : "
+          f"{len(failures)} écart(s) avec les golden")
+
+    if args.bench:
+        results = bench_corpus(pages, backends, args.repeat)
+        print_bench(results)
+        if args.save_baseline:
+            with open(args.save_baseline, "w", encoding="utf-8") as f:
+                json.dump({backend: {kind: round(result["pages_per_s"], 1) for kind, result in kinds.items()}
+                           for backend, kinds in results.items()}, f, indent=4)
+            print(f"💾 Référence enregistrée dans {args.save_baseline}")
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                regressions = compare_baseline(results, json.load(f), args.tolerance)
+            for regression in regressions:
+                print(f"🐢 Régression de performance : {regression}")
+            failures += regressions
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# scraping/specs.py
+"""
+Description déclarative de chaque catégorie scrapée.
+Ajouter une catégorie = ajouter une CategorySpec à CATEGORIES (plus de script copié-collé).
+"""
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from scraping.config import CITIES, MUBAWAB_BASE_URL, AVITO_BASE_URL, SCRAPERAPI_URL
+from scraping.parser_backends import get_page_parser
+
+
+@dataclass(frozen=True)
+class CategorySpec:
+    """
+    Une catégorie d'annonces sur un site donné.
+
+    Les motifs d'URL acceptent les champs {base_url}, {city}, {slug} et {page}.
+    `first_page_url` est utilisé pour la page 1 s'il est défini (Mubawab n'a pas de suffixe :p:1).
+    """
+    name: str
+    site: str
+    base_url: str
+    category_slug: str
+    page_url: str
+    page_kind: str  # Parser de page : "mubawab", "promotion" ou "avito" (voir parser_backends.py)
+    output_filename: str
+    first_page_url: Optional[str] = None
+    property_type: Optional[str] = None
+    # 'location' ou 'vente', ajouté aux annonces par le moteur ; None pour une catégorie
+    # mixte (ex: "immobilier" chez Avito) : le type est alors déduit de chaque annonce
+    transaction_type: Optional[str] = None
+    cities: Tuple[str, ...] = CITIES
+    max_pages: int = 200
+    fetch_via: str = "direct"  # "direct" ou "scraperapi" (rendu JavaScript)
+
+    @property
+    def parse_page(self) -> Callable[[str, "CategorySpec", str], list]:
+        """Parser de page du backend configuré (SCRAPING_PARSER_BACKEND)."""
+        return get_page_parser(self.page_kind)
+
+    @property
+    def domain(self) -> str:
+        """Nom d'hôte sans le préfixe www (ex: mubawab.ma)."""
+        host = urlsplit(self.base_url).hostname or ""
+        return host[4:] if host.startswith("www.") else host
+
+    @property
+    def request_domain(self) -> str:
+        """Domaine réellement contacté (clé du limiteur de débit)."""
+        if self.fetch_via == "scraperapi":
+            return urlsplit(SCRAPERAPI_URL).hostname
+        return self.domain
+
+    def url_for(self, city: Optional[str], page_number: int) -> str:
+        """Construit l'URL d'une page de résultats."""
+        pattern = self.first_page_url if page_number == 1 and self.first_page_url else self.page_url
+        return pattern.format(base_url=self.base_url, city=city, slug=self.category_slug, page=page_number)
+
+    def crawl_cities(self) -> Tuple[Optional[str], ...]:
+        """Villes à parcourir ; (None,) pour les catégories sans découpage par ville."""
+        return self.cities or (None,)
+
+
+def _mubawab(name: str, slug: str, property_type: str, transaction_type: str,
+             output_filename: str) -> CategorySpec:
+    return CategorySpec(
+        name=name,
+        site="mubawab",
+        base_url=MUBAWAB_BASE_URL,
+        category_slug=slug,
+        first_page_url="{base_url}/fr/st/{city}/{slug}",
+        page_url="{base_url}/fr/st/{city}/{slug}:p:{page}",
+        page_kind="mubawab",
+        property_type=property_type,
+        transaction_type=transaction_type,
+        output_filename=output_filename,
+    )
+
+
+def _avito(name: str, slug: str, transaction_type: Optional[str], output_filename: str) -> CategorySpec:
+    return CategorySpec(
+        name=name,
+        site="avito",
+        base_url=AVITO_BASE_URL,
+        category_slug=slug,
+        page_url="{base_url}/fr/{city}/{slug}?o={page}",
+        page_kind="avito",
+        transaction_type=transaction_type,
+        output_filename=output_filename,
+        max_pages=99,
+    )
+
+
+CATEGORIES = (
+    # "immobilier" mélange ventes et locations : type déduit du titre et du prix de chaque annonce
+    _avito("appartement_a_louer_avito", "immobilier", None, "appartement_a_louer_avito.jsonl"),
+    _avito("locaux_de_commerce_a_louer_avito", "locaux-a-louer", "location",
+           "locaux_de_commerce_a_louer_avito.jsonl"),
+    _mubawab("appartement_a_louer_mubawab", "appartements-a-louer", "Appartement", "location",
+             "appartement_a_louer_muwabab.jsonl"),
+    _mubawab("appartement_a_vendre_muwabab", "appartements-a-vendre", "Appartement", "vente",
+             "mubawab_appartements_a_vendre.jsonl"),
+    _mubawab("appartements_vacational_muwabab", "appartements-vacational", "Location de vacances", "location",
+             "mubawab_appartements_vacational.jsonl"),
+    _mubawab("bureaux_et_commerces_a_louer_muwabab", "bureaux-et-commerces-a-louer", "Bureau", "location",
+             "mubawab_bureaux_et_commerces_a_louer.jsonl"),
+    _mubawab("bureaux_et_commerces_a_vendre_muwabab", "bureaux-et-commerces-a-vendre", "Bureau/Commerce", "vente",
+             "mubawab_bureaux_a_vendre.jsonl"),
+    _mubawab("bureaux_muwabab", "locaux-a-louer", "Bureau", "location",
+             "mubawab_bureaux_a_louer.jsonl"),
+    _mubawab("locaux_a_vendre_muwabab", "locaux-a-vendre", "Local commercial", "vente",
+             "mubawab_locaux_a_vendre.jsonl"),
+    _mubawab("locaux_de_commerce_a_louer_muwabab", "locaux-a-louer", "Local commercial", "location",
+             "mubawab_locaux_a_louer.jsonl"),
+    _mubawab("maison_a_vendre_muwabab", "maisons-a-vendre", "Maison", "vente",
+             "mubawab_maisons_a_vendre.jsonl"),
+    _mubawab("riads_a_vendre_muwabab", "riads-a-vendre", "Riad", "vente",
+             "mubawab_riads_a_vendre.jsonl"),
+    _mubawab("terrains_a_vendre_muwabab", "terrains-a-vendre", "Terrain", "vente",
+             "mubawab_terrains.jsonl"),
+    _mubawab("villas_a_louer_muwabab", "villas-et-maisons-de-luxe-a-louer", "Villa", "location",
+             "mubawab_villas_a_louer.jsonl"),
+    _mubawab("villas_et_maisons_de_luxe_a_vendre_muwabab", "villas-et-maisons-de-luxe-a-vendre", "Villa", "vente",
+             "mubawab_villas_a_vendre.jsonl"),
+    CategorySpec(
+        name="promotion_immobiliere_muwabab",
+        site="mubawab",
+        base_url=MUBAWAB_BASE_URL,
+        category_slug="listing-promotion",
+        first_page_url="{base_url}/fr/{slug}",
+        page_url="{base_url}/fr/{slug}:p:{page}",
+        page_kind="promotion",
+        transaction_type="vente",
+        output_filename="mubawab_listing_promotion.jsonl",
+        cities=(),
+        max_pages=50,
+        fetch_via="scraperapi",
+    ),
+)
+
+_CATEGORIES_BY_NAME = {spec.name: spec for spec in CATEGORIES}
+
+
+def get_spec(name: str) -> CategorySpec:
+    """Retourne la spec d'une catégorie par son nom (ex: 'terrains_a_vendre_muwabab')."""
+    try:
+        return _CATEGORIES_BY_NAME[name]
+    except KeyError:
+        raise KeyError(f"Catégorie inconnue : {name}") from None